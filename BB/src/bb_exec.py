@@ -0,0 +1,232 @@
+import sys
+import argparse
+from timeit import default_timer as timer
+from pathlib import Path
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parents[2]))  # repository root, where the shared modules live
+from common.runner import run_instances
+from common.heuristic import skyline_packing
+from common.bounds import lower_bound
+from common.plot import render_solution
+from common.instances import load_instance, instance_name
+from common.metrics import log_run
+from common.engines import share_height
+
+
+# BRANCH AND BOUND
+# Exact search without any external solver. The heights are tried from the lower bound of common/bounds.py
+# up to the height of the skyline heuristic, and the first one that admits a layout is optimal. For a given
+# height the layout is built on a skyline, the height reached by each column of the plate (a NumPy array):
+# the lowest leftmost niche of the skyline is either covered by a circuit placed at its left end, in each
+# orientation that fits, or closed by raising it to the lower of its two walls, wasting its area. Every
+# layout can be pushed down and left into one built this way, hence the search is complete. A node is pruned
+# - by the area bound, when the area wasted below the skyline plus the area of the circuits exceeds w * height
+# - by dominance, trying a single circuit of each kind (same dimensions) at each node
+# - when the same skyline was already reached with the same circuits left, and failed
+# The search keeps its own stack of nodes, since its depth (a node per circuit placed or niche closed) would
+# exceed the recursion limit of Python on the large instances.
+# The heights are searched bottom-up, hence the time limit leaves the lower bound proven so far and the
+# best layout found (the one of the heuristic, unless the search succeeded).
+
+TIME_LIMIT = 300    # seconds
+CHECK_EVERY = 1024  # nodes between two checks of the time limit
+SEEN_MAX = 500_000  # failed states remembered by the transposition table
+
+
+class TimeLimit(Exception):
+    pass
+
+
+def read_instance(instance):
+    w, n, dims = load_instance(instance)    # parsed once by the shared loader
+    return w, n, dims[:, 0].astype(np.int64), dims[:, 1].astype(np.int64)
+
+
+def write_solution(instance, w, h, n, x, y, x_coord, y_coord, rotation):
+    out_path = Path("../BB/out/" + "out-" + instance_name(instance) + f"{'_rotation' if rotation else ''}.txt")
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(out_path, 'w') as f:
+        f.writelines(f'{w} {h}\n')
+        f.writelines(f'{n}\n')
+        for i in range(n):
+            f.writelines(f'{x[i]} {y[i]} {x_coord[i]} {y_coord[i]}\n')
+
+
+def plot_solution(instance, w, h, n, x, y, x_coord, y_coord, rotation):
+    image_path = Path("../BB/out_plots/" + "out-" + instance_name(instance) + f"{'_rotation' if rotation else ''}.png")
+    render_solution(w, h, n, x, y, x_coord, y_coord, image_path)
+
+
+# search of a layout of height at most h
+#
+# kinds:    distinct (width, height) of the circuits, with the indexes of the circuits of each kind
+# returns the position and the dimensions of each circuit, or None when there is no layout
+def pack(w, h, n, kinds, rotation, deadline, counters):
+    skyline = np.zeros(w, dtype=np.int32)
+    left = [len(members) for _, members in kinds]   # circuits of each kind not placed yet
+    free = w * h - sum(kw * kl * len(members) for (kw, kl), members in kinds)  # area that can be wasted
+    # orientations of each kind, the taller first
+    orientations = [sorted({(kw, kl), (kl, kw)} if rotation else {(kw, kl)}, key=lambda o: -o[1]) for (kw, kl), _ in kinds]
+    narrowest = [min(o[0] for o in options) for options in orientations]
+    placed = []     # (kind, x, y, width, height) of the circuits placed so far
+    seen = set()
+
+    # branches of a node, each one a move (kind, x, width, raise, waste): a circuit of the kind placed at the left end
+    # of the lowest leftmost niche, in each orientation that fits, then the niche closed (kind None). The branches
+    # are generated lazily, once the previous one has been undone, hence on the skyline of the node.
+    def branches(waste):
+        # lowest leftmost niche: the run of columns at the lowest height
+        start = int(skyline.argmin())
+        base = int(skyline[start])
+        higher = skyline[start:] != base
+        width = int(higher.argmax()) if higher.any() else w - start
+
+        for k, options in enumerate(orientations):
+            if left[k] == 0 or narrowest[k] > width:
+                continue
+            for cw, cl in options:
+                if cw <= width and base + cl <= h:
+                    yield k, start, cw, cl, waste
+
+        # close the niche, raising it to the lower of its walls: its area is wasted
+        walls = ([int(skyline[start - 1])] if start > 0 else []) + ([int(skyline[start + width])] if start + width < w else [])
+        if walls:
+            raised = min(walls) - base
+            if waste + width * raised <= free:
+                yield None, start, width, raised, waste + width * raised
+
+    def apply(move, sign):
+        k, start, width, raised, _ = move
+        skyline[start:start + width] += sign * raised
+        if k is not None:
+            left[k] -= sign
+            if sign > 0:
+                placed.append((k, start, int(skyline[start]) - raised, width, raised))
+            else:
+                placed.pop()
+
+    if free < 0:
+        return None
+    stack = [((skyline.tobytes(), tuple(left)), branches(0))]   # (state, branches left) of the nodes of the path
+    moves = []      # move leading to each node of the path but the root
+    found = n == 0
+    while stack and not found:
+        state, node_branches = stack[-1]
+        move = next(node_branches, None)
+        if move is None:
+            # every branch of the node failed
+            stack.pop()
+            if len(seen) < SEEN_MAX:
+                seen.add(state)
+            if moves:
+                apply(moves.pop(), -1)
+            continue
+
+        counters['nodes'] += 1
+        if counters['nodes'] % CHECK_EVERY == 0 and timer() > deadline:
+            raise TimeLimit
+        apply(move, 1)
+        if len(placed) == n:
+            found = True
+            continue
+        child = (skyline.tobytes(), tuple(left))
+        if child in seen:
+            apply(move, -1)
+            continue
+        moves.append(move)
+        stack.append((child, branches(move[4])))
+
+    if not found:
+        return None
+
+    # circuits of the same kind take the positions of their kind in any order
+    x_coord, y_coord, widths, lengths = [0] * n, [0] * n, [0] * n, [0] * n
+    members = [list(m) for _, m in kinds]
+    for k, px, py, cw, cl in placed:
+        i = members[k].pop()
+        x_coord[i], y_coord[i], widths[i], lengths[i] = px, py, cw, cl
+    return x_coord, y_coord, widths, lengths
+
+
+# the search is sequential (threads is ignored), and bottom-up: it stops at the best height found by the other
+# engines of the portfolio (shared_h), which its lower bound then proves optimal, and publishes its own there
+def bb_solve(instance, rotation, plot, h_ub=None, shared_h=None, threads=1, time_limit=TIME_LIMIT):
+    w, n, x, y = read_instance(instance)
+    start_time = timer()
+    deadline = start_time + time_limit
+
+    lower = lower_bound(w, x, y, rotation)
+    # the layout of the skyline heuristic is the first incumbent, and its height the upper end of the search
+    h, x_coord, y_coord, widths, lengths = skyline_packing(w, x, y, rotation)
+    h, x_coord, y_coord, widths, lengths = int(h), list(x_coord), list(y_coord), list(widths), list(lengths)
+    trace = [(timer() - start_time, h)]
+    top = h if h_ub is None else min(h, h_ub + 1)   # with h_ub, only the heights up to h_ub are searched
+
+    kinds = {}
+    for i in range(n):
+        kinds.setdefault((int(x[i]), int(y[i])) if not rotation else tuple(sorted((int(x[i]), int(y[i])), reverse=True)), []).append(i)
+    # the largest kinds first, the hardest to place
+    kinds = sorted(kinds.items(), key=lambda kind: (-kind[0][0] * kind[0][1], -kind[0][1]))
+
+    counters = {'nodes': 0}
+    build_time = timer() - start_time
+    optimal = h <= lower
+    try:
+        for height in range(lower, top):
+            if shared_h is not None and height >= shared_h.value:
+                break   # another engine has a layout of this height
+            layout = pack(w, height, n, kinds, rotation, deadline, counters)
+            if layout is not None:
+                x_coord, y_coord, widths, lengths = layout
+                h = height
+                share_height(shared_h, h)
+                trace.append((timer() - start_time, h))
+                optimal = True
+                break
+            lower = height + 1   # no layout of this height
+        else:
+            optimal = h <= lower
+    except TimeLimit:
+        pass
+    end_time = timer() - start_time
+
+    print(f'Instance: {instance}\tExecution time: {(end_time):.03f}s\tBest objective value: {h}{"" if optimal else " (not optimal)"}\tLower bound: {lower}\tNodes: {counters["nodes"]}')
+    write_solution(instance, w, h, n, widths, lengths, x_coord, y_coord, rotation)
+    if plot:
+        plot_solution(instance, w, h, n, widths, lengths, x_coord, y_coord, rotation)
+
+    lower = h if optimal else lower
+    log_run('../BB/out/metrics.jsonl', 'bb', instance, {'rotation': rotation}, h, lower, optimal,
+            build_time=build_time, solve_time=end_time - build_time, nodes=counters['nodes'], trace=trace)
+
+    return {'instance': instance, 'h': h, 'time': end_time, 'optimal': optimal, 'lower': lower,
+            'first_time': trace[0][0], 'trace': trace}
+
+
+def bb_exec(first_i, last_i, rotation, plot, time_limit=TIME_LIMIT, jobs=1, cores=None):
+    instances = range(first_i, last_i+1)
+
+    if jobs == 1:
+        for i in instances:
+            bb_solve(i, rotation, plot, time_limit=time_limit)
+    else:
+        # solve the instances in parallel, killing the workers that go beyond the time limit
+        kwargs = {'rotation': rotation, 'plot': plot, 'time_limit': time_limit}
+        for i, result, error in run_instances(bb_solve, instances, kwargs, jobs=jobs, cores=cores, timeout=time_limit + 30):
+            if error is not None:
+                print(f'Instance: {i}\t{error}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-f', '--first', help='Number of first instance', type=int, default=1)
+    parser.add_argument('-l', '--last', help='Number of last instance', type=int, default=40)
+    parser.add_argument('-r', '--rotation', help='Allow rotation', action='store_true')
+    parser.add_argument('-p', '--plot', help='Plot solution', action='store_true')
+    parser.add_argument('-t', '--time_limit', help='Time limit of each instance, in seconds', type=float, default=TIME_LIMIT)
+    parser.add_argument('-j', '--jobs', help='Number of instances solved in parallel', type=int, default=1)
+    parser.add_argument('-c', '--cores', help='Number of cores shared by the parallel jobs', type=int, default=None)
+    args = parser.parse_args()
+
+    bb_exec(first_i=args.first, last_i=args.last, rotation=args.rotation, plot=args.plot, time_limit=args.time_limit, jobs=args.jobs, cores=args.cores)
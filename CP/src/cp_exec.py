@@ -1,42 +1,42 @@
+import sys
+import asyncio
 import argparse
-import numpy as np
-import matplotlib.pyplot as plt
-from random import randint
+import functools
 from timeit import default_timer as timer
 from pathlib import Path
-from matplotlib import colors
 from datetime import timedelta
-from minizinc import Solver, Instance, Model
+from minizinc import Solver, Instance, Model, Status
+
+sys.path.append(str(Path(__file__).resolve().parents[2]))  # repository root, where the shared modules live
+from common.runner import run_instances
+from common.heuristic import skyline_packing
+from common.bounds import lower_bound
+from common.preprocess import preprocess, group_pairs
+from common.plot import render_solution
+from common.instances import load_instance, instance_name
+from common.metrics import log_run
+from common.engines import share_height
+from flat_cache import flatten, solve_flat
 
 # suppress warnings
 import warnings
 warnings.filterwarnings("ignore")
 
-def read_instance(instance):
-    ins_path = Path('../CP/instances/ins-' + str(instance) + '.txt') # path of the current instance
-    f = open(ins_path, 'r')
-    text = f.readlines()
-
-    w = int(text[0]) # the width of the silicon plate
-    n = int(text[1]) # the number of necessary circuits to place inside the plate
-    x = []           # horizontal dimensions of the circuits
-    y = []           # vertical dimensions of the circuits
+FLAT_CACHE = Path("../CP/flat_cache")  # FlatZinc of the instances already compiled (see flat_cache.py)
 
-    for j in range(2, n+2):     # loop on n circuits, the count starts from the third line of the instance file and ends at the n-th line
-        txt = text[j].split()  # get a two elements array, xj and yj, representing the horizontal and vertical dimensions of the j-th circuit
-        x.append(int(txt[0]))  # put each horizontal dimension into list x
-        y.append(int(txt[1]))  # put each vertical dimension into list y
 
-    f.close()
+def read_instance(instance):
+    w, n, dims = load_instance(instance)    # parsed once by the shared loader
 
-    x = np.array(x, dtype = np.int32)   # convert to numpy array of dtype int32
-    y = np.array(y, dtype = np.int32)
+    x = dims[:, 0].copy()   # horizontal dimensions of the circuits, int32 arrays
+    y = dims[:, 1].copy()   # vertical dimensions of the circuits (copies, since they are swapped for the rotated chips)
 
     return w, n, x, y
 
 
 def write_solution(instance, w, h, n, x, y, x_coord, y_coord, solver, sym_break, rotation):
-    out_path = Path("../CP/out/" + solver + f"{'/w_sym_break/' if sym_break else '/wout_sym_break/'}" + "out-" + str(instance) + f"{'_rotation' if rotation else ''}.txt")
+    out_path = Path("../CP/out/" + solver + f"{'/w_sym_break/' if sym_break else '/wout_sym_break/'}" + "out-" + instance_name(instance) + f"{'_rotation' if rotation else ''}.txt")
+    out_path.parent.mkdir(parents=True, exist_ok=True)
     with open(out_path, 'w') as f:
         f.writelines(f'{w} {h}\n')
         f.writelines(f'{n}\n')
@@ -45,83 +45,172 @@ def write_solution(instance, w, h, n, x, y, x_coord, y_coord, solver, sym_break,
 
 
 def plot_solution(instance, w, h, n, x, y, x_coord, y_coord, solver, sym_break, rotation):       # path of the output file, board weight, board height, total number of circuits to place
-    board = np.empty((h, w))        # h stands for the height of the board and, as a numpy array, it stands for the number of rows
-                                    # w stands for the width of the board and, as a numpy array, it stands for the number of columns
-    board.fill(n)
-
-    for i in range(n):
-        column = x_coord[i]  # position of the circuit on x-axis
-        row = y_coord[i]     # position of the circuit on y-axis
-
-        # compute the width and height of the current circuit
-        width = x[i]
-        height = y[i]
-        
-        for rows in range(row, row + height):
-            for columns in range(column, column + width):
-                board[rows][columns] = i
-
-    cmap = build_cmap(n)
-    plt.imshow(board, interpolation='None', cmap=cmap, vmin=0, vmax=n)
-    ax = plt.gca()
-    ax.invert_yaxis()
-    image_path = Path("../CP/out_plots/" + solver + f"{'/w_sym_break/' if sym_break else '/wout_sym_break/'}" + "out-" + str(instance) + f"{'_rotation' if rotation else ''}.png")
-    plt.savefig(image_path)
-    # plt.show()
-
-
-def build_cmap(n):
-    colors_list = []
-
-    for i in range(n):
-        colors_list.append('#%06X' % randint(0, 0xFFFFF0))
-
-    colors_list.append('#FFFFFF')
-
-    return colors.ListedColormap(colors_list)
-
-
-def cp_exec(first_i, last_i, solver, sym_break, rotation, plot):
-    for i in range(first_i, last_i+1):
-        w, n, x, y = read_instance(i)
-
-        model_path = Path(f"../CP/src/cp{'_rotation' if rotation else ''}{'_w_sym_break' if sym_break else ''}.mzn")
-        model = Model(model_path)
-        solv = Solver.lookup(solver)
-
-        inst = Instance(solv, model)
-        inst['w'] = w
-        inst['n'] = n
-        inst['chip_width'] = x
-        inst['chip_height'] = y
-
-        start_time = timer()     # start timer
-        if solver == 'chuffed':
-            output = inst.solve(timeout=timedelta(seconds=301), free_search=True)   # timeout: Optional[timedelta] = None   **from documentation**
-                                                                                    # datetime.timedelta(days=0, seconds=0, microseconds=0, milliseconds=0, minutes=0, hours=0, weeks=0) Returns : Date
-        else:
-            output = inst.solve(timeout=timedelta(seconds=301))                                                                         
-        end_time = timer() - start_time     # save the execution time
-
-        if output.solution is None:
-            print(f'Instance: {i}\tNo solution found\tExecution time: {(end_time):.03f}s')
-        elif end_time > 300:
-            print(f'Instance: {i}\tTime exceeded\tExecution time: {(end_time):.03f}s')
-        else:
-            x_coord = output.solution.x_coordinates
-            y_coord = output.solution.y_coordinates
-            h = output.solution.h
-            if rotation:
-                rotations = output.solution.rotation_c
-                for j in range(0, n):
-                    if rotations[j]:    # if rotation is enabled for a chip, then swap width and height
-                        temp = x[j]
-                        x[j] = y[j]
-                        y[j] = temp
-            print(f'Instance: {i}\tExecution time: {(end_time):.03f}s\tBest objective value: {h}')
-            write_solution(i, w, h, n, x, y, x_coord, y_coord, solver, sym_break, rotation)
+    image_path = Path("../CP/out_plots/" + solver + f"{'/w_sym_break/' if sym_break else '/wout_sym_break/'}" + "out-" + instance_name(instance) + f"{'_rotation' if rotation else ''}.png")
+    render_solution(w, h, n, x, y, x_coord, y_coord, image_path)
+
+
+# reductions of the instance (common/preprocess.py) as MiniZinc constraints, with 1-based indexes
+def reduction_constraints(pre, rotation, sym_break):
+    def length(i):
+        return f'(if rotation_c[{i+1}] then chip_width[{i+1}] else chip_height[{i+1}] endif)' if rotation else f'chip_height[{i+1}]'
+
+    constraints = [f'constraint x_coordinates[{i+1}] <= {pre["x_max"][i]} /\\ y_coordinates[{i+1}] <= {pre["y_max"][i]};' for i in range(len(pre['x_max']))]
+    constraints += [f'constraint y_coordinates[{i+1}] + {length(i)} <= y_coordinates[{j+1}] \\/ y_coordinates[{j+1}] + {length(j)} <= y_coordinates[{i+1}];' for i, j in pre['stacked']]
+    if rotation:
+        constraints += [f'constraint rotation_c[{i+1}] = {"true" if rotated else "false"};' for i, rotated in pre['orientation'].items()]
+    if sym_break:
+        constraints += [f'constraint symmetry_breaking_constraint(lex_lesseq([x_coordinates[{i+1}], y_coordinates[{i+1}]], [x_coordinates[{j+1}], y_coordinates[{j+1}]]));' for i, j in group_pairs(pre['groups'])]
+        constraints += [f'constraint symmetry_breaking_constraint(x_coordinates[{i+1}] = 0);' for i in pre['full_width']]
+    return ''.join(constraint + '\n' for constraint in constraints)
+
+
+# the model and solver handles are created once per process and shared by all the instances: the model keeps
+# the output type found by its first instance, so that the next ones skip the analysis of the model
+@functools.lru_cache(maxsize=None)
+def load_model(model_path):
+    return Model(model_path)
+
+
+@functools.lru_cache(maxsize=None)
+def lookup_solver(solver):
+    return Solver.lookup(solver)
+
+
+# solve the instance collecting the intermediate solutions: each one improves the height, hence the last one
+# is the best layout found even when the time limit is reached. The time and the height of each solution are
+# appended to trace, and the height published to the other engines of the portfolio (shared_h).
+async def solve_anytime(inst, trace, shared_h=None, **kwargs):
+    start_time = timer()
+    solution, status, statistics = None, Status.UNKNOWN, {}
+    async for output in inst.solutions(intermediate_solutions=True, **kwargs):
+        if output.solution is not None:
+            solution = output.solution
+            trace.append((timer() - start_time, solution.h))
+            share_height(shared_h, solution.h)
+        status = output.status
+        statistics.update(output.statistics)
+    return solution, status, statistics
+
+
+def cp_solve(i, solver, sym_break, rotation, plot, warm_start=False, h_ub=None, shared_h=None, threads=1, flat_cache=False):
+    w, n, x, y = read_instance(i)
+
+    # best lower bound of the height (area, tallest circuit, stacked wide circuits, dual feasible functions),
+    # tighter than plate_h_min of the models
+    lower = lower_bound(w, x, y, rotation)
+    result = {'instance': i, 'h': None, 'time': None, 'optimal': False, 'lower': lower}
+
+    if warm_start:
+        # the height of the layout found by the skyline heuristic is an upper bound of the optimal one
+        heuristic_start = timer()
+        h_heuristic, x_heuristic, y_heuristic, w_heuristic, l_heuristic = skyline_packing(w, x, y, rotation)
+        h_ub = h_heuristic if h_ub is None else min(h_ub, h_heuristic)
+
+        # the layout of the heuristic meets the lower bound: it is optimal and the solver is not needed
+        if h_heuristic <= lower:
+            end_time = timer() - heuristic_start
+            trace = [(end_time, h_heuristic)]
+            print(f'Instance: {i}\tExecution time: {(end_time):.03f}s\tBest objective value: {h_heuristic} (heuristic)')
+            write_solution(i, w, h_heuristic, n, w_heuristic, l_heuristic, x_heuristic, y_heuristic, solver, sym_break, rotation)
             if plot:
-                plot_solution(i, w, h, n, x, y, x_coord, y_coord, solver, sym_break, rotation)
+                plot_solution(i, w, h_heuristic, n, w_heuristic, l_heuristic, x_heuristic, y_heuristic, solver, sym_break, rotation)
+            result.update(h=h_heuristic, time=end_time, optimal=True, first_time=end_time, trace=trace)
+            log_run('../CP/out/metrics.jsonl', solver, i, {'sym_break': sym_break, 'rotation': rotation, 'warm_start': warm_start},
+                    h_heuristic, lower, True, build_time=0, solve_time=end_time, trace=trace)
+            return result
+
+    build_start = timer()
+    model_path = Path(f"../CP/src/cp{'_rotation' if rotation else ''}{'_w_sym_break' if sym_break else ''}.mzn")
+    model = load_model(model_path)
+    solv = lookup_solver(solver)
+
+    inst = Instance(solv, model)
+    inst['w'] = w
+    inst['n'] = n
+    inst['chip_width'] = x
+    inst['chip_height'] = y
+
+    inst.add_string(f'constraint h >= {lower};\n')
+    if h_ub is not None:
+        inst.add_string(f'constraint h <= {h_ub};\n')
+    inst.add_string(reduction_constraints(preprocess(w, x, y, rotation, h_ub), rotation, sym_break))
+
+    # use more than one process only if the solver supports parallel search
+    processes = threads if threads > 1 and '-p' in solv.stdFlags else None
+    build_time = timer() - build_start
+
+    start_time = timer()     # start timer
+    trace = []
+    if flat_cache:
+        # FlatZinc compiled once per model, instance and solver, then searched directly within the rest of the time limit
+        fzn, ozn, flat_time, cached = flatten(inst, solv, FLAT_CACHE)
+        if flat_time >= 300:
+            # flattening used up the time limit: the solver is not started
+            solution, status, stats = None, Status.UNKNOWN, {}
+        else:
+            solution, status, stats = solve_flat(fzn, ozn, solv, trace, time_limit=timedelta(seconds=max(300 - flat_time, 1)), processes=processes,
+                                                 free_search=(solver == 'chuffed'), start_time=start_time, shared_h=shared_h)
+        stats.update(flatTime=flat_time, flatCached=cached)
+    else:
+        solution, status, stats = asyncio.run(solve_anytime(inst, trace, shared_h, time_limit=timedelta(seconds=300), processes=processes,
+                                                            free_search=(solver == 'chuffed')))
+        # flattening is part of the solve: MiniZinc reports its time in the statistics
+        flat_time = stats.get('flatTime')
+        flat_time = flat_time.total_seconds() if isinstance(flat_time, timedelta) else (flat_time or 0)
+    end_time = timer() - start_time     # save the execution time
+
+    result.update(time=end_time, flat_time=flat_time)
+
+    if solution is None and warm_start:
+        # nothing found below the height of the heuristic: its layout is the best one in hand
+        print(f'Instance: {i}\tExecution time: {(end_time):.03f}s (flattening {flat_time:.03f}s)\tBest objective value: {h_heuristic} (heuristic, not optimal)\tLower bound: {lower}')
+        write_solution(i, w, h_heuristic, n, w_heuristic, l_heuristic, x_heuristic, y_heuristic, solver, sym_break, rotation)
+        if plot:
+            plot_solution(i, w, h_heuristic, n, w_heuristic, l_heuristic, x_heuristic, y_heuristic, solver, sym_break, rotation)
+        trace.append((0, h_heuristic))
+        result.update(h=h_heuristic, first_time=0, trace=trace)
+    elif solution is None:
+        print(f'Instance: {i}\t{"Time exceeded" if end_time >= 300 else "No solution found"}\tExecution time: {(end_time):.03f}s (flattening {flat_time:.03f}s)\tLower bound: {lower}')
+    else:
+        x_coord = solution.x_coordinates
+        y_coord = solution.y_coordinates
+        h = solution.h
+        optimal = status == Status.OPTIMAL_SOLUTION
+        if rotation:
+            rotations = solution.rotation_c
+            for j in range(0, n):
+                if rotations[j]:    # if rotation is enabled for a chip, then swap width and height
+                    temp = x[j]
+                    x[j] = y[j]
+                    y[j] = temp
+        print(f'Instance: {i}\tExecution time: {(end_time):.03f}s (flattening {flat_time:.03f}s)\tBest objective value: {h}{"" if optimal else " (not optimal)"}\tLower bound: {lower}')
+        write_solution(i, w, h, n, x, y, x_coord, y_coord, solver, sym_break, rotation)
+        if plot:
+            plot_solution(i, w, h, n, x, y, x_coord, y_coord, solver, sym_break, rotation)
+        if optimal:
+            result.update(optimal=True, lower=h)
+        result.update(h=h, first_time=trace[0][0], trace=trace)
+
+    log_run('../CP/out/metrics.jsonl', solver, i, {'sym_break': sym_break, 'rotation': rotation, 'warm_start': warm_start, 'flat_cache': flat_cache},
+            result['h'], result['lower'], result['optimal'],
+            build_time=build_time + flat_time, solve_time=end_time - flat_time,
+            nodes=stats.get('nodes'), failures=stats.get('failures'), stats=stats, trace=trace)
+
+    return result
+
+
+def cp_exec(first_i, last_i, solver, sym_break, rotation, plot, warm_start=False, jobs=1, cores=None, flat_cache=False):
+    instances = range(first_i, last_i+1)
+
+    if jobs == 1:
+        for i in instances:
+            cp_solve(i, solver, sym_break, rotation, plot, warm_start, flat_cache=flat_cache)
+    else:
+        # solve the instances in parallel, killing the workers that go beyond the time limit
+        kwargs = {'solver': solver, 'sym_break': sym_break, 'rotation': rotation, 'plot': plot, 'warm_start': warm_start, 'flat_cache': flat_cache}
+        for i, result, error in run_instances(cp_solve, instances, kwargs, jobs=jobs, cores=cores, timeout=330):
+            if error is not None:
+                print(f'Instance: {i}\t{error}')
 
 
 if __name__ == '__main__':
@@ -132,6 +221,10 @@ if __name__ == '__main__':
     parser.add_argument('-sb', '--sym_break', help='Allow symmetry breaking constraints', action='store_true')
     parser.add_argument('-r', '--rotation', help='Allow rotation', action='store_true')
     parser.add_argument('-p', '--plot', help='Plot solution', action='store_true')
+    parser.add_argument('-ws', '--warm_start', help='Bound the height with the layout of the skyline heuristic', action='store_true')
+    parser.add_argument('-j', '--jobs', help='Number of instances solved in parallel', type=int, default=1)
+    parser.add_argument('-c', '--cores', help='Number of cores shared by the parallel jobs', type=int, default=None)
+    parser.add_argument('-fc', '--flat_cache', help='Reuse the FlatZinc compiled by the previous runs', action='store_true')
     args = parser.parse_args()
 
-    cp_exec(first_i=args.first, last_i=args.last, solver=args.solver, sym_break=args.sym_break, rotation=args.rotation, plot=args.plot)
\ No newline at end of file
+    cp_exec(first_i=args.first, last_i=args.last, solver=args.solver, sym_break=args.sym_break, rotation=args.rotation, plot=args.plot, warm_start=args.warm_start, jobs=args.jobs, cores=args.cores, flat_cache=args.flat_cache)
\ No newline at end of file
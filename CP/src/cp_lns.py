@@ -0,0 +1,173 @@
+import sys
+import random
+import argparse
+from timeit import default_timer as timer
+from pathlib import Path
+from datetime import timedelta
+from minizinc import Instance, Status
+
+sys.path.append(str(Path(__file__).resolve().parents[2]))  # repository root, where the shared modules live
+from common.runner import run_instances
+from common.heuristic import skyline_packing
+from common.bounds import lower_bound
+from common.preprocess import preprocess
+from common.plot import render_solution
+from common.instances import instance_name
+from common.metrics import log_run
+from cp_exec import read_instance, reduction_constraints, load_model, lookup_solver
+
+# suppress warnings
+import warnings
+warnings.filterwarnings("ignore")
+
+
+# LARGE NEIGHBOURHOOD SEARCH
+# The complete search of cp.mzn does not scale to hundreds of circuits. Starting from the layout of the
+# skyline heuristic, at each iteration a neighbourhood of circuits is relaxed while the other ones keep
+# their place, and the relaxed part is solved again by the same model within a short time slice. The
+# new layout replaces the incumbent when it is not higher: layouts of the same height are accepted too,
+# since lowering the top usually takes several moves. The neighbourhoods are
+# - band:   the circuits closest to a random horizontal line of the plate
+# - random: circuits drawn at random
+# - top:    the circuits closest to the top edge, the ones that set the height
+# - mixed:  one of the above drawn at random at each iteration
+
+NEIGHBOURHOODS = ['band', 'random', 'top', 'mixed']
+
+
+def write_solution(instance, w, h, n, x, y, x_coord, y_coord, solver, rotation):
+    out_path = Path("../CP/out/lns/" + solver + "/out-" + instance_name(instance) + f"{'_rotation' if rotation else ''}.txt")
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(out_path, 'w') as f:
+        f.writelines(f'{w} {h}\n')
+        f.writelines(f'{n}\n')
+        for i in range(n):
+            f.writelines(f'{x[i]} {y[i]} {x_coord[i]} {y_coord[i]}\n')
+
+
+def plot_solution(instance, w, h, n, x, y, x_coord, y_coord, solver, rotation):
+    image_path = Path("../CP/out_plots/lns/" + solver + "/out-" + instance_name(instance) + f"{'_rotation' if rotation else ''}.png")
+    render_solution(w, h, n, x, y, x_coord, y_coord, image_path)
+
+
+# indexes of the circuits relaxed by the neighbourhood
+def neighbourhood(kind, size, y_coord, lengths, h, rng):
+    n = len(y_coord)
+    if kind == 'random':
+        return set(rng.sample(range(n), size))
+    # vertical distance of each circuit from a random line (band) or from the top edge of the plate (top)
+    line = h if kind == 'top' else rng.randrange(h)
+    distance = [max(y_coord[i] - line, line - (y_coord[i] + lengths[i]), 0) for i in range(n)]
+    return set(sorted(range(n), key=lambda i: (distance[i], rng.random()))[:size])
+
+
+# the circuits outside the neighbourhood keep their position and orientation, with 1-based indexes
+def fix_constraints(relaxed, x_coord, y_coord, rotated, rotation):
+    fixed = [i for i in range(len(x_coord)) if i not in relaxed]
+    constraints = [f'constraint x_coordinates[{i+1}] = {x_coord[i]} /\\ y_coordinates[{i+1}] = {y_coord[i]};' for i in fixed]
+    if rotation:
+        constraints += [f'constraint rotation_c[{i+1}] = {"true" if rotated[i] else "false"};' for i in fixed]
+    return ''.join(constraint + '\n' for constraint in constraints)
+
+
+# size:         number of circuits relaxed at each iteration
+# kind:         neighbourhood relaxed at each iteration
+# slice_time:   time limit of each iteration, in seconds
+# time_limit:   time limit of the whole search, in seconds
+def lns_solve(i, solver, rotation, plot, size=20, kind='mixed', slice_time=5, time_limit=300, seed=0, threads=1):
+    w, n, x, y = read_instance(i)
+    rng = random.Random(seed)
+    size = min(size, n)
+
+    start_time = timer()
+    lower = lower_bound(w, x, y, rotation)
+
+    # the layout of the skyline heuristic is the first incumbent
+    h, x_coord, y_coord, widths, lengths = skyline_packing(w, x, y, rotation)
+    rotated = [bool(widths[j] != x[j]) for j in range(n)]
+    trace = [(timer() - start_time, h)]
+
+    build_start = timer()
+    model_path = Path(f"../CP/src/cp{'_rotation' if rotation else ''}.mzn")
+    solv = lookup_solver(solver)
+    inst = Instance(solv, load_model(model_path))
+    inst['w'] = w
+    inst['n'] = n
+    inst['chip_width'] = x
+    inst['chip_height'] = y
+    inst.add_string(f'constraint h >= {lower};\n')
+    inst.add_string(reduction_constraints(preprocess(w, x, y, rotation, h), rotation, False))
+    build_time = timer() - build_start
+
+    # use more than one process only if the solver supports parallel search
+    processes = threads if threads > 1 and '-p' in solv.stdFlags else None
+
+    iterations, optimal = 0, h <= lower
+    while not optimal and timer() - start_time < time_limit:
+        relaxed = neighbourhood(rng.choice(NEIGHBOURHOODS[:-1]) if kind == 'mixed' else kind, size, y_coord, lengths, h, rng)
+        with inst.branch() as child:
+            child.add_string(f'constraint h <= {h};\n')
+            child.add_string(fix_constraints(relaxed, x_coord, y_coord, rotated, rotation))
+            remaining = time_limit - (timer() - start_time)
+            output = child.solve(time_limit=timedelta(seconds=min(slice_time, remaining)), processes=processes,
+                                 free_search=(solver == 'chuffed'))
+        iterations += 1
+
+        if output.solution is not None:
+            solution = output.solution
+            x_coord, y_coord = list(solution.x_coordinates), list(solution.y_coordinates)
+            rotated = list(solution.rotation_c) if rotation else [False] * n
+            widths = [y[j] if rotated[j] else x[j] for j in range(n)]
+            lengths = [x[j] if rotated[j] else y[j] for j in range(n)]
+            if solution.h < h:
+                h = solution.h
+                trace.append((timer() - start_time, h))
+        # optimal when the height meets the lower bound, or when the whole model has been solved to optimality
+        optimal = h <= lower or (len(relaxed) == n and output.status == Status.OPTIMAL_SOLUTION)
+
+    end_time = timer() - start_time
+    print(f'Instance: {i}\tExecution time: {(end_time):.03f}s\tBest objective value: {h}{"" if optimal else " (not optimal)"}\tLower bound: {lower}\tIterations: {iterations}')
+    write_solution(i, w, h, n, widths, lengths, x_coord, y_coord, solver, rotation)
+    if plot:
+        plot_solution(i, w, h, n, widths, lengths, x_coord, y_coord, solver, rotation)
+
+    log_run('../CP/out/metrics.jsonl', solver, i, {'lns': True, 'rotation': rotation, 'neighbourhood': kind, 'size': size, 'slice': slice_time, 'seed': seed},
+            h, h if optimal else lower, optimal, build_time=build_time, solve_time=end_time - build_time,
+            stats={'iterations': iterations, 'improvements': len(trace) - 1}, trace=trace)
+
+    return {'instance': i, 'h': h, 'time': end_time, 'optimal': optimal, 'lower': h if optimal else lower,
+            'first_time': trace[0][0], 'trace': trace}
+
+
+def lns_exec(first_i, last_i, solver, rotation, plot, size=20, kind='mixed', slice_time=5, time_limit=300, seed=0, jobs=1, cores=None):
+    instances = range(first_i, last_i+1)
+    kwargs = {'solver': solver, 'rotation': rotation, 'plot': plot, 'size': size, 'kind': kind, 'slice_time': slice_time, 'time_limit': time_limit, 'seed': seed}
+
+    if jobs == 1:
+        for i in instances:
+            lns_solve(i, **kwargs)
+    else:
+        # solve the instances in parallel, killing the workers that go beyond the time limit
+        for i, result, error in run_instances(lns_solve, instances, kwargs, jobs=jobs, cores=cores, timeout=time_limit + 30):
+            if error is not None:
+                print(f'Instance: {i}\t{error}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-f', '--first', help='Number of first instance', type=int, default=1)
+    parser.add_argument('-l', '--last', help='Number of last instance', type=int, default=40)
+    parser.add_argument('-s', '--solver', help='Name of the solver', type=str, default='chuffed')
+    parser.add_argument('-r', '--rotation', help='Allow rotation', action='store_true')
+    parser.add_argument('-p', '--plot', help='Plot solution', action='store_true')
+    parser.add_argument('-nb', '--neighbourhood', help='Neighbourhood relaxed at each iteration', type=str, default='mixed', choices=NEIGHBOURHOODS)
+    parser.add_argument('-ns', '--size', help='Number of circuits relaxed at each iteration', type=int, default=20)
+    parser.add_argument('-ts', '--slice', help='Time limit of each iteration, in seconds', type=float, default=5)
+    parser.add_argument('-t', '--time_limit', help='Time limit of each instance, in seconds', type=float, default=300)
+    parser.add_argument('-sd', '--seed', help='Seed of the neighbourhoods', type=int, default=0)
+    parser.add_argument('-j', '--jobs', help='Number of instances solved in parallel', type=int, default=1)
+    parser.add_argument('-c', '--cores', help='Number of cores shared by the parallel jobs', type=int, default=None)
+    args = parser.parse_args()
+
+    lns_exec(first_i=args.first, last_i=args.last, solver=args.solver, rotation=args.rotation, plot=args.plot, size=args.size, kind=args.neighbourhood,
+             slice_time=args.slice, time_limit=args.time_limit, seed=args.seed, jobs=args.jobs, cores=args.cores)
@@ -0,0 +1,104 @@
+import re
+import sys
+import json
+import shutil
+import hashlib
+import subprocess
+from types import SimpleNamespace
+from timeit import default_timer as timer
+from pathlib import Path
+import minizinc
+from minizinc import Status
+
+sys.path.append(str(Path(__file__).resolve().parents[2]))  # repository root, where the shared modules live
+from common.engines import share_height
+
+
+# FLATZINC CACHE
+# Flattening diffn and cumulative over wide domains takes a noticeable part of the time limit on the larger
+# instances, and the benchmarks solve the same instances with the same models again and again. The
+# FlatZinc of an instance is stored under the hash of everything it is compiled from: the model, the data
+# and the constraints added to the instance (the files MiniZinc is given) and the solver, whose library of
+# global constraints changes the flattening. A later run with the same key solves the stored FlatZinc
+# directly with the minizinc executable.
+
+
+# hash of the files of the instance and of the solver
+def cache_key(inst, solv):
+    digest = hashlib.sha256(f'{solv.id}@{solv.version}'.encode())
+    with inst.files() as files:
+        for file in files:
+            digest.update(Path(file).read_bytes())
+    return digest.hexdigest()
+
+
+# FlatZinc and output model of the instance, compiled unless already in the cache
+#
+# returns the paths of the two files, the flattening time (zero when found in the cache) and whether it was found
+def flatten(inst, solv, cache_dir):
+    cache_dir = Path(cache_dir)
+    key = cache_key(inst, solv)
+    fzn, ozn = cache_dir / f'{key}.fzn', cache_dir / f'{key}.ozn'
+    if fzn.exists() and ozn.exists():
+        return fzn, ozn, 0, True
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    flat_start = timer()
+    # the output model prints the variables as dzn assignments, parsed by solve_flat
+    with inst.flat(**{'output-mode': 'dzn'}) as (flat_fzn, flat_ozn, statistics):
+        flat_time = timer() - flat_start
+        # written under a temporary name and renamed, so that parallel workers never read a partial file
+        for source, target in [(flat_ozn.name, ozn), (flat_fzn.name, fzn)]:
+            partial = target.with_suffix(target.suffix + '.part')
+            shutil.copyfile(source, partial)
+            partial.replace(target)
+    Path(flat_ozn.name).unlink(missing_ok=True)    # flat() removes only the FlatZinc
+    return fzn, ozn, flat_time, False
+
+
+def parse_value(value):
+    if value.startswith('array'):   # arrays with explicit index sets, array1d(1..n, [...])
+        value = value[value.index('['):-1]
+    return json.loads(value)
+
+
+# solve the FlatZinc with the minizinc executable, collecting the intermediate solutions as solve_anytime in
+# cp_exec.py: each one improves the height, hence the last one is the best layout found. The time (since
+# start_time) and the height of each solution are appended to trace, and the height published to the other
+# engines of the portfolio (shared_h).
+def solve_flat(fzn, ozn, solv, trace, time_limit, processes=None, free_search=False, start_time=None, shared_h=None):
+    cmd = [str(minizinc.default_driver.executable), '--solver', solv.id, '--intermediate-solutions', '--statistics',
+           '--time-limit', str(int(time_limit.total_seconds() * 1000))]
+    if processes is not None:
+        cmd += ['--parallel', str(processes)]
+    if free_search:
+        cmd.append('--free-search')
+    cmd += [str(fzn), str(ozn)]
+
+    start_time = timer() if start_time is None else start_time
+    solution, status, statistics, assignments = None, Status.UNKNOWN, {}, {}
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True) as process:
+        for line in process.stdout:
+            line = line.strip()
+            if line == '----------':   # end of a solution
+                solution = SimpleNamespace(**assignments)
+                trace.append((timer() - start_time, solution.h))
+                share_height(shared_h, solution.h)
+                status, assignments = Status.SATISFIED, {}
+            elif line == '==========':     # the last solution is optimal
+                status = Status.OPTIMAL_SOLUTION
+            elif line == '=====UNSATISFIABLE=====':
+                status = Status.UNSATISFIABLE
+            elif line.startswith('%%%mzn-stat'):
+                match = re.match(r'%%%mzn-stat:? (\w+)=(.*)', line)
+                if match:
+                    name, value = match.groups()
+                    try:
+                        statistics[name] = json.loads(value)
+                    except ValueError:
+                        statistics[name] = value.strip('"')
+            else:
+                match = re.match(r'(\w+) = (.*);', line)
+                if match:
+                    assignments[match.group(1)] = parse_value(match.group(2))
+    return solution, status, statistics
@@ -1,47 +1,41 @@
 import argparse
 import math
 import os
+import sys
 from pathlib import Path
 import heapq
+import threading
+import functools
 import numpy as np
 from timeit import default_timer as timer
 import datetime
 import gurobipy as gp
 from gurobipy import GRB
-from matplotlib import colors
-import matplotlib.pyplot as plt
-from random import randint
+
+sys.path.append(str(Path(__file__).resolve().parents[2]))  # repository root, where the shared modules live
+from common.runner import run_instances
+from common.heuristic import skyline_packing
+from common.bounds import lower_bound
+from common.preprocess import preprocess, group_pairs, canonical_layout
+from common.plot import render_solution
+from common.instances import load_instance, instance_name
+from common.metrics import log_run
+from common.engines import share_height
 
 # READ FROM FILE first_i to file last_i (from the instances folder)
 
 def read_input(index_file): 
-    x = []           # horizontal dimensions of the circuits
-    y = []
-    w = 0
-    n = 0
-    
-    ins_path = Path('../MIP/instances/ins-' + str(index_file) + '.txt') # path of the current instance
-    f = open(ins_path, 'r')
-    text = f.readlines()
-
-    w = int(text[0]) # the width of the silicon plate
-    n = int(text[1]) # the number of necessary circuits to place inside the plate
-                # vertical dimensions of the circuits
-
-    for j in range(2, n+2):     # loop on n circuits, the count starts from the third line of the instance file and ends at the n-th line
-            txt = text[j].split()  # get a two elements array, xj and yj, representing the horizontal and vertical dimensions of the j-th circuit
-            x.append(int(txt[0]))  # put each horizontal dimension into list x
-            y.append(int(txt[1]))  # put each vertical dimension into list x
+    w, n, dims = load_instance(index_file)  # parsed once by the shared loader
 
-    f.close()
-    x = np.array(x, dtype = np.int32)   # convert to numpy array of dtype int32
-    y = np.array(y, dtype = np.int32)
+    x = dims[:, 0].copy()   # horizontal dimensions of the circuits
+    y = dims[:, 1].copy()   # vertical dimensions of the circuits
         
     return w, n, x, y
 
 def write_solution(instance, w, h, n, x, y, x_coord, y_coord, rotation,time):
     path_sol = "../MIP/out/rotation/out-" if rotation else "../MIP/out/no_rotation/out-"
-    out_path = Path(path_sol + str(instance) + f"{'_rotation' if rotation else ''}.txt")
+    out_path = Path(path_sol + instance_name(instance) + f"{'_rotation' if rotation else ''}.txt")
+    out_path.parent.mkdir(parents=True, exist_ok=True)
     with open(out_path, 'w') as f:
         f.writelines(f'{w} {h}\n')
         f.writelines(f'{n}\n')
@@ -51,11 +45,44 @@ def write_solution(instance, w, h, n, x, y, x_coord, y_coord, rotation,time):
         #f.writelines(f"{time}")
     print(f"For instance {instance} the best h value is {h} | execution_time {time}")
         
-def write_log(instance: int, best_h: int , rotation: bool,time):
+def write_log(instance: int, best_h: int , rotation: bool,time, optimal: bool):
     path_sol = "../MIP/out/log_file_rotation" if rotation else "../MIP/out/log_file" 
     out_path = Path(path_sol + ".txt")
     with open(out_path, 'a') as f:
-        f.writelines(f'{instance} {best_h} {time} {"VALID" if time < 301.00 else "NOT VALID"}\n')
+        f.writelines(f'{instance} {best_h} {time} {"VALID" if optimal else "NOT VALID"}\n')   # valid when proven optimal within the time limit
+
+
+# structured record of the run, with the statistics of Gurobi
+def log_metrics(model, index_f, rotation, h_sol, lower, build_time, solve_time):
+    stats = {attr: getattr(model, attr) for attr in ['Status', 'Runtime', 'NodeCount', 'IterCount', 'SolCount', 'NumVars', 'NumConstrs', 'NumBinVars']}
+    if math.isfinite(model.ObjBound):   # infinite when infeasible or stopped before a bound, not valid JSON
+        stats['ObjBound'] = model.ObjBound
+    if model.SolCount > 0:
+        stats['MIPGap'] = model.MIPGap
+    if model._lazy is not None:
+        stats['LazyPairs'] = len(model._lazy['added'])   # pairs separated by the callback
+    log_run('../MIP/out/metrics.jsonl', 'gurobi', index_f, {'rotation': rotation, 'sym_break': model._sym_break, 'symmetry': model.Params.Symmetry, 'lazy': model._lazy is not None, 'matrix': model._matrix},
+            h_sol, lower, model.Status == GRB.OPTIMAL, build_time=build_time, solve_time=solve_time,
+            nodes=model.NodeCount, stats=stats, trace=model._trace)
+
+
+# no layout found within the time limit: the run is logged (and the model exported) with the lower bound proven
+def no_solution(model, index_f, rotation, lower, build_time, solve_time, export):
+    print('\nNo solution found\n')
+    log_metrics(model, index_f, rotation, None, lower, build_time, solve_time)
+    if export:
+        export_model(model, index_f, rotation, export)
+    return {'instance': index_f, 'h': None, 'time': solve_time, 'optimal': False, 'lower': lower}
+
+
+# lower bound proven on the height: no layout up to h_Max when infeasible, h_min when stopped before a bound
+def proven_lower(model, h_min, h_Max):
+    if model.Status == GRB.INFEASIBLE:
+        return h_Max + 1
+    if not math.isfinite(model.ObjBound):
+        return h_min
+    return max(h_min, math.ceil(model.ObjBound - 1e-6))
+
         
 def write_log_init(rotation: bool):
     path_sol = "../MIP/out/log_file_rotation" if rotation else "../MIP/out/log_file" 
@@ -65,42 +92,11 @@ def write_log_init(rotation: bool):
     
         
 def plot_solution(instance, w, h, n, x, y, x_coord, y_coord, rotation):       # path of the output file, board weight, board height, total number of circuits to place
-    board = np.empty((h, w))        # h stands for the height of the board and, as a numpy array, it stands for the number of rows
-                                    # w stands for the width of the board and, as a numpy array, it stands for the number of columns
-    board.fill(n)
-
-    for i in range(n):
-        column = x_coord[i]  # position of the circuit on x-axis
-        row = y_coord[i]     # position of the circuit on y-axis
-
-        # compute the width and height of the current circuit
-        width = x[i]
-        height = y[i]
-        
-        for rows in range(row, row + height):
-            for columns in range(column, column + width):
-                board[rows][columns] = i
-
-    cmap = build_cmap(n)
-    plt.imshow(board, interpolation='None', cmap=cmap, vmin=0, vmax=n)
-    ax = plt.gca()
-    ax.invert_yaxis()
     path_plot = "../MIP/out_plots/rotation/out-" if rotation else "../MIP/out_plots/no_rotation/out-"
-    image_path = Path(path_plot + str(instance) + f"{'_rotation' if rotation else ''}.png")
-    plt.savefig(image_path)
+    image_path = Path(path_plot + instance_name(instance) + f"{'_rotation' if rotation else ''}.png")
+    render_solution(w, h, n, x, y, x_coord, y_coord, image_path)
     
 
-def build_cmap(n):
-    colors_list = []
-
-    for i in range(n):
-        colors_list.append('#%06X' % randint(0, 0xFFFFFF))
-
-    colors_list.append('#FFFFFF')
-
-    return colors.ListedColormap(colors_list)
-
-
 def check_rotation_w(width,height,rotation: bool):
     if rotation:
         return height
@@ -115,9 +111,323 @@ def check_rotation_h(width,height,rotation: bool):
 
 
 
-
-
-def solver(w,n,x,y, rotation: bool, index_f, plot: bool):
+# MIP start from a feasible layout (x_start, y_start) of height h_start, where the circuits have dimensions w_start X l_start
+def set_start(n, x_cord, y_cord, h, s, x_start, y_start, w_start, l_start, h_start):
+    h.Start = h_start
+    for i in range(n):
+        x_cord[i].Start = x_start[i]
+        y_cord[i].Start = y_start[i]
+
+    # s[i,j,k] is 0 only if the k-th relative position between i and j (left, below, right, above) holds
+    for i, j, k in s.keys():
+        holds = [x_start[i] + w_start[i] <= x_start[j], y_start[i] + l_start[i] <= y_start[j],
+                 x_start[j] + w_start[j] <= x_start[i], y_start[j] + l_start[j] <= y_start[i]]
+        s[i,j,k].Start = 0 if holds[k] else 1
+
+
+# reductions of common/preprocess.py that remove symmetric layouts: identical circuits ordered by x
+# (implied by their lexicographic order, which needs no binaries this way) and the circuits that
+# cannot sit beside any other one at x = 0
+def add_symmetry_breaking(model, pre, x_cord):
+    model.addConstrs((x_cord[i] <= x_cord[j] for i, j in group_pairs(pre['groups'])), "sb_identical")
+    for i in pre['full_width']:
+        x_cord[i].ub = 0
+
+
+# relative positions (0: i left of j, 1: i below j, 2: i right of j, 3: i above j) that each pair i < j
+# of circuits, of dimensions w_c X l_c, can take in a plate of width w and height at most h_max: two circuits
+# whose widths sum to more than w can never be side by side, nor stacked if their heights sum to more than h_max
+def pair_relations(n, w, h_max, w_c, l_c):
+    relations = {}
+    for i in range(n):
+        for j in range(i+1,n):
+            relations[i,j] = ([0, 2] if w_c[i] + w_c[j] <= w else []) + ([1, 3] if l_c[i] + l_c[j] <= h_max else [])
+    return relations
+
+
+# relative position k of the circuits i < j (see pair_relations), relaxed by the big M when s[i,j,k] = 1
+def separation(k, i, j, x_cord, y_cord, w_c, l_c, s, w, h_max):
+    if k == 0:
+        return x_cord[i] + w_c[i] <= x_cord[j] + w*s[i,j,0]
+    if k == 1:
+        return y_cord[i] + l_c[i] <= y_cord[j] + h_max*s[i,j,1]
+    if k == 2:
+        return x_cord[j] + w_c[j] <= x_cord[i] + w*s[i,j,2]
+    return y_cord[j] + l_c[j] <= y_cord[i] + h_max*s[i,j,3]
+
+
+# pairs whose non-overlap constraints are added from the start in the lazy mode: the ones that cannot take
+# every relative position (too wide to sit side by side, or too high to be stacked), likely to conflict
+def seeded_pairs(relations):
+    return {(i, j): ks for (i, j), ks in relations.items() if len(ks) < 4}
+
+
+# aggregate constraints of the lazy mode: the circuits wider than half of the plate, and each other circuit with
+# those too wide to sit beside it, are pairwise unable to sit side by side, hence stacked in any layout: the sum
+# of their heights l_c is at most h. They keep in the initial model what the pairs left to the callback imply.
+def add_stacked_heights(model, n, w, w_min, l_c, h):
+    wide = [j for j in range(n) if 2 * w_min[j] > w]
+    cliques = [wide] + [[i] + [j for j in wide if w_min[i] + w_min[j] > w] for i in range(n) if i not in wide]
+    for q, clique in enumerate(c for c in cliques if len(c) > 1):
+        model.addConstr(gp.quicksum(l_c[i] for i in clique) <= h, name=f"stacked_heights[{q}]")
+
+
+# lazy mode: the non-overlap constraints of the pairs that overlap in the candidate incumbent are added, which
+# rejects it. model._lazy holds the variables, the dimensions of the circuits and the pairs left out of the
+# model. Gurobi does not always respect the lazy constraints already added, hence every pair is checked again.
+# Returns whether the candidate has been rejected.
+def add_lazy_separation(model):
+    lazy = model._lazy
+    if len(lazy['pairs']) == 0:
+        return False
+    x_c = np.rint(model.cbGetSolution(lazy['x_cord']))
+    y_c = np.rint(model.cbGetSolution(lazy['y_cord']))
+    w_c, l_c = lazy['x'], lazy['y']
+    if lazy['rotation_c'] is not None:
+        rotated = np.rint(model.cbGetSolution(lazy['rotation_c'])) > 0
+        w_c, l_c = np.where(rotated, lazy['y'], lazy['x']), np.where(rotated, lazy['x'], lazy['y'])
+
+    i, j = lazy['pairs'][:, 0], lazy['pairs'][:, 1]
+    overlap = (x_c[i] < x_c[j] + w_c[j]) & (x_c[j] < x_c[i] + w_c[i]) & (y_c[i] < y_c[j] + l_c[j]) & (y_c[j] < y_c[i] + l_c[i])
+    for i, j in lazy['pairs'][overlap].tolist():
+        ks = lazy['relations'][i,j]
+        for k in ks:
+            model.cbLazy(separation(k, i, j, lazy['x_cord'], lazy['y_cord'], lazy['w_c'], lazy['l_c'], lazy['s'], lazy['w'], lazy['h_max']))
+        model.cbLazy(gp.quicksum(lazy['s'][i,j,k] for k in ks) <= len(ks)-1)
+    lazy['added'].update(map(tuple, lazy['pairs'][overlap].tolist()))
+    return bool(overlap.any())
+
+
+# lazy mode: the pairs left out of the model, the ones separated so far and what the callback needs to separate them
+def lazy_state(n, x, y, relations, pairs, x_cord, y_cord, w_c, l_c, s, w, h_max, rotation_c=None):
+    return {'pairs': np.array([pair for pair in relations if pair not in pairs], dtype=np.int64).reshape(-1, 2), 'added': set(),
+            'relations': relations, 'x': np.asarray(x), 'y': np.asarray(y), 'w_c': w_c, 'l_c': l_c, 's': s, 'w': w, 'h_max': h_max,
+            'x_cord': [x_cord[i] for i in range(n)], 'y_cord': [y_cord[i] for i in range(n)],
+            'rotation_c': None if rotation_c is None else [rotation_c[i] for i in range(n)]}
+
+
+# record the time and the height of each improving solution (model._trace) and, inside the portfolio,
+# publish it to the other engines and stop the search as soon as the bound proves that the best height
+# found by any engine (model._shared_h) cannot be improved
+def mip_callback(model, where):
+    if where == GRB.Callback.MIPSOL:
+        if model._lazy is not None and add_lazy_separation(model):
+            return  # overlapping layout, rejected
+        h = round(model.cbGet(GRB.Callback.MIPSOL_OBJ))
+        if not model._trace or h < model._trace[-1][1]:   # new incumbents may have the same height
+            model._trace.append((model.cbGet(GRB.Callback.RUNTIME), h))
+            share_height(model._shared_h, h)
+    elif where == GRB.Callback.MIP and model._shared_h is not None:
+        bound = model.cbGet(GRB.Callback.MIP_OBJBND)
+        if math.ceil(bound - 1e-6) >= model._shared_h.value:
+            model.terminate()
+
+
+# a single Gurobi environment per process, shared by the models of all the instances: the license is checked
+# out once, when the first model is built (or when a worker of common/service.py warms up)
+@functools.lru_cache(maxsize=None)
+def gurobi_env():
+    return gp.Env()
+
+
+# MODEL EXPORT
+# The model of an instance is written only on request (-e), for debugging: in the LP or MPS format, compressed
+# by Gurobi when the format ends with .gz. The file is written on a background thread while the solution is
+# written and plotted and the next instance is read. A Gurobi environment is not thread-safe, hence the export
+# is waited for before the next model is created (and at exit, since the thread is not a daemon).
+
+EXPORT_FORMATS = ['lp', 'lp.gz', 'mps', 'mps.gz']
+exports = []    # threads of the exports still running
+
+
+def export_model(model, index_f, rotation, fmt):
+    path = Path(f"../MIP/file_mip{'_rotation' if rotation else ''}") / f"out-{instance_name(index_f)}.{fmt}"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    thread = threading.Thread(target=model.write, args=(str(path),))
+    thread.start()
+    exports.append(thread)
+
+
+def wait_exports():
+    while exports:
+        exports.pop().join()
+
+
+# MATRIX BUILD
+# The same models built with the matrix API: the variables are MVars and each family of constraints is added by
+# a single call over NumPy index arrays, instead of building a LinExpr in Python for every pair of circuits.
+# The relative positions of the pairs are the rows (i, j, k) of keys, in the order of pair_relations, and the
+# binaries s are in the same order.
+
+def build_matrix(model, n, w, x, y, h_min, h_Max, pre, lazy, rotation):
+    # relative positions of the pairs i < j (see pair_relations), from index arrays over the pairs
+    pair_i, pair_j = np.triu_indices(n, 1)
+    w_min, l_min = np.asarray(pre['w_min'], dtype=np.int64), np.asarray(pre['l_min'], dtype=np.int64)
+    beside = w_min[pair_i] + w_min[pair_j] <= w
+    stacked = l_min[pair_i] + l_min[pair_j] <= h_Max
+    counts = 2 * beside + 2 * stacked
+    starts = np.cumsum(counts) - counts
+    pair = np.repeat(np.arange(len(counts)), counts)
+    q = np.arange(len(pair)) - starts[pair]     # position of the row among the ones of its pair
+    k = np.where(beside[pair], np.array([0, 2, 1, 3])[q % 4], np.array([1, 3, 1, 3])[q % 4])
+    keys = np.stack([pair_i[pair], pair_j[pair], k], axis=1).astype(np.int64).reshape(-1, 3)
+    # pairs in the model: all of them, or the seeded ones in the lazy mode (see seeded_pairs)
+    chosen = counts < 4 if lazy else np.ones(len(counts), dtype=bool)
+
+    x = np.asarray(x, dtype=np.int64)
+    y = np.asarray(y, dtype=np.int64)
+
+    x_cord = model.addMVar(n, lb=0, ub=pre['x_max'], vtype=GRB.INTEGER, name="x_coordinates")
+    y_cord = model.addMVar(n, lb=0, ub=pre['y_max'], vtype=GRB.INTEGER, name="y_coordinates")
+    h = model.addVar(lb=h_min, ub=h_Max, vtype=GRB.INTEGER, name="height")
+    s = model.addMVar(len(keys), vtype=GRB.BINARY, name="s")
+    rotation_c = None
+    if rotation:
+        fixed = pre['orientation']
+        rotation_c = model.addMVar(n, lb=[1 if fixed.get(i) else 0 for i in range(n)], ub=[0 if fixed.get(i) is False else 1 for i in range(n)],
+                                   vtype=GRB.BINARY, name="rotation_c")
+
+    # width and height of the circuits of indexes idx, linear in the rotation
+    def w_c(idx):
+        return x[idx] + (y - x)[idx] * rotation_c[idx] if rotation else x[idx]
+
+    def l_c(idx):
+        return y[idx] + (x - y)[idx] * rotation_c[idx] if rotation else y[idx]
+
+    every = np.arange(n)
+    model.addConstr(x_cord + w_c(every) <= w, name="inside_plate_x")
+    model.addConstr(y_cord + l_c(every) <= h, name="inside_plate_y")
+
+    # big M constraints of the pairs in the model
+    in_model = chosen[pair]
+    for k in range(4):
+        t = np.flatnonzero(in_model & (keys[:, 2] == k))
+        if len(t) == 0:
+            continue
+        i, j = keys[t, 0], keys[t, 1]
+        if k == 0:
+            model.addConstr(x_cord[i] + w_c(i) <= x_cord[j] + w*s[t], name="no_ov1")
+        elif k == 1:
+            model.addConstr(y_cord[i] + l_c(i) <= y_cord[j] + h_Max*s[t], name="no_ov2")
+        elif k == 2:
+            model.addConstr(x_cord[j] + w_c(j) <= x_cord[i] + w*s[t], name="no_ov3")
+        else:
+            model.addConstr(y_cord[j] + l_c(j) <= y_cord[i] + h_Max*s[t], name="no_ov4")
+
+    # the binaries of a pair are consecutive rows of keys: one of the positions it can take (2 or 4) holds;
+    # a pair that can take none of them makes the model infeasible, as the empty sum <= -1 of the loop build
+    for t in np.flatnonzero(chosen & (counts == 0)).tolist():
+        model.addLConstr(gp.LinExpr(), GRB.LESS_EQUAL, -1, name=f"no_overlap[{pair_i[t]},{pair_j[t]}]")
+    for c in np.unique(counts[chosen & (counts > 0)]).tolist():
+        rows = starts[chosen & (counts == c)][:, None] + np.arange(c)
+        held = s[rows[:, 0]]
+        for q in range(1, c):
+            held = held + s[rows[:, q]]
+        model.addConstr(held <= c-1, name=f"no_overlap_{c}")
+
+    return x_cord, y_cord, h, s, rotation_c, keys
+
+
+# MIP start of the matrix build (see set_start), with the binaries of all the pairs set at once
+def set_start_matrix(x_cord, y_cord, h, s, keys, x_start, y_start, w_start, l_start, h_start):
+    h.Start = h_start
+    x_cord.Start = x_start
+    y_cord.Start = y_start
+
+    x_s, y_s, w_s, l_s = (np.asarray(v) for v in (x_start, y_start, w_start, l_start))
+    i, j, k = keys[:, 0], keys[:, 1], keys[:, 2]
+    holds = np.stack([x_s[i] + w_s[i] <= x_s[j], y_s[i] + l_s[i] <= y_s[j], x_s[j] + w_s[j] <= x_s[i], y_s[j] + l_s[j] <= y_s[i]])
+    s.Start = np.where(holds[k, np.arange(len(keys))], 0, 1)
+
+
+def solver_matrix(w,n,x,y, rotation, index_f, plot, warm_start, h_ub, shared_h, threads, sym_break, lazy, export, start, symmetry, h_min, h_Max, area_min, area_max):
+    build_start = timer()
+    wait_exports()
+    model = gp.Model("MIP_rotation" if rotation else "MIP", env=gurobi_env())
+    model.setParam("TimeLimit", 5*60) # 5 minutes for each instance
+    model.setParam("Symmetry",symmetry) # -1: auto, 0:off , 1: conservative, 2:aggressive
+    if threads is not None:
+        model.setParam("Threads", threads) # keep the solver inside the core budget of the parallel runner
+    if lazy:
+        model.setParam("LazyConstraints", 1) # non-overlap constraints added by the callback
+
+    if warm_start and start is None:
+        start = skyline_packing(w, x, y, rotation)   # the layout of the skyline heuristic is the initial incumbent
+    if start is not None:
+        # the height of the initial incumbent (of the heuristic, or given by the caller) is an upper bound of the optimal one
+        h_start, x_start, y_start, w_start, l_start = start
+        h_ub = h_start if h_ub is None else min(h_ub, h_start)
+    if h_ub is not None:
+        h_Max = min(h_Max, h_ub)
+    pre = preprocess(w, x, y, rotation, h_Max)     # reductions of the instance
+
+    x_cord, y_cord, h, s, rotation_c, keys = build_matrix(model, n, w, x, y, h_min, h_Max, pre, lazy, rotation)
+
+    if start is not None:
+        if sym_break:
+            x_start, y_start, w_start, l_start = canonical_layout(pre, x_start, y_start, w_start, l_start)
+        set_start_matrix(x_cord, y_cord, h, s, keys, x_start, y_start, w_start, l_start, h_start)
+        if rotation:
+            rotation_c.Start = (np.asarray(w_start) != np.asarray(x)).astype(int)
+
+    if sym_break:
+        add_symmetry_breaking(model, pre, x_cord.tolist())
+
+    model.addConstr(w * h <= area_max, name="ub_area")
+    model.addConstr(w * h >= area_min, name="lb_area")
+    model.setObjective(h, GRB.MINIMIZE)
+
+    model._lazy = None
+    if lazy:
+        # the callback separates single pairs, with the variables and the dimensions of each circuit
+        rotated = rotation_c.tolist() if rotation else None
+        w_c = [int(x[i]) + int(y[i] - x[i]) * rotated[i] for i in range(n)] if rotation else x
+        l_c = [int(y[i]) + int(x[i] - y[i]) * rotated[i] for i in range(n)] if rotation else y
+        s_pairs = dict(zip(map(tuple, keys.tolist()), s.tolist()))
+        relations = pair_relations(n, w, h_Max, pre['w_min'], pre['l_min'])
+        pairs = seeded_pairs(relations)
+        model._lazy = lazy_state(n, x, y, relations, pairs, x_cord.tolist(), y_cord.tolist(), w_c, l_c, s_pairs, w, h_Max, rotated)
+        add_stacked_heights(model, n, w, pre['w_min'], l_c, h)
+
+    # Solver
+    start_time = timer()
+    build_time = start_time - build_start
+    print(f"build time: {build_time:.03f}s\n")
+    model._shared_h = shared_h
+    model._sym_break = sym_break
+    model._matrix = True
+    model._trace = []
+    model.optimize(mip_callback)
+    solve_time = timer() - start_time
+    lower = proven_lower(model, h_min, h_Max)
+
+    if model.SolCount == 0:
+        return no_solution(model, index_f, rotation, lower, build_time, solve_time, export)
+
+    # Solution, read at once from the MVars
+    x_sol = np.rint(x_cord.X).astype(int).tolist()
+    y_sol = np.rint(y_cord.X).astype(int).tolist()
+    rotated = np.rint(rotation_c.X) > 0 if rotation else np.zeros(n, dtype=bool)
+    w_new = np.where(rotated, y, x).tolist()
+    h_new = np.where(rotated, x, y).tolist()
+
+    h_sol = round(model.ObjVal)
+    optimal = model.Status == GRB.OPTIMAL
+    print(f'\nSolution: {h_sol}\n')
+    write_solution(index_f, w, h_sol, n, w_new, h_new, x_sol, y_sol, rotation, solve_time)
+    write_log(index_f, h_sol, rotation, solve_time, optimal)
+    log_metrics(model, index_f, rotation, h_sol, lower, build_time, solve_time)
+    if export:
+        export_model(model, index_f, rotation, export)
+
+    if plot:
+        plot_solution(index_f, w, h_sol, n, w_new, h_new, x_sol, y_sol, rotation)
+
+    return {'instance': index_f, 'h': h_sol, 'time': solve_time, 'optimal': optimal, 'lower': lower,
+            'first_time': model._trace[0][0] if model._trace else solve_time, 'trace': model._trace}
+
+
+def solver(w,n,x,y, rotation: bool, index_f, plot: bool, warm_start=False, h_ub=None, shared_h=None, threads=None, sym_break=False, lazy=False, matrix=False, export=None, start=None, symmetry=-1):
     print(f"\n================================\n\nINSTANCE: {index_f}\n")
     print(f"width plate: {w}\n")
     print(f"number of circuits: {n}\n")
@@ -125,15 +435,25 @@ def solver(w,n,x,y, rotation: bool, index_f, plot: bool):
         print(f"{a}) chip dimension: {x[a]} X {y[a]}\n")
  
     h_Max = sum(y) 
-    h_min = math.ceil((sum([x[i]*y[i] for i in range(n)]) / w ))
+    h_min = lower_bound(w, x, y, rotation) # best of the area, tallest circuit, stacked wide circuits and dual feasible function bounds
+    print(f"lower bound of the height: {h_min}\n")
     area_min = sum((x[i]*y[i]) for i in range(n))
     area_max = h_Max * w
+
+    if matrix:
+        return solver_matrix(w,n,x,y,rotation,index_f,plot,warm_start,h_ub,shared_h,threads,sym_break,lazy,export,start,symmetry,h_min,h_Max,area_min,area_max)
     
     
     if not rotation:
-        model = gp.Model("MIP")
+        build_start = timer()
+        wait_exports()
+        model = gp.Model("MIP", env=gurobi_env())
         model.setParam("TimeLimit", 5*60) # 5 minutes for each instance
-        model.setParam("Symmetry",-1) # -1: auto, 0:off , 1: conservative, 2:aggressive
+        model.setParam("Symmetry",symmetry) # -1: auto, 0:off , 1: conservative, 2:aggressive
+        if threads is not None:
+            model.setParam("Threads", threads) # keep the solver inside the core budget of the parallel runner
+        if lazy:
+            model.setParam("LazyConstraints", 1) # non-overlap constraints added by the callback
         
     # === VARIABLES === #
 
@@ -146,10 +466,28 @@ def solver(w,n,x,y, rotation: bool, index_f, plot: bool):
         #  - name (optional)
 
 
-        x_cord = model.addVars(n, lb=0, ub=w-np.amin(x), vtype=GRB.INTEGER, name="x_coordinates")
-        y_cord = model.addVars(n, lb=0, ub=h_Max-np.amin(y), vtype=GRB.INTEGER, name="y_coordinates")
+        if warm_start and start is None:
+            start = skyline_packing(w, x, y)   # the layout of the skyline heuristic is the initial incumbent
+        if start is not None:
+            # the height of the initial incumbent (of the heuristic, or given by the caller) is an upper bound of the optimal one
+            h_start, x_start, y_start, w_start, l_start = start
+            h_ub = h_start if h_ub is None else min(h_ub, h_start)
+        if h_ub is not None:
+            h_Max = min(h_Max, h_ub)
+        pre = preprocess(w, x, y, False, h_Max)    # reductions of the instance
+
+        x_cord = model.addVars(n, lb=0, ub=pre['x_max'], vtype=GRB.INTEGER, name="x_coordinates")
+        y_cord = model.addVars(n, lb=0, ub=pre['y_max'], vtype=GRB.INTEGER, name="y_coordinates")
         h = model.addVar(lb=h_min,ub= h_Max ,vtype=GRB.INTEGER, name="height") # our variable to minimize
-        s = model.addVars(n, n, 4, vtype=GRB.BINARY, name="s") # used for big M method
+
+        # binaries only for the pairs i < j and for the relative positions they can take
+        relations = pair_relations(n, w, h_Max, pre['w_min'], pre['l_min'])
+        s = model.addVars([(i, j, k) for (i, j), ks in relations.items() for k in ks], vtype=GRB.BINARY, name="s") # used for big M method
+        
+        if start is not None:
+            if sym_break:
+                x_start, y_start, w_start, l_start = canonical_layout(pre, x_start, y_start, w_start, l_start)
+            set_start(n, x_cord, y_cord, h, s, x_start, y_start, w_start, l_start, h_start)
         
         
     # === CONSTRAINTS === #
@@ -164,12 +502,23 @@ def solver(w,n,x,y, rotation: bool, index_f, plot: bool):
         
         
         # 2) constraint no overlap = https://stackoverflow.com/questions/72941147/overlapping-constraint-in-linear-programming
-        # BIG M method:
-        model.addConstrs(((x_cord[i] + x[i] <= x_cord[j] + w*s[i,j,0]) for i in range(n) for j in range(i+1,n)), "no_ov1")
-        model.addConstrs(((y_cord[i] + y[i] <= y_cord[j] + h*s[i,j,1]) for i in range(n) for j in range(i+1,n)), "no_ov2")
-        model.addConstrs(((x_cord[j] + x[j] <= x_cord[i] + w*s[i,j,2]) for i in range(n) for j in range(i+1,n)), "no_ov3")
-        model.addConstrs(((y_cord[j] + y[j] <= y_cord[i] + h*s[i,j,3]) for i in range(n) for j in range(i+1,n)), "no_ov4")
-        model.addConstrs((gp.quicksum(s[i,j,k] for k in range(4))<=3 for i in range(n) for j in range(n)), "no_overlap")
+        # BIG M method, with constant M: since x_cord[i] + x[i] <= w and y_cord[i] + y[i] <= h_Max, a relaxed
+        # constraint is always satisfied with M = w horizontally and M = h_Max vertically.
+        # In the lazy mode only the seeded pairs start in the model, the other ones are added by the callback
+        pairs = seeded_pairs(relations) if lazy else relations
+        model.addConstrs(((x_cord[i] + x[i] <= x_cord[j] + w*s[i,j,0]) for i, j in pairs if 0 in relations[i,j]), "no_ov1")
+        model.addConstrs(((y_cord[i] + y[i] <= y_cord[j] + h_Max*s[i,j,1]) for i, j in pairs if 1 in relations[i,j]), "no_ov2")
+        model.addConstrs(((x_cord[j] + x[j] <= x_cord[i] + w*s[i,j,2]) for i, j in pairs if 2 in relations[i,j]), "no_ov3")
+        model.addConstrs(((y_cord[j] + y[j] <= y_cord[i] + h_Max*s[i,j,3]) for i, j in pairs if 3 in relations[i,j]), "no_ov4")
+        model.addConstrs((gp.quicksum(s[i,j,k] for k in relations[i,j]) <= len(relations[i,j])-1 for i, j in pairs), "no_overlap")
+        model._lazy = lazy_state(n, x, y, relations, pairs, x_cord, y_cord, x, y, s, w, h_Max) if lazy else None
+        if lazy:
+            add_stacked_heights(model, n, w, pre['w_min'], y, h)
+
+        # 3) symmetry breaking: identical circuits ordered by x (implied by their lexicographic order)
+        # and the circuits that cannot sit beside any other one at x = 0
+        if sym_break:
+            add_symmetry_breaking(model, pre, x_cord)
 
 
         area = w * h
@@ -185,37 +534,56 @@ def solver(w,n,x,y, rotation: bool, index_f, plot: bool):
         
         # Solver
         start_time = timer()
-        model.optimize()
+        build_time = start_time - build_start
+        print(f"build time: {build_time:.03f}s\n")
+        model._shared_h = shared_h
+        model._matrix = False
+        model._sym_break = sym_break
+        model._trace = []
+        model.optimize(mip_callback)
         solve_time = timer() - start_time
+        lower = proven_lower(model, h_min, h_Max)
 
 
-        model.write(f'file_mip/out-{index_f}.lp')
+        if model.SolCount == 0:
+            return no_solution(model, index_f, rotation, lower, build_time, solve_time, export)
         
         # Solution
         
 
-        x_sol = []
-        y_sol = []
-
-
-        for i in range(n):
-            x_sol.append(int(model.getVarByName(f"x_coordinates[{i}]").X))
-            y_sol.append(int(model.getVarByName(f"y_coordinates[{i}]").X))
+        # values of all the coordinates read at once
+        x_val = model.getAttr('X', x_cord)
+        y_val = model.getAttr('X', y_cord)
+        x_sol = [round(x_val[i]) for i in range(n)]
+        y_sol = [round(y_val[i]) for i in range(n)]
 
             
-        h_sol = int(model.ObjVal)
+        h_sol = round(model.ObjVal)
+        optimal = model.Status == GRB.OPTIMAL
         print(f'\nSolution: {h_sol}\n')
         # Writing solution
         write_solution(index_f, w, h_sol, n, x, y, x_sol,y_sol,False,solve_time)
-        write_log(index_f,h_sol,False,solve_time)
+        write_log(index_f,h_sol,False,solve_time,optimal)
+        log_metrics(model, index_f, False, h_sol, lower, build_time, solve_time)
+        if export:
+            export_model(model, index_f, False, export)
         
         if plot:
             plot_solution(index_f,  w,  h_sol,  n,  x,  y,  x_sol,  y_sol,  False)
+
+        return {'instance': index_f, 'h': h_sol, 'time': solve_time, 'optimal': optimal, 'lower': lower,
+                'first_time': model._trace[0][0] if model._trace else solve_time, 'trace': model._trace}
     
     else:
-        model = gp.Model("MIP_rotation")
+        build_start = timer()
+        wait_exports()
+        model = gp.Model("MIP_rotation", env=gurobi_env())
         model.setParam("TimeLimit", 5*60) # 5 minutes for each instance
-        model.setParam("Symmetry",-1) # -1: auto, 0:off , 1: conservative, 2:aggressive
+        model.setParam("Symmetry",symmetry) # -1: auto, 0:off , 1: conservative, 2:aggressive
+        if threads is not None:
+            model.setParam("Threads", threads) # keep the solver inside the core budget of the parallel runner
+        if lazy:
+            model.setParam("LazyConstraints", 1) # non-overlap constraints added by the callback
         
     # === VARIABLES === #
 
@@ -228,12 +596,39 @@ def solver(w,n,x,y, rotation: bool, index_f, plot: bool):
         #  - name (optional)
 
 
-        x_cord = model.addVars(n, lb=0, ub=w-np.amin(x), vtype=GRB.INTEGER, name="x_coordinates")
-        y_cord = model.addVars(n, lb=0, ub=h_Max-np.amin(y), vtype=GRB.INTEGER, name="y_coordinates")
+        if warm_start and start is None:
+            start = skyline_packing(w, x, y, rotation=True)   # the layout of the skyline heuristic is the initial incumbent
+        if start is not None:
+            # the height of the initial incumbent (of the heuristic, or given by the caller) is an upper bound of the optimal one
+            h_start, x_start, y_start, w_start, l_start = start
+            h_ub = h_start if h_ub is None else min(h_ub, h_start)
+        if h_ub is not None:
+            h_Max = min(h_Max, h_ub)
+        pre = preprocess(w, x, y, True, h_Max)     # reductions of the instance, with the smallest dimensions each circuit can take
+
+        x_cord = model.addVars(n, lb=0, ub=pre['x_max'], vtype=GRB.INTEGER, name="x_coordinates")
+        y_cord = model.addVars(n, lb=0, ub=pre['y_max'], vtype=GRB.INTEGER, name="y_coordinates")
         h = model.addVar(lb=h_min,ub= h_Max ,vtype=GRB.INTEGER, name="height") # our variable to minimize
-        s = model.addVars(n, n, 4, vtype=GRB.BINARY, name="s") # used for big M method
 
-        rotation_c = model.addVars(n,vtype=GRB.BINARY, name="rotation_c")
+        # binaries only for the pairs i < j and for the relative positions they can take in some orientation
+        relations = pair_relations(n, w, h_Max, pre['w_min'], pre['l_min'])
+        s = model.addVars([(i, j, k) for (i, j), ks in relations.items() for k in ks], vtype=GRB.BINARY, name="s") # used for big M method
+
+        # the orientation is fixed for the squares and for the circuits that fit the plate in a single orientation
+        fixed = pre['orientation']
+        rotation_c = model.addVars(n, lb=[1 if fixed.get(i) else 0 for i in range(n)], ub=[0 if fixed.get(i) is False else 1 for i in range(n)],
+                                   vtype=GRB.BINARY, name="rotation_c")
+
+        # width and height of the circuits, linear in the rotation: rotation_c[i] = 1 swaps them
+        w_c = [int(x[i]) + int(y[i] - x[i]) * rotation_c[i] for i in range(n)]
+        l_c = [int(y[i]) + int(x[i] - y[i]) * rotation_c[i] for i in range(n)]
+        
+        if start is not None:
+            if sym_break:
+                x_start, y_start, w_start, l_start = canonical_layout(pre, x_start, y_start, w_start, l_start)
+            set_start(n, x_cord, y_cord, h, s, x_start, y_start, w_start, l_start, h_start)
+            for i in range(n):
+                rotation_c[i].Start = 1 if w_start[i] != x[i] else 0
         
             # === CONSTRAINTS === #
 
@@ -242,17 +637,25 @@ def solver(w,n,x,y, rotation: bool, index_f, plot: bool):
         # - name of the constraint
         
         # 1) constraint that checks whether the chip dimensions do not exceed from the plate in both height (h) and width (w) [we have to consider rotation]
-        model.addConstrs(((x_cord[i] + (y[i] if rotation_c[i] else x[i]) <= w) for i in range(n)), name="inside_plate_x") 
-        model.addConstrs(((y_cord[i] + (x[i] if rotation_c[i] else y[i])<= h) for i in range(n)), name="inside_plate_y")
+        model.addConstrs(((x_cord[i] + w_c[i] <= w) for i in range(n)), name="inside_plate_x") 
+        model.addConstrs(((y_cord[i] + l_c[i] <= h) for i in range(n)), name="inside_plate_y")
         
         
         # 2) constraint no overlap = https://stackoverflow.com/questions/72941147/overlapping-constraint-in-linear-programming
-        # BIG M method:
-        model.addConstrs(((x_cord[i] + (y[i] if rotation_c[i] else x[i]) <= x_cord[j] + w*s[i,j,0]) for i in range(n) for j in range(i+1,n)), "n_ov1")
-        model.addConstrs(((y_cord[i] + (x[i] if rotation_c[i] else y[i]) <= y_cord[j] + h*s[i,j,1]) for i in range(n) for j in range(i+1,n)), "n_ov2")
-        model.addConstrs(((x_cord[j] + (y[j] if rotation_c[j] else x[j]) <= x_cord[i] + w*s[i,j,2]) for i in range(n) for j in range(i+1,n)), "n_ov3")
-        model.addConstrs(((y_cord[j] + (x[j] if rotation_c[j] else y[j]) <= y_cord[i] + h*s[i,j,3]) for i in range(n) for j in range(i+1,n)), "n_ov4")
-        model.addConstrs((gp.quicksum(s[i,j,k] for k in range(4))<=3 for i in range(n) for j in range(n)), "no_overlap")
+        # BIG M method, with constant M = w horizontally and M = h_Max vertically (see the model without rotation)
+        pairs = seeded_pairs(relations) if lazy else relations
+        model.addConstrs(((x_cord[i] + w_c[i] <= x_cord[j] + w*s[i,j,0]) for i, j in pairs if 0 in relations[i,j]), "n_ov1")
+        model.addConstrs(((y_cord[i] + l_c[i] <= y_cord[j] + h_Max*s[i,j,1]) for i, j in pairs if 1 in relations[i,j]), "n_ov2")
+        model.addConstrs(((x_cord[j] + w_c[j] <= x_cord[i] + w*s[i,j,2]) for i, j in pairs if 2 in relations[i,j]), "n_ov3")
+        model.addConstrs(((y_cord[j] + l_c[j] <= y_cord[i] + h_Max*s[i,j,3]) for i, j in pairs if 3 in relations[i,j]), "n_ov4")
+        model.addConstrs((gp.quicksum(s[i,j,k] for k in relations[i,j]) <= len(relations[i,j])-1 for i, j in pairs), "no_overlap")
+        model._lazy = lazy_state(n, x, y, relations, pairs, x_cord, y_cord, w_c, l_c, s, w, h_Max, rotation_c) if lazy else None
+        if lazy:
+            add_stacked_heights(model, n, w, pre['w_min'], l_c, h)
+
+        # 3) symmetry breaking (see the model without rotation)
+        if sym_break:
+            add_symmetry_breaking(model, pre, x_cord)
         
         area = w * h
         
@@ -267,36 +670,56 @@ def solver(w,n,x,y, rotation: bool, index_f, plot: bool):
         
         # Solver
         start_time = timer()
-        model.optimize()
+        build_time = start_time - build_start
+        print(f"build time: {build_time:.03f}s\n")
+        model._shared_h = shared_h
+        model._matrix = False
+        model._sym_break = sym_break
+        model._trace = []
+        model.optimize(mip_callback)
         solve_time = timer() - start_time
+        lower = proven_lower(model, h_min, h_Max)
 
-        model.write(f'file_mip_rotation/out-{index_f}.lp')
+        if model.SolCount == 0:
+            return no_solution(model, index_f, rotation, lower, build_time, solve_time, export)
         
         
         
         # Solution
         
         
-        x_sol = []
-        y_sol = []
-        rotation_c_sol = []
-        
-        for i in range(n):
-            x_sol.append(int(model.getVarByName(f"x_coordinates[{i}]").X))
-            y_sol.append(int(model.getVarByName(f"y_coordinates[{i}]").X))
-            rotation_c_sol.append(int(model.getVarByName(f"rotation_c[{i}]").X))    
+        # values of all the coordinates and rotations read at once
+        x_val = model.getAttr('X', x_cord)
+        y_val = model.getAttr('X', y_cord)
+        rotation_val = model.getAttr('X', rotation_c)
+        x_sol = [round(x_val[i]) for i in range(n)]
+        y_sol = [round(y_val[i]) for i in range(n)]
+        rotation_c_sol = [round(rotation_val[i]) for i in range(n)]
             
-        h_sol = int(model.ObjVal)
+        h_sol = round(model.ObjVal)
+        optimal = model.Status == GRB.OPTIMAL
         print(f'\nSolution: {h_sol}\n')
-        w_new = [int((y[i] if rotation_c[i] else x[i])) for i in range(n)] # new width array (based on rotation)
-        h_new = [int((x[i] if rotation_c[i] else y[i])) for i in range(n)] # new height array (based on rotation)
+        w_new = [int((y[i] if rotation_c_sol[i] else x[i])) for i in range(n)] # new width array (based on rotation)
+        h_new = [int((x[i] if rotation_c_sol[i] else y[i])) for i in range(n)] # new height array (based on rotation)
         
         # Writing solution
         write_solution(index_f, w, h_sol, n, w_new, h_new, x_sol,y_sol,True,solve_time)
-        write_log(index_f,h_sol,True,solve_time)
+        write_log(index_f,h_sol,True,solve_time,optimal)
+        log_metrics(model, index_f, True, h_sol, lower, build_time, solve_time)
+        if export:
+            export_model(model, index_f, True, export)
         
         if plot:
             plot_solution(index_f, w, h_sol, n, w_new, h_new, x_sol, y_sol, True)
+
+        return {'instance': index_f, 'h': h_sol, 'time': solve_time, 'optimal': optimal, 'lower': lower,
+                'first_time': model._trace[0][0] if model._trace else solve_time, 'trace': model._trace}
+
+
+# read and solve a single instance (entry point of the workers of the parallel runner)
+def mip_solve(index_f, rotation: bool, plot: bool, warm_start=False, h_ub=None, shared_h=None, threads=None, sym_break=False, lazy=False, matrix=False, export=None, start=None, symmetry=-1):
+    w, n, x, y = read_input(index_f)
+    return solver(w,n,x,y,rotation,index_f,plot,warm_start,h_ub,shared_h,threads,sym_break,lazy,matrix,export,start,symmetry)
         
     
     
@@ -307,17 +730,28 @@ if __name__ == '__main__':
     parser.add_argument('-f', '--first', help='Number of first instance', type=int, default=1)
     parser.add_argument('-l', '--last', help='Number of last instance', type=int, default=40)
     parser.add_argument('-r', '--rotation', help='Allow rotation', action='store_true')
+    parser.add_argument('-sb', '--sym_break', help='Allow symmetry breaking constraints', action='store_true')
     parser.add_argument('-p', '--plot', help='Plot solution', action='store_true')
+    parser.add_argument('-ws', '--warm_start', help='Start from the layout of the skyline heuristic', action='store_true')
+    parser.add_argument('-j', '--jobs', help='Number of instances solved in parallel', type=int, default=1)
+    parser.add_argument('-c', '--cores', help='Number of cores shared by the parallel jobs', type=int, default=None)
+    parser.add_argument('-mx', '--matrix', help='Build the model with the matrix API', action='store_true')
+    parser.add_argument('-e', '--export', help='Write the model of each instance in the given format', type=str, default=None, choices=EXPORT_FORMATS)
+    parser.add_argument('-sy', '--symmetry', help='Symmetry detection of Gurobi: -1 auto, 0 off, 1 conservative, 2 aggressive', type=int, default=-1, choices=[-1, 0, 1, 2])
+    parser.add_argument('-lz', '--lazy', help='Add the non-overlap constraints lazily, for the pairs that overlap in the incumbents', action='store_true')
     args = parser.parse_args()
     
     write_log_init(args.rotation)
     
-    for a in range(args.first,args.last+1,1):
-        
-        w, n, x, y = read_input(a)
-        
-        solver(w,n,x,y,args.rotation,a,args.plot)
-        
-        
-        
-    
\ No newline at end of file
+    if args.jobs == 1:
+        for a in range(args.first,args.last+1,1):
+            
+            w, n, x, y = read_input(a)
+            
+            solver(w,n,x,y,args.rotation,a,args.plot,args.warm_start,sym_break=args.sym_break,lazy=args.lazy,matrix=args.matrix,export=args.export,symmetry=args.symmetry)
+    else:
+        # solve the instances in parallel, killing the workers that go beyond the time limit
+        kwargs = {'rotation': args.rotation, 'plot': args.plot, 'warm_start': args.warm_start, 'sym_break': args.sym_break, 'lazy': args.lazy, 'matrix': args.matrix, 'export': args.export, 'symmetry': args.symmetry}
+        for a, result, error in run_instances(mip_solve, range(args.first,args.last+1), kwargs, jobs=args.jobs, cores=args.cores, timeout=330):
+            if error is not None:
+                print(f"Instance {a}: {error}")
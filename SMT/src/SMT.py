@@ -1,38 +1,36 @@
 from z3 import *
+import builtins
 import argparse
 from pathlib import Path
-import numpy as np
-import matplotlib.pyplot as plt
-from random import randint
-from matplotlib import colors
 from timeit import default_timer as timer
+import sys
+
+sys.path.append(str(Path(__file__).resolve().parents[2]))  # repository root, where the shared modules live
+from common.runner import run_instances
+from common.heuristic import skyline_packing
+from common.bounds import lower_bound
+from common.preprocess import preprocess, group_pairs
+from common.plot import render_solution
+from common.instances import load_instance, instance_name
+from common.metrics import log_run
+from common.engines import share_height
 
 
 # EXTERNAL FUNCTIONS
 
 # read data from txt instances
 def read_instance(instance):
-    ins_path = Path('../SMT/instances/ins-' + str(instance) + '.txt') # path of the current instance
-    f = open(ins_path, 'r')
-    text = f.readlines()
-
-    w = int(text[0]) # the width of the silicon plate
-    n = int(text[1]) # the number of necessary circuits to place inside the plate
-    x_dim = []           # horizontal dimensions of the circuits
-    y_dim = []           # vertical dimensions of the circuits
+    w, n, dims = load_instance(instance)    # parsed once by the shared loader
 
-    for j in range(2, n+2):     # loop on n circuits, the count starts from the third line of the instance file and ends at the n-th line
-        txt = text[j].split()  # get a two elements array, xj and yj, representing the horizontal and vertical dimensions of the j-th circuit
-        x_dim.append(int(txt[0]))  # put each horizontal dimension into list x
-        y_dim.append(int(txt[1]))  # put each vertical dimension into list x
-
-    f.close()
+    x_dim = dims[:, 0].tolist()  # horizontal dimensions of the circuits, as python ints for z3
+    y_dim = dims[:, 1].tolist()  # vertical dimensions of the circuits
 
     return w, n, x_dim, y_dim
 
 # write the found model in a txt file
 def write_solution(instance, w, h, n, x, y, x_coord, y_coord, sym_break=False, rotation=False):
-    out_path = Path("../SMT/out/" + f"{'/w_sym_break/' if sym_break else '/wout_sym_break/'}" + "out-" + str(instance) + f"{'_rotation' if rotation else ''}.txt")
+    out_path = Path("../SMT/out/" + f"{'/w_sym_break/' if sym_break else '/wout_sym_break/'}" + "out-" + instance_name(instance) + f"{'_rotation' if rotation else ''}.txt")
+    out_path.parent.mkdir(parents=True, exist_ok=True)
     with open(out_path, 'w') as f:
         f.writelines(f'{w} {h}\n')
         f.writelines(f'{n}\n')
@@ -42,41 +40,8 @@ def write_solution(instance, w, h, n, x, y, x_coord, y_coord, sym_break=False, r
 
 # PLOT FUNCTIONS
 def plot_solution(instance, w, h, n, x, y, x_coord, y_coord, sym_break=False, rotation=False):       # path of the output file, board weight, board height, total number of circuits to place
-    board = np.empty((h, w))        # h stands for the height of the board and, as a numpy array, it stands for the number of rows
-                                    # w stands for the width of the board and, as a numpy array, it stands for the number of columns
-    board.fill(n)
-
-    for i in range(n):
-        column = x_coord[i]  # position of the circuit on x-axis
-        row = y_coord[i]     # position of the circuit on y-axis
-
-        # compute the width and height of the current circuit
-        width = x[i]
-        height = y[i]
-
-        for rows in range(row, row + height):
-            for columns in range(column, column + width):
-                board[rows][columns] = i
-
-    cmap = build_cmap(n)
-    plt.imshow(board, interpolation='None', cmap=cmap, vmin=0, vmax=n)
-    ax = plt.gca()
-    ax.invert_yaxis()
-    image_path = Path("../SMT/out_plots/" + f"{'/w_sym_break/' if sym_break else '/wout_sym_break/'}" + "out-" + str(instance) + f"{'_rotation' if rotation else ''}.png")
-    plt.savefig(image_path)
-    # plt.show()
-
-
-def build_cmap(n):
-    colors_list = []
-
-    for i in range(n):
-        colors_list.append('#%06X' % randint(0, 0xFFFFF0))
-
-    colors_list.append('#FFFFFF')
-
-    return colors.ListedColormap(colors_list)
-
+    image_path = Path("../SMT/out_plots/" + f"{'/w_sym_break/' if sym_break else '/wout_sym_break/'}" + "out-" + instance_name(instance) + f"{'_rotation' if rotation else ''}.png")
+    render_solution(w, h, n, x, y, x_coord, y_coord, image_path)
 
 
 # SUPPORT FUNCTIONS
@@ -88,288 +53,512 @@ def max(array):
         max_val = If(i > max_val, i, max_val)
     return max_val
 
+# CUMULATIVE ENCODINGS
+# resource: the original encoding, the usage is checked at the values of the resources themselves
+# pairwise: two tasks whose resources exceed the total together cannot run at the same time
+# sweep:    the usage only increases when a task starts, hence it is checked at the start points only
+# none:     no cumulative constraint, the non overlapping constraint alone is complete
+CUMULATIVE = ['resource', 'pairwise', 'sweep', 'none']
+
+# (x1, y1) lexicographically less or equal to (x2, y2)
+def lex_lesseq(x1, y1, x2, y2):
+    return Or(x1 < x2, And(x1 == x2, y1 <= y2))
+
 #(y_coord, y_dim, x_dim, w) #(start, duration, resources, total):
 def cumulative_const(start, duration, resources, total):
     cumulative = []
     for u in resources:
         cumulative.append(
-            sum([If(And(start[i] <= u, u < start[i] + duration[i]), resources[i], 0) for i in range(len(start))]) <= total
+            Sum([If(And(start[i] <= u, u < start[i] + duration[i]), resources[i], 0) for i in range(len(start))]) <= total
         )
     return cumulative
 
+# one task precedes the other for each pair of tasks too large to run together
+def cumulative_pairwise(start, duration, resources, total):
+    cumulative = []
+    for i in range(len(start)):
+        for j in range(i+1, len(start)):
+            precedence = Or(start[i] + duration[i] <= start[j], start[j] + duration[j] <= start[i])
+            exceeds = resources[i] + resources[j] > total
+            if is_expr(exceeds):    # resources that depend on the rotation
+                cumulative.append(Implies(exceeds, precedence))
+            elif exceeds:           # pairs that fit together need no constraint
+                cumulative.append(precedence)
+    return cumulative
+
+# at the start of each task j, the tasks running (j included) do not exceed the total
+def cumulative_sweep(start, duration, resources, total):
+    cumulative = []
+    for j in range(len(start)):
+        running = [If(And(start[i] <= start[j], start[j] < start[i] + duration[i]), resources[i], 0) for i in range(len(start)) if i != j]
+        cumulative.append(Sum(running + [resources[j]]) <= total)
+    return cumulative
+
+
+
+# ENCODINGS
+# lia:   unbounded integer coordinates (QF_LIA)
+# bv:    signed bit-vector coordinates, just wide enough for every term of the model (QF_BV)
+# order: propositional order encoding of the coordinates, solved by the SAT core of z3 (QF_FD)
+# auto:  lia for the small instances, order from ORDER_MIN_CIRCUITS circuits on
+ENCODINGS = ['lia', 'bv', 'order', 'auto']
+ORDER_MIN_CIRCUITS = 16     # the order encoding is 2-4 times faster than lia from about 20 circuits on (ins-16..24)
+
+# bits of the bit-vectors: the largest term is a coordinate plus a dimension (at most twice the width
+# or the height of all the circuits stacked) or a cumulative sum of the widths, plus the sign bit
+def bv_width(w, x_dim, y_dim, rotation):
+    h_max = sum([(x_dim[i] if rotation and x_dim[i] > y_dim[i] else y_dim[i]) for i in range(len(x_dim))])
+    w_sum = sum([(y_dim[i] if rotation and y_dim[i] > x_dim[i] else x_dim[i]) for i in range(len(x_dim))])
+    largest = 2 * w if 2 * w > 2 * h_max else 2 * h_max
+    largest = largest if largest > w_sum else w_sum
+    return largest.bit_length() + 1
+
+# integer variables with the given names in the lia or bv encoding
+def int_vars(names, encoding, bits):
+    if encoding == 'bv':
+        return [BitVec(name, bits) for name in names]
+    return [Int(name) for name in names]
+
+
+# MODEL
+
+# build the placement constraints of the plate, where each circuit has to stay below the term height
+# (the maximum of the circuit tops for the optimizer, a plain integer variable for the height search)
+# pre holds the reductions of the instance (common/preprocess.py), computed here if not given
+def build_constraints(w, n_circuit, x_dim, y_dim, height, sym_break, rotation, cumulative='resource', encoding='lia', pre=None):
+    pre = preprocess(w, x_dim, y_dim, rotation) if pre is None else pre
+
+    # initialization of coordinate variables
+    bits = bv_width(w, x_dim, y_dim, rotation)
+    x_coord = int_vars([f'x__{i}' for i in range(n_circuit)], encoding, bits)
+    y_coord = int_vars([f'y__{i}' for i in range(n_circuit)], encoding, bits)
+
+    if rotation:
+        # array of booleans, each one telling if the corresponding chip is rotated or not
+        rotation_c = BoolVector('r', n_circuit)
+
+        # actual dimensions of the circuits, which depend on the rotation (constants of the same sort as the coordinates)
+        value = (lambda v: BitVecVal(v, bits)) if encoding == 'bv' else IntVal
+        width = [If(rotation_c[i], value(y_dim[i]), value(x_dim[i])) for i in range(n_circuit)]
+        length = [If(rotation_c[i], value(x_dim[i]), value(y_dim[i])) for i in range(n_circuit)]
+    else:
+        rotation_c = None
+        width = x_dim
+        length = y_dim
+
+    if height is None:
+        # height that is going to be minimized from the optimizer
+        height = max([ length[i] + y_coord[i] for i in range(n_circuit) ])
+
+
+    # BOUNDS CONSTRAINT - set the boundary of the plate
+    boundary_x =[]
+    boundary_y =[]
+
+    bound_zero_x = []
+    bound_zero_y = []
+
+    for i in range(n_circuit):
+        # each coord var has the value >= 0
+        bound_zero_x.append(x_coord[i] >= 0)
+        bound_zero_y.append(y_coord[i] >= 0)
+
+        # with bit-vectors, the largest coordinates of the circuit keep every term within bv_width bits (with
+        # integers z3 is much slower with these bounds, the y_max one in particular, hence they are left out)
+        if encoding == 'bv':
+            bound_zero_x.append(x_coord[i] <= pre['x_max'][i])
+            bound_zero_y.append(y_coord[i] <= pre['y_max'][i])
+
+        # each circuit is positioned inside the limit of the plate (width and height to be minimized)
+        boundary_x.append(x_coord[i] + width[i] <= w)
+        boundary_y.append(y_coord[i] + length[i] <= height)
+
+
+    # NON OVERLAPPING CONSTRAINT
+    non_overlap_const = []
+
+    for i in range(n_circuit):
+        for j in range(i+1, n_circuit): # from i+1 if i and j are the same block the comparison is useless
+            non_overlap_const.append( Or(x_coord[i] + width[i] <= x_coord[j],   # i to the left of j
+                                         x_coord[j] + width[j] <= x_coord[i],   # i to the right of j
+                                         y_coord[i] + length[i] <= y_coord[j],  # i below j
+                                         y_coord[j] + length[j] <= y_coord[i])) # i above j
+
+
+    # CUMULATIVE CONSTRAINT
+    # with bit-vectors the resources summed are bit-vector constants, otherwise the sums would be integer terms
+    resources = [v if is_expr(v) else BitVecVal(v, bits) for v in width] if encoding == 'bv' else width
+    if cumulative == 'resource':
+        cumulative_y = cumulative_const(y_coord, length, resources, w) #(start, duration, resources, total): asse temporale e' y
+    elif cumulative == 'pairwise':
+        cumulative_y = cumulative_pairwise(y_coord, length, width, w)
+    elif cumulative == 'sweep':
+        cumulative_y = cumulative_sweep(y_coord, length, resources, w)
+    else:
+        cumulative_y = []
+
+
+    # STACKED CONSTRAINT - circuits too wide to sit side by side are one above the other
+    stacked_const = [Or(y_coord[i] + length[i] <= y_coord[j], y_coord[j] + length[j] <= y_coord[i]) for i, j in pre['stacked']]
+
+
+    constraints = boundary_x + boundary_y + bound_zero_x + bound_zero_y + non_overlap_const + cumulative_y + stacked_const
+
+    # ORIENTATION CONSTRAINT - squared circuits do not need to rotate, others fit the plate in a single orientation
+    if rotation:
+        constraints += [rotation_c[i] == rotated for i, rotated in pre['orientation'].items()]
+
+
+    # SYMMETRY BREAKING CONSTRAINT
+    if sym_break:
+
+        # indexes of the 2 largest pieces
+        first_max, second_max = pre['biggest']
+
+        # the biggest circuit is always placed for first w.r.t. the second biggest one
+        sb_biggest_lex_less = lex_lesseq(x_coord[first_max], y_coord[first_max], x_coord[second_max], y_coord[second_max])
+
+        # identical circuits are placed in the order of their indexes
+        sb_identical = [lex_lesseq(x_coord[i], y_coord[i], x_coord[j], y_coord[j]) for i, j in group_pairs(pre['groups'])]
+
+        # circuits that cannot sit beside any other one are moved to the left side
+        sb_full_width = [x_coord[i] == 0 for i in pre['full_width']]
+
+        # width maggiore -> coord y < h/2
+        # height maggiore -> coord x < w/2
+        sb_biggest_in_first_quadrande = And(2 * x_coord[first_max] < w, y_coord[first_max] < height/2)
+
+        constraints += [sb_biggest_in_first_quadrande, sb_biggest_lex_less] + sb_identical + sb_full_width
+
+    return constraints, x_coord, y_coord, rotation_c, height
+
+
+# ORDER ENCODING
+# Each coordinate is a chain of Booleans px[i][e] <=> x_i <= e (py[i][f] <=> y_i <= f) and the height is a
+# chain ph[f] <=> height <= f, up to the upper bound of the height. The relative position of each pair is
+# a Boolean too (left[i,j]: i to the left of j, below[i,j]: i below j), hence the model is a set of clauses.
+
+# literal of v <= e for the chain p of the values 0 .. len(p)-1 (constants outside the chain)
+def order_le(p, e):
+    if e < 0:
+        return False
+    if e >= len(p):
+        return True
+    return p[e]
+
+def order_not(literal):
+    return (not literal) if isinstance(literal, bool) else Not(literal)
+
+# clause of the literals, None when a literal is always true
+def order_clause(*literals):
+    if any(literal is True for literal in literals):
+        return None
+    return Or([literal for literal in literals if literal is not False] + [BoolVal(False)])
+
+# returns the clauses, the literal of height <= h and the decoder of a model into
+# (x coordinates, y coordinates, rotated circuits, height)
+def build_order(w, n_circuit, x_dim, y_dim, upper, sym_break, rotation, pre=None):
+    pre = preprocess(w, x_dim, y_dim, rotation, upper) if pre is None else pre
+
+    px = [[Bool(f'px_{i}_{e}') for e in range(w)] for i in range(n_circuit)]
+    py = [[Bool(f'py_{i}_{f}') for f in range(upper)] for i in range(n_circuit)]
+    ph = [Bool(f'ph_{f}') for f in range(upper + 1)]
+
+    # orientations of each circuit: (literal under which it holds, width, length), a single one when it is fixed
+    fixed = {i: False for i in range(n_circuit)} if not rotation else pre['orientation']
+    rotation_c = [None if i in fixed else Bool(f'r_{i}') for i in range(n_circuit)]
+    orientations = [[(True, y_dim[i], x_dim[i]) if fixed[i] else (True, x_dim[i], y_dim[i])] if i in fixed else
+                    [(Not(rotation_c[i]), x_dim[i], y_dim[i]), (rotation_c[i], y_dim[i], x_dim[i])] for i in range(n_circuit)]
+
+    clauses = []
+
+    # chains: v <= e implies v <= e+1, and the height is at most upper
+    for i in range(n_circuit):
+        clauses += [Implies(px[i][e], px[i][e+1]) for e in range(w - 1)]
+        clauses += [Implies(py[i][f], py[i][f+1]) for f in range(upper - 1)]
+    clauses += [Implies(ph[f], ph[f+1]) for f in range(upper)] + [ph[upper]]
+
+    # each circuit inside the plate, below the height
+    for i in range(n_circuit):
+        for holds, width, length in orientations[i]:
+            clauses.append(order_clause(order_not(holds), order_le(px[i], w - width)))
+            clauses += [order_clause(order_not(holds), Not(ph[f]), order_le(py[i], f - length)) for f in range(upper + 1)]
+
+    # i before j along an axis: start_j <= e + dim_i implies start_i <= e, under the orientation of i
+    def before(p_i, p_j, i, dim, relation):
+        for holds, width, length in orientations[i]:
+            d = width if dim == 'x' else length
+            clauses.extend(order_clause(Not(relation), order_not(holds), order_not(order_le(p_j, e + d)), order_le(p_i, e)) for e in range(-1, len(p_i) - d))
+
+    # the smallest width and length each circuit can take, to skip the relative positions that can never hold
+    w_min, l_min = pre['w_min'], pre['l_min']
+
+    # non overlapping: one of the four relative positions holds for each pair
+    for i in range(n_circuit):
+        for j in range(i+1, n_circuit):
+            relations = []
+            if w_min[i] + w_min[j] <= w:
+                left, right = Bool(f'left_{i}_{j}'), Bool(f'left_{j}_{i}')
+                before(px[i], px[j], i, 'x', left)
+                before(px[j], px[i], j, 'x', right)
+                relations += [left, right]
+            if l_min[i] + l_min[j] <= upper:
+                below, above = Bool(f'below_{i}_{j}'), Bool(f'below_{j}_{i}')
+                before(py[i], py[j], i, 'y', below)
+                before(py[j], py[i], j, 'y', above)
+                relations += [below, above]
+            clauses.append(order_clause(*relations))
+
+    # SYMMETRY BREAKING: the biggest circuit in the left half of the plate (2 * x < w), the identical circuits
+    # ordered by x (implied by their lexicographic order) and the circuits that cannot sit beside any other one at x = 0
+    if sym_break:
+        clauses.append(order_clause(order_le(px[pre['biggest'][0]], (w - 1) // 2)))
+        for i, j in group_pairs(pre['groups']):
+            clauses += [Implies(px[j][e], px[i][e]) for e in range(w)]
+        clauses += [px[i][0] for i in pre['full_width']]
+
+    clauses = [clause for clause in clauses if clause is not None]
+
+    def decode(model):
+        x_coord = [next(e for e in range(w) if is_true(model.evaluate(px[i][e], model_completion=True))) for i in range(n_circuit)]
+        y_coord = [next((f for f in range(upper) if is_true(model.evaluate(py[i][f], model_completion=True))), upper) for i in range(n_circuit)]
+        rotated = [fixed[i] if rotation_c[i] is None else is_true(model.evaluate(rotation_c[i], model_completion=True)) for i in range(n_circuit)]
+        height = 0
+        for i in range(n_circuit):
+            top = y_coord[i] + (x_dim[i] if rotated[i] else y_dim[i])
+            height = top if top > height else height
+        return x_coord, y_coord, rotated, height
+
+    return clauses, (lambda h: ph[h]), decode
+
+
+# top of the layout of a model: in the height search the height is a free variable, only bounded below by the
+# tops of the circuits, hence it can be above the layout
+def layout_top(model, y_coord, x_dim, y_dim, rotation_c=None):
+    rotated = [rotation_c is not None and is_true(model.evaluate(rotation_c[i], model_completion=True)) for i in range(len(y_coord))]
+    return builtins.max([model.evaluate(y_coord[i]).as_long() + (x_dim[i] if rotated[i] else y_dim[i]) for i in range(len(y_coord))])
+
+
+# HEIGHT SEARCH
+# A plain solver receives the placement constraints once, then the height is fixed to one candidate
+# value at a time inside a push/pop scope, so that the clauses learned for a height are kept for the next one.
+# The bottom-up search tries lower, lower+1, ... and the first satisfiable height is the optimum;
+# the bisection halves the interval [lower, upper] at each check.
+# When the search runs inside the portfolio, shared_h holds the best height found by any engine, hence only
+# the heights below it are worth trying; each satisfiable height is published there.
+# The time and the height of each solution found are appended to trace.
+# The order encoding has no height term: it gives its own solver, the literal of height <= h (at_most)
+# and the height of a model (height_of).
+#
+# returns the model of the best height found, the lower bound proven on the height and the solver statistics
+def height_search(constraints, height, lower, upper, bisection, timeout, shared_h=None, trace=None, solver=None, at_most=None, height_of=None):
+    solver = Solver() if solver is None else solver
+    at_most = (lambda h: height <= h) if at_most is None else at_most
+    height_of = (lambda model: model.evaluate(height).as_long()) if height_of is None else height_of
+    solver.add(constraints)
+
+    start_time = timer()
+    deadline = start_time + timeout / 1000
+    best_model = None
+
+    while lower <= upper:
+        if shared_h is not None:
+            upper = min(upper, shared_h.value - 1)
+            if lower > upper:
+                break
+        remaining = int((deadline - timer()) * 1000)
+        if remaining <= 0:
+            break
+        candidate = (lower + upper) // 2 if bisection else lower
+
+        solver.push()
+        solver.add(at_most(candidate))
+        solver.set('timeout', remaining)
+        status = solver.check()
+        if status == sat:
+            best_model = solver.model()
+            upper = height_of(best_model) - 1  # next, look for a strictly lower height
+            share_height(shared_h, upper + 1)
+            if trace is not None:
+                trace.append((timer() - start_time, upper + 1))
+        solver.pop()
+
+        if status == unsat:
+            lower = candidate + 1   # every height up to candidate is infeasible
+        elif status == unknown:     # time exceeded
+            break
+
+    return best_model, lower, solver.statistics()
 
 
 # EXECUTION
 
-def smt_exec(first_i, last_i, sym_break, rotation, plot):
+# the z3 optimizer is sequential, hence each instance uses a single thread
+def smt_solve(instance, sym_break, rotation, plot, mode='optimize', warm_start=False, h_ub=None, shared_h=None, threads=1, cumulative='resource', encoding='lia'):
 
     # w = width plate
     # n = number of chips
     # x = array delle width
     # y = array delle heigths
-    for instance in range(first_i, last_i+1):
-        w, n_circuit, x_dim, y_dim = read_instance(instance)
-
-        #################
-        ## NO ROTATION ##
-        #################
-        if not rotation: 
-            # initialization of coordinate variables
-            x_coord = IntVector('x', n_circuit) 
-            y_coord = IntVector('y', n_circuit)
-            
-            # height that is going to be minimized from the optimizer
-            min_height = max([ y_dim[i] + y_coord[i] for i in range(n_circuit) ])
-
-
-            # OPTIMIZER
-            optimizer = Optimize()
-
-
-            # BOUNDS CONSTRAINT - set the boundary of the plate
-            boundary_x =[]
-            boundary_y =[]
-
-            bound_zero_x = []
-            bound_zero_y = []
-
-            for i in range(n_circuit):
-                # each coord var has the value >= 0
-                bound_zero_x.append(x_coord[i] >= 0)
-                bound_zero_y.append(y_coord[i] >= 0)
-                
-                # each circuit is positioned inside the limit of the plate (width and height to be minimized)
-                boundary_x.append(x_coord[i] + x_dim[i] <= w)
-                boundary_y.append(y_coord[i] + y_dim[i] <= min_height)
-                        
-
-            # NON OVERLAPPING CONSTRAINT
-            non_overlap_const = []
-
-            for i in range(n_circuit):
-                for j in range(i+1, n_circuit): # from i+1 if i and j are the same block the comparison is useless
-                    non_overlap_const.append( Or(x_coord[i] + x_dim[i] <= x_coord[j],   # i to the left of j
-                                                x_coord[j] + x_dim[j] <= x_coord[i],    # i below j
-                                                y_coord[i] + y_dim[i] <= y_coord[j],    # i to the right of j
-                                                y_coord[j] + y_dim[j] <= y_coord[i]))   # i above j
-
-            
-            # CUMULATIVE CONSTRAINT
-            cumulative_y = cumulative_const(y_coord, y_dim, x_dim, w) #(start, duration, resources, total): asse temporale e' y
-            #cumulative_x = cumulative_const(x_coord, x_dim, y_dim, sum(y_dim))
-
-
-            # SYMMETRY BREAKING CONSTRAINT
-            if sym_break:
-
-                # find the indexes of the 2 largest pieces
-                circuits_area = [x_dim[i] * y_dim[i] for i in range(n_circuit)]
-
-                first_max = np.argsort(circuits_area)[-1]
-                second_max = np.argsort(circuits_area)[-2]
-                
-                # the biggest circuit is always placed for first w.r.t. the second biggest one
-                sb_biggest_lex_less = Or(x_coord[first_max] < x_coord[second_max],
-                                        And(x_coord[first_max] == x_coord[second_max], y_coord[first_max] <= y_coord[second_max])
-                                        )
-                
-                # width maggiore -> coord y < h/2
-                # height maggiore -> coord x < w/2
-                sb_biggest_in_first_quadrande = And(x_coord[first_max] < w/2, y_coord[first_max] < min_height/2)
-
-                # add constraint
-                optimizer.add(sb_biggest_in_first_quadrande)
-                optimizer.add(sb_biggest_lex_less)
-
-
-            # assert constraints as background axioms for the optimize solver
-            optimizer.add(boundary_x + boundary_x + bound_zero_x + bound_zero_y + non_overlap_const + cumulative_y)
-            
-            # objective function to minimize
-            optimizer.minimize(min_height)
-
-            # set optimizer timer
-            timeout = 300000        #10000 # 10 secondi       #300000 #300.000 millisecondi -> 5 minuti
-            optimizer.set('timeout', timeout)
-
-            # set printable timer
-            start_time = timer()
-            
-            # array for the solution coordinate
-            x_coord_sol = []
-            y_coord_sol = []
-
-            # solution found
-            if optimizer.check() == sat:
-                
-                # save the execution time
-                end_time = timer() - start_time
-
-                model = optimizer.model()
-                
-                # get solution for the coord variable
-                for i in range(n_circuit):
-                    x_coord_sol.append(model.evaluate(x_coord[i]).as_long()) # type z3.IntNumRef -> to int
-                    y_coord_sol.append(model.evaluate(y_coord[i]).as_long())
-                
-                # get minimized height
-                min_height_sol = model.evaluate(min_height).as_long()
-
-                print(f'Instance: {instance}\tExecution time: {(end_time):.03f}s\t\t\tBest objective value: {min_height_sol}')
-
-                # results with sym breaking constraint
-                if sym_break:
-                    write_solution(instance, w, min_height_sol, n_circuit, x_dim, y_dim, x_coord_sol, y_coord_sol, sym_break)
-                    plot_solution(instance, w, min_height_sol, n_circuit, x_dim, y_dim, x_coord_sol, y_coord_sol, sym_break)
-                # results w/o sym breaking constraint
-                else:
-                    write_solution(instance, w, min_height_sol, n_circuit, x_dim, y_dim, x_coord_sol, y_coord_sol)
-                    plot_solution(instance, w, min_height_sol, n_circuit, x_dim, y_dim, x_coord_sol, y_coord_sol)
-
-            # solution not found
-            else:
-                end_time = timer() - start_time     # save the execution time
-                print(f'Instance: {instance}\tTime exceeded\tExecution time: {(end_time):.03f}s')
-
-        ##############
-        ## ROTATION ##
-        ##############
+    w, n_circuit, x_dim, y_dim = read_instance(instance)
+    if encoding == 'auto':
+        encoding = 'order' if n_circuit >= ORDER_MIN_CIRCUITS else 'lia'
+
+    # set optimizer timer
+    timeout = 300000        #10000 # 10 secondi       #300000 #300.000 millisecondi -> 5 minuti
+
+    result = {'instance': instance, 'h': None, 'time': None, 'optimal': False, 'lower': None}
+    trace = []  # time and height of each improving solution
+
+    # best lower bound of the height (area, tallest circuit, stacked wide circuits, dual feasible functions)
+    lower = lower_bound(w, x_dim, y_dim, rotation)
+
+    if warm_start:
+        # the height of the layout found by the skyline heuristic is an upper bound of the optimal one
+        heuristic_start = timer()
+        h_heuristic, x_heuristic, y_heuristic, w_heuristic, l_heuristic = skyline_packing(w, x_dim, y_dim, rotation)
+        h_ub = h_heuristic if h_ub is None else min(h_ub, h_heuristic)
+
+        # the layout of the heuristic meets the lower bound: it is optimal and the solver is not needed
+        if h_heuristic <= lower:
+            end_time = timer() - heuristic_start
+            trace.append((end_time, h_heuristic))
+            print(f'Instance: {instance}\tExecution time: {(end_time):.03f}s\t\t\tBest objective value: {h_heuristic} (heuristic)')
+            result.update(h=h_heuristic, time=end_time, optimal=True, lower=lower, first_time=end_time, trace=trace)
+            write_solution(instance, w, h_heuristic, n_circuit, w_heuristic, l_heuristic, x_heuristic, y_heuristic, sym_break, rotation=rotation)
+            if plot:
+                plot_solution(instance, w, h_heuristic, n_circuit, w_heuristic, l_heuristic, x_heuristic, y_heuristic, sym_break, rotation=rotation)
+            log_run('../SMT/out/metrics.jsonl', 'z3', instance, {'sym_break': sym_break, 'rotation': rotation, 'mode': mode, 'warm_start': warm_start, 'cumulative': cumulative, 'encoding': encoding},
+                    h_heuristic, lower, True, build_time=0, solve_time=end_time, trace=trace)
+            return result
+
+    # height of all the circuits stacked, the upper bound of the height search
+    upper = sum([(x_dim[i] if rotation and x_dim[i] > y_dim[i] else y_dim[i]) for i in range(n_circuit)])
+    if h_ub is not None:
+        upper = h_ub
+
+    build_start = timer()
+    pre = preprocess(w, x_dim, y_dim, rotation, upper)  # reductions of the instance, shared by the encodings
+    if encoding == 'order':
+        # no objective in a propositional model: the height is always searched, bottom-up unless bisection is asked
+        constraints, at_most, decode = build_order(w, n_circuit, x_dim, y_dim, upper, sym_break, rotation, pre)
+
+        # set printable timer
+        start_time = timer()
+        model, lower, statistics = height_search(constraints, None, lower, upper, mode == 'bisection', timeout, shared_h, trace,
+                                                 solver=SolverFor('QF_FD'), at_most=at_most, height_of=lambda m: decode(m)[3])
+    elif mode == 'optimize':
+        constraints, x_coord, y_coord, rotation_c, min_height = build_constraints(w, n_circuit, x_dim, y_dim, None, sym_break, rotation, cumulative, encoding, pre)
+
+        # OPTIMIZER
+        optimizer = Optimize()
+
+        # assert constraints as background axioms for the optimize solver
+        optimizer.add(constraints)
+        optimizer.add(min_height >= lower)     # the optimizer stops as soon as a layout meets the bound
+        if h_ub is not None:
+            optimizer.add(min_height <= h_ub)
+
+        # objective function to minimize
+        optimizer.minimize(min_height)
+        optimizer.set('timeout', timeout)
+
+        # set printable timer
+        start_time = timer()
+
+        # keep the last improving model, which is the best layout found when the time is exceeded
+        last_model = []
+        def on_model(m):
+            trace.append((timer() - start_time, m.evaluate(min_height).as_long()))
+            last_model[:] = [m]
+        optimizer.set_on_model(on_model)
+
+        # the optimizer answers sat only once the optimum has been found
+        if optimizer.check() == sat:
+            model = optimizer.model()
+            lower = model.evaluate(min_height).as_long()
         else:
-            # initialization of coordinate variables
-            x_coord = IntVector('x', n_circuit) 
-            y_coord = IntVector('y', n_circuit)
-
-            # array of booleans, each one telling if the corresponding chip is rotated or not
-            rotation_c = BoolVector('r', n_circuit)
-
-
-            # height that is going to be minimized from the optimizer
-            min_height = max([ If(rotation_c[i], x_dim[i], y_dim[i]) + y_coord[i] for i in range(n_circuit)])
-
-            # OPTIMIZER
-            optimizer = Optimize()
-
-            # BOUNDS CONSTRAINT - set the boundary of the plate
-            boundary_x =[]
-            boundary_y =[]
-
-            bound_zero_x = []
-            bound_zero_y = []
-
-            for i in range(n_circuit):
-                # each coord var has the value >= 0
-                bound_zero_x.append(x_coord[i] >= 0)
-                bound_zero_y.append(y_coord[i] >= 0)
-                
-                # each circuit is positioned inside the limit of the plate (width and height to be minimized)
-                boundary_x.append(x_coord[i] + If(rotation_c[i], y_dim[i], x_dim[i]) <= w)
-                boundary_y.append(y_coord[i] + If(rotation_c[i], x_dim[i], y_dim[i]) <= min_height)
-                        
-            
-            # NON OVERLAPPING CONSTRAINT
-            non_overlap_const = []
-
-            for i in range(n_circuit):
-                for j in range(i+1, n_circuit): # from i+1 if i and j are the same block the comparison is useless
-                    non_overlap_const.append( Or(x_coord[i] + If(rotation_c[i], y_dim[i], x_dim[i]) <= x_coord[j],  # i to the left of j
-                                                 x_coord[j] + If(rotation_c[j], y_dim[j], x_dim[j]) <= x_coord[i],  # i below j
-                                                 y_coord[i] + If(rotation_c[i], x_dim[i], y_dim[i]) <= y_coord[j],  # i to the right of j
-                                                 y_coord[j] + If(rotation_c[j], x_dim[j], y_dim[j]) <= y_coord[i])) # i above j
-
-
-            # CUMULATIVE CONSTRAINT
-            cumulative_x = cumulative_const(y_coord,
-                                            [If(rotation_c[i], x_dim[i], y_dim[i]) for i in range(n_circuit)], 
-                                            [If(rotation_c[i], y_dim[i], x_dim[i]) for i in range(n_circuit)], 
-                                            w
-                                           )
-
-            # cumulative_y = cumulative_const(x_coord, 
-            #                                 [If(rotation_c[i], y_dim[i], x_dim[i]) for i in range(n_circuit)],
-            #                                 [If(rotation_c[i], x_dim[i], y_dim[i]) for i in range(n_circuit)],
-            #                                 sum([If(rotation_c[i], x_dim[i], y_dim[i]) for i in range(n_circuit)]) # sum(y_dim)
-            #                                )
-            
-            # SQUARE CONSTRAINT -  squared circuits do not need to rotate
-            square_check = [Implies(x_dim[i]==y_dim[i], rotation_c[i]==False) for i in range(n_circuit)]
-
-
-                        # SYMMETRY BREAKING CONSTRAINT
-            if sym_break:
-
-                # find the indexes of the 2 largest pieces
-                circuits_area = [x_dim[i] * y_dim[i] for i in range(n_circuit)]
-
-                first_max = np.argsort(circuits_area)[-1]
-                second_max = np.argsort(circuits_area)[-2]
-                
-                # the biggest circuit is always placed for first w.r.t. the second biggest one
-                sb_biggest_lex_less = Or(x_coord[first_max] < x_coord[second_max],
-                                        And(x_coord[first_max] == x_coord[second_max], y_coord[first_max] <= y_coord[second_max])
-                                      )
-                
-                # width maggiore -> coord y < h/2
-                # height maggiore -> coord x < w/2
-                sb_biggest_in_first_quadrande = And(x_coord[first_max] < w/2, y_coord[first_max] < min_height/2)
-
-                # add constraint
-                optimizer.add(sb_biggest_in_first_quadrande)
-                optimizer.add(sb_biggest_lex_less)
-
-
-            # assert constraints as background axioms for the optimize solver
-            optimizer.add(boundary_x + boundary_x + bound_zero_x + bound_zero_y + non_overlap_const + cumulative_x + square_check)
-            
-            # objective function to minimize
-            optimizer.minimize(min_height)
-
-            # set optimizer timer
-            timeout = 300000        #10000 # 10 secondi       #300000 #300.000 millisecondi -> 5 minuti
-            optimizer.set('timeout', timeout)
-
-            # set printable timer
-            start_time = timer()
-            
-            # array for the solution coordinate
-            x_coord_sol = []
-            y_coord_sol = []
-
-            # solution found
-            if optimizer.check() == sat:
-                
-                # save the execution time
-                end_time = timer() - start_time
-
-                model = optimizer.model()
-                
-                # get solution for the coord variable
-                for i in range(n_circuit):
-                    x_coord_sol.append(model.evaluate(x_coord[i]).as_long()) # type z3.IntNumRef -> to int
-                    y_coord_sol.append(model.evaluate(y_coord[i]).as_long())
-                
-                # get minimized height
-                min_height_sol = model.evaluate(min_height).as_long()
-
-                print(f'Instance: {instance}\tExecution time: {(end_time):.03f}s\t\t\tBest objective value: {min_height_sol}')  
-
-                # takes real dimension of the chips
-                # model_completion=True -> a default interpretation is automatically added for symbols that do not have an interpretation
-                x_dim_new = [(y_dim[i] if bool(model.evaluate(rotation_c[i], model_completion=True)) else x_dim[i]) for i in range(n_circuit)]
-                y_dim_new = [(x_dim[i] if bool(model.evaluate(rotation_c[i], model_completion=True)) else y_dim[i]) for i in range(n_circuit)]
-
-                # results with sym breaking constraint
-                if sym_break:
-                    write_solution(instance, w, min_height_sol, n_circuit, x_dim_new, y_dim_new, x_coord_sol, y_coord_sol, sym_break, rotation=rotation)
-                    plot_solution(instance, w, min_height_sol, n_circuit, x_dim_new, y_dim_new, x_coord_sol, y_coord_sol, sym_break, rotation=rotation)
-                # results w/o sym breaking constraint
-                else:
-                    write_solution(instance, w, min_height_sol, n_circuit, x_dim_new, y_dim_new, x_coord_sol, y_coord_sol, rotation=rotation)
-                    plot_solution(instance, w, min_height_sol, n_circuit, x_dim_new, y_dim_new, x_coord_sol, y_coord_sol, rotation=rotation)
-
-            # solution not found
-            else:
-                end_time = timer() - start_time     # save the execution time
-                print(f'Instance: {instance}\tTime exceeded\tExecution time: {(end_time):.03f}s')
+            model = last_model[0] if last_model else None
+        statistics = optimizer.statistics()
+    else:
+        # fixed height, searched between the lower bound and the height of all the circuits stacked
+        min_height = int_vars(['h'], encoding, bv_width(w, x_dim, y_dim, rotation))[0]
+        constraints, x_coord, y_coord, rotation_c, _ = build_constraints(w, n_circuit, x_dim, y_dim, min_height, sym_break, rotation, cumulative, encoding, pre)
+
+        # set printable timer
+        start_time = timer()
+        model, lower, statistics = height_search(constraints, min_height, lower, upper, mode == 'bisection', timeout, shared_h, trace,
+                                                 height_of=lambda m: layout_top(m, y_coord, x_dim, y_dim, rotation_c))
+
+    # save the execution time
+    end_time = timer() - start_time
+    build_time = start_time - build_start
+
+    # solution found
+    if model is not None:
+
+        if encoding == 'order':
+            x_coord_sol, y_coord_sol, rotated, min_height_sol = decode(model)
+        else:
+            # get solution for the coord variable
+            x_coord_sol = [model.evaluate(x_coord[i]).as_long() for i in range(n_circuit)] # type z3.IntNumRef -> to int
+            y_coord_sol = [model.evaluate(y_coord[i]).as_long() for i in range(n_circuit)]
+
+            # height of the layout (the top of the circuits, which the height variable of the search may exceed)
+            min_height_sol = layout_top(model, y_coord, x_dim, y_dim, rotation_c)
+
+            # model_completion=True -> a default interpretation is automatically added for symbols that do not have an interpretation
+            rotated = [rotation and is_true(model.evaluate(rotation_c[i], model_completion=True)) for i in range(n_circuit)]
+
+        # optimal once every lower height has been proven infeasible
+        optimal = lower >= min_height_sol
+
+        print(f'Instance: {instance}\tExecution time: {(end_time):.03f}s\t\t\tBest objective value: {min_height_sol}{"" if optimal else " (not optimal)"}\tLower bound: {lower}')
+        result.update(h=min_height_sol, time=end_time, optimal=optimal, lower=lower, first_time=trace[0][0], trace=trace)
+
+        # takes real dimension of the chips
+        x_dim_new = [(y_dim[i] if rotated[i] else x_dim[i]) for i in range(n_circuit)]
+        y_dim_new = [(x_dim[i] if rotated[i] else y_dim[i]) for i in range(n_circuit)]
+
+        write_solution(instance, w, min_height_sol, n_circuit, x_dim_new, y_dim_new, x_coord_sol, y_coord_sol, sym_break, rotation=rotation)
+        if plot:
+            plot_solution(instance, w, min_height_sol, n_circuit, x_dim_new, y_dim_new, x_coord_sol, y_coord_sol, sym_break, rotation=rotation)
+
+    # nothing found below the height of the heuristic: its layout is the best one in hand
+    elif warm_start:
+        optimal = lower >= h_heuristic
+        print(f'Instance: {instance}\tExecution time: {(end_time):.03f}s\t\t\tBest objective value: {h_heuristic} (heuristic{"" if optimal else ", not optimal"})\tLower bound: {lower}')
+        trace.append((0, h_heuristic))
+        result.update(h=h_heuristic, time=end_time, optimal=optimal, lower=lower, first_time=0, trace=trace)
+        write_solution(instance, w, h_heuristic, n_circuit, w_heuristic, l_heuristic, x_heuristic, y_heuristic, sym_break, rotation=rotation)
+        if plot:
+            plot_solution(instance, w, h_heuristic, n_circuit, w_heuristic, l_heuristic, x_heuristic, y_heuristic, sym_break, rotation=rotation)
+
+    # solution not found
+    else:
+        print(f'Instance: {instance}\tTime exceeded\tExecution time: {(end_time):.03f}s\tLower bound: {lower}')
+        result.update(time=end_time, lower=lower)
+
+    stats = {k: statistics.get_key_value(k) for k in statistics.keys()}
+    log_run('../SMT/out/metrics.jsonl', 'z3', instance, {'sym_break': sym_break, 'rotation': rotation, 'mode': mode, 'warm_start': warm_start, 'cumulative': cumulative, 'encoding': encoding},
+            result['h'], result['lower'], result['optimal'], build_time=build_time, solve_time=end_time,
+            conflicts=stats.get('conflicts'), stats=stats, trace=trace)
+
+    return result
+
+
+def smt_exec(first_i, last_i, sym_break, rotation, plot, mode='optimize', warm_start=False, jobs=1, cores=None, cumulative='resource', encoding='lia'):
+    instances = range(first_i, last_i+1)
+
+    if jobs == 1:
+        for instance in instances:
+            smt_solve(instance, sym_break, rotation, plot, mode, warm_start, cumulative=cumulative, encoding=encoding)
+    else:
+        # solve the instances in parallel, killing the workers that go beyond the time limit
+        kwargs = {'sym_break': sym_break, 'rotation': rotation, 'plot': plot, 'mode': mode, 'warm_start': warm_start, 'cumulative': cumulative, 'encoding': encoding}
+        for instance, result, error in run_instances(smt_solve, instances, kwargs, jobs=jobs, cores=cores, timeout=330):
+            if error is not None:
+                print(f'Instance: {instance}\t{error}')
 
 
 
@@ -390,6 +579,12 @@ if __name__ == '__main__':
     parser.add_argument('-sb', '--sym_break', help='Allow symmetry breaking constraints', action='store_true')
     parser.add_argument('-r', '--rotation', help='Allow rotation', action='store_true')
     parser.add_argument('-p', '--plot', help='Plot solution', action='store_true')
+    parser.add_argument('-m', '--mode', help='Search of the height: optimize, incremental (bottom-up) or bisection', type=str, default='optimize', choices=['optimize', 'incremental', 'bisection'])
+    parser.add_argument('-ws', '--warm_start', help='Bound the height with the layout of the skyline heuristic', action='store_true')
+    parser.add_argument('-j', '--jobs', help='Number of instances solved in parallel', type=int, default=1)
+    parser.add_argument('-c', '--cores', help='Number of cores shared by the parallel jobs', type=int, default=None)
+    parser.add_argument('-cu', '--cumulative', help='Encoding of the cumulative constraint', type=str, default='resource', choices=CUMULATIVE)
+    parser.add_argument('-en', '--encoding', help='Encoding of the model: integers, bit-vectors or order encoding', type=str, default='lia', choices=ENCODINGS)
     args = parser.parse_args()
 
-    smt_exec(first_i=args.first, last_i=args.last, sym_break=args.sym_break, rotation=args.rotation, plot=args.plot)
+    smt_exec(first_i=args.first, last_i=args.last, sym_break=args.sym_break, rotation=args.rotation, plot=args.plot, mode=args.mode, warm_start=args.warm_start, jobs=args.jobs, cores=args.cores, cumulative=args.cumulative, encoding=args.encoding)
@@ -0,0 +1,85 @@
+import sys
+import csv
+import argparse
+from pathlib import Path
+from z3 import Int
+
+sys.path.append(str(Path(__file__).resolve().parents[2]))  # repository root, where the shared modules live
+from common.runner import run_instances
+from SMT import CUMULATIVE, read_instance, build_constraints, smt_solve
+
+
+# COMPARISON OF THE CUMULATIVE ENCODINGS
+# For each instance and each encoding of the cumulative constraint, the size of the model (number of
+# constraints and number of distinct terms) and the solve time are written to a CSV file.
+
+FIELDS = ['instance', 'cumulative', 'constraints', 'terms', 'h', 'optimal', 'time', 'error']
+
+
+# number of distinct terms of the constraints, shared subterms counted once
+def count_terms(constraints):
+    seen = set()
+    stack = list(constraints)
+    while stack:
+        term = stack.pop()
+        if term.get_id() not in seen:
+            seen.add(term.get_id())
+            stack.extend(term.children())
+    return len(seen)
+
+
+def model_size(instance, cumulative, sym_break=False, rotation=False):
+    w, n_circuit, x_dim, y_dim = read_instance(instance)
+    constraints = build_constraints(w, n_circuit, x_dim, y_dim, Int('h'), sym_break, rotation, cumulative)[0]
+    return len(constraints), count_terms(constraints)
+
+
+def compare_task(job, threads=1, sym_break=False, rotation=False, mode='incremental'):
+    instance, cumulative = job
+    return smt_solve(instance, sym_break, rotation, False, mode, cumulative=cumulative)
+
+
+def compare(instances, encodings, out_path, sym_break=False, rotation=False, mode='incremental', jobs=1, timeout=330):
+    rows = {}
+    for instance in instances:
+        for cumulative in encodings:
+            constraints, terms = model_size(instance, cumulative, sym_break, rotation)
+            rows[instance, cumulative] = {'instance': instance, 'cumulative': cumulative, 'constraints': constraints, 'terms': terms}
+
+    kwargs = {'sym_break': sym_break, 'rotation': rotation, 'mode': mode}
+    for job, result, error in run_instances(compare_task, list(rows), kwargs, jobs=jobs, timeout=timeout):
+        row = rows[job]
+        row['error'] = error
+        if result is not None:
+            row.update(h=result['h'], optimal=result['optimal'], time=result['time'])
+
+    with open(out_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(rows.values())
+
+    # summary: instances solved to optimality, their total time and the average model size
+    for cumulative in encodings:
+        runs = [row for row in rows.values() if row['cumulative'] == cumulative]
+        solved = [row for row in runs if row.get('optimal')]
+        print(f'Encoding: {cumulative}\tOptimal: {len(solved)}/{len(runs)}\tTime: {sum(row["time"] for row in solved):.03f}s'
+              f'\tConstraints: {sum(row["constraints"] for row in runs) / len(runs):.0f}\tTerms: {sum(row["terms"] for row in runs) / len(runs):.0f}')
+
+    return list(rows.values())
+
+
+# python src/compare_cumulative.py -f 1 -l 40 -j 4
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-f', '--first', help='Number of first instance', type=int, default=1)
+    parser.add_argument('-l', '--last', help='Number of last instance', type=int, default=40)
+    parser.add_argument('-e', '--encodings', help='Encodings of the cumulative constraint to compare', nargs='+', default=CUMULATIVE, choices=CUMULATIVE)
+    parser.add_argument('-sb', '--sym_break', help='Allow symmetry breaking constraints', action='store_true')
+    parser.add_argument('-r', '--rotation', help='Allow rotation', action='store_true')
+    parser.add_argument('-m', '--mode', help='Search of the height', type=str, default='incremental', choices=['optimize', 'incremental', 'bisection'])
+    parser.add_argument('-j', '--jobs', help='Number of runs in parallel', type=int, default=1)
+    parser.add_argument('-t', '--timeout', help='Seconds after which a run is killed', type=int, default=330)
+    parser.add_argument('-o', '--out', help='CSV file of the comparison', type=str, default='../SMT/out/cumulative.csv')
+    args = parser.parse_args()
+
+    compare(range(args.first, args.last+1), args.encodings, args.out, args.sym_break, args.rotation, args.mode, args.jobs, args.timeout)
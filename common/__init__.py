@@ -0,0 +1 @@
+# Shared modules used by the CP, SMT and MIP scripts
@@ -0,0 +1,111 @@
+import sys
+import csv
+import json
+import argparse
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]  # repository root
+sys.path.append(str(ROOT))
+from common.runner import run_instances
+from common.generator import generate
+from common.engines import ENGINES, run_engine
+
+
+# BENCHMARK
+# Every engine is run on generated instances of growing size, whose optimal height is known by construction.
+# For each run the benchmark records the time to the first solution, the time to the optimal height and
+# the final gap, and writes them as JSON and CSV so that scaling curves and regressions can be computed.
+
+FIELDS = ['engine', 'instance', 'w', 'n', 'seed', 'h_opt', 'h', 'lower', 'optimal', 'time', 'first_time', 'optimal_time', 'gap', 'error']
+
+
+def bench_task(job, threads=1, sym_break=False, rotation=False):
+    engine, path = job
+    return run_engine(engine, path, sym_break, rotation, threads=threads)
+
+
+# build the record of a run from the result of the engine
+def record(engine, path, w, n, seed, h_opt, result, error):
+    row = dict.fromkeys(FIELDS)
+    row.update(engine=engine, instance=path.name, w=w, n=n, seed=seed, h_opt=h_opt, error=error)
+    if result is not None:
+        h = result['h']
+        row.update(h=h, lower=result.get('lower'), optimal=result['optimal'], time=result['time'])
+        if h is not None:
+            # without intermediate solutions the first solution is the final one
+            row['first_time'] = result.get('first_time', result['time'])
+            # time at which the optimal height was first reached, before proving it (the end of the run without a trace)
+            reached = [t for t, trace_h in result.get('trace') or [] if trace_h == h_opt]
+            row['optimal_time'] = (reached[0] if reached else result['time']) if h == h_opt else None
+            row['gap'] = (h - h_opt) / h_opt
+    return row
+
+
+def write_results(rows, out_dir):
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    with open(out_dir / 'results.json', 'w') as f:
+        json.dump(rows, f, indent=1)
+    with open(out_dir / 'results.csv', 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+# compare with the results of a previous benchmark: a run is a regression when its height got worse
+# or when it does not reach the optimum anymore
+def regressions(rows, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {(r['engine'], r['instance']): r for r in json.load(f)}
+
+    found = []
+    for row in rows:
+        old = baseline.get((row['engine'], row['instance']))
+        if old is None or old['h'] is None:
+            continue
+        if row['h'] is None or row['h'] > old['h'] or (old['optimal_time'] is not None and row['optimal_time'] is None):
+            found.append((row, old))
+    return found
+
+
+def benchmark(engines, sizes, w, seeds, out_dir, jobs=1, cores=None, timeout=330, sym_break=False, rotation=False):
+    # generate the instances, with their optimal height
+    instances = {}
+    for n in sizes:
+        for seed in seeds:
+            path, h_opt = generate(Path(out_dir) / 'instances', w, n, seed)
+            instances[path] = (n, seed, h_opt)
+
+    jobs_list = [(engine, path) for path in instances for engine in engines]
+    kwargs = {'sym_break': sym_break, 'rotation': rotation}
+    rows = []
+    for (engine, path), result, error in run_instances(bench_task, jobs_list, kwargs, jobs=jobs, cores=cores, timeout=timeout):
+        n, seed, h_opt = instances[path]
+        rows.append(record(engine, path, w, n, seed, h_opt, result, error))
+        print(f"Engine: {engine}\tn: {n}\tseed: {seed}\theight: {rows[-1]['h']} (optimal {h_opt})\ttime: {rows[-1]['time']}")
+
+    rows.sort(key=lambda r: (r['engine'], r['n'], r['seed']))
+    write_results(rows, out_dir)
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-e', '--engines', help='Engines to benchmark', nargs='+', default=ENGINES, choices=ENGINES)
+    parser.add_argument('-n', '--circuits', help='Numbers of circuits of the instances', type=int, nargs='+', default=[10, 20, 50, 100, 200, 500])
+    parser.add_argument('-w', '--width', help='Width of the plate', type=int, default=40)
+    parser.add_argument('-s', '--seeds', help='Seeds of the instances', type=int, nargs='+', default=[0])
+    parser.add_argument('-sb', '--sym_break', help='Allow symmetry breaking constraints', action='store_true')
+    parser.add_argument('-r', '--rotation', help='Allow rotation', action='store_true')
+    parser.add_argument('-j', '--jobs', help='Number of runs in parallel', type=int, default=1)
+    parser.add_argument('-c', '--cores', help='Number of cores shared by the parallel runs', type=int, default=None)
+    parser.add_argument('-o', '--out_dir', help='Folder of the instances and of the results', type=str, default='benchmark')
+    parser.add_argument('-b', '--baseline', help='results.json of a previous benchmark to compare with', type=str, default=None)
+    args = parser.parse_args()
+
+    rows = benchmark(args.engines, args.circuits, args.width, args.seeds, args.out_dir, args.jobs, args.cores,
+                     sym_break=args.sym_break, rotation=args.rotation)
+
+    if args.baseline is not None:
+        for row, old in regressions(rows, args.baseline):
+            print(f"REGRESSION\tEngine: {row['engine']}\tInstance: {row['instance']}\theight: {row['h']} (was {old['h']})")
@@ -0,0 +1,103 @@
+import sys
+import math
+import argparse
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # repository root
+from common.instances import load_instance
+from common.heuristic import skyline_packing
+from common.preprocess import preprocess
+
+
+# LOWER BOUNDS OF THE HEIGHT
+# Every horizontal line of the plate crosses circuits whose widths sum up to at most w. The bounds below
+# relax the problem in different ways and the best one is the lower end of the height domain of the models:
+# - area:    the area of the circuits over the width of the plate
+# - tallest: the height of the tallest circuit
+# - wide:    circuits that pairwise cannot sit side by side are stacked, hence their heights add up
+# - dff:     area bound after transforming the widths with dual feasible functions, which map any set of
+#            widths fitting in w to a set fitting in the transformed w, so that the bound stays valid
+# The widths crossed by a line are a subset sum of the widths of the circuits: with the DP the plate is
+# narrowed to the largest subset sum not exceeding w, which tightens the area and dff bounds.
+
+DFF_K = 10  # largest parameter of the dual feasible functions of Fekete and Schepers
+
+
+# largest sum of widths of distinct circuits not exceeding w, by a subset-sum DP over a bitset
+# (with rotation a circuit contributes either side)
+def effective_width(w, sides):
+    mask = (1 << (w + 1)) - 1
+    reachable = 1
+    for options in sides:
+        shifted = 0
+        for side in set(options):
+            shifted |= reachable << side
+        reachable = (reachable | shifted) & mask
+    return reachable.bit_length() - 1
+
+
+# dual feasible functions u: [0, w] -> [0, u(w)] as (function, u(w)), scaled to integers
+def dual_feasible_functions(w, widths):
+    functions = []
+    for k in range(1, DFF_K + 1):
+        # u(x) = x if (k+1) x / w is an integer, floor((k+1) x / w) w / k otherwise, scaled by k (hence u(w) = w k)
+        functions.append((lambda v, k=k: v * k if (k + 1) * v % w == 0 else (k + 1) * v // w * w, w * k))
+    for eps in sorted(set(v for v in widths if v <= w // 2)):
+        # the widths larger than w - eps fill the plate, the ones smaller than eps vanish
+        functions.append((lambda v, eps=eps: w if v > w - eps else (v if v >= eps else 0), w))
+    return functions
+
+
+# w:        width of the plate
+# x, y:     horizontal and vertical dimensions of the circuits
+# rotation: whether the circuits can be rotated
+# dp:       narrow the plate to the largest subset sum of the widths
+#
+# returns a dictionary with the value of each bound
+def height_bounds(w, x, y, rotation=False, dp=True):
+    n = len(x)
+    x = [int(v) for v in x]
+    y = [int(v) for v in y]
+    pre = preprocess(w, x, y, rotation)
+    w_min, l_min = pre['w_min'], pre['l_min']
+
+    # orientations each circuit can take, as (width, height)
+    sides = [[(x[i], y[i]), (y[i], x[i])] if rotation and i not in pre['orientation'] else [(w_min[i], l_min[i])] for i in range(n)]
+    if dp:
+        w = effective_width(w, [[width for width, _ in options] for options in sides])
+
+    bounds = {'area': math.ceil(sum(x[i] * y[i] for i in range(n)) / w), 'tallest': max(l_min)}
+
+    # the circuits wider than half of the plate are stacked, together with at most one of the other ones
+    # that cannot sit beside any of them
+    wide = [i for i in range(n) if 2 * w_min[i] > w]
+    beside = [l_min[j] for j in range(n) if j not in wide and all(w_min[i] + w_min[j] > w for i in wide)]
+    bounds['wide'] = sum(l_min[i] for i in wide) + max(beside, default=0)
+
+    bounds['dff'] = max(math.ceil(sum(min(u(width) * height for width, height in options) for options in sides) / u_w)
+                        for u, u_w in dual_feasible_functions(w, w_min))
+    return bounds
+
+
+# best lower bound of the height
+def lower_bound(w, x, y, rotation=False, dp=True):
+    return max(height_bounds(w, x, y, rotation, dp).values())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-f', '--first', help='Number of first instance', type=int, default=1)
+    parser.add_argument('-l', '--last', help='Number of last instance', type=int, default=40)
+    parser.add_argument('-r', '--rotation', help='Allow rotation', action='store_true')
+    parser.add_argument('-nd', '--no_dp', help='Do not narrow the plate by the subset-sum DP', action='store_true')
+    args = parser.parse_args()
+
+    # the bounds of each instance next to the height of the skyline heuristic: when they meet, the
+    # layout of the heuristic is optimal and no solver is needed
+    for instance in range(args.first, args.last+1):
+        w, n, dims = load_instance(instance)
+        bounds = height_bounds(w, dims[:, 0], dims[:, 1], args.rotation, not args.no_dp)
+        lower = max(bounds.values())
+        h_heuristic = skyline_packing(w, dims[:, 0], dims[:, 1], args.rotation)[0]
+        print(f'Instance: {instance}\t' + '\t'.join(f'{name}: {value}' for name, value in bounds.items())
+              + f'\tLower bound: {lower}\tHeuristic: {h_heuristic}{" (optimal)" if h_heuristic <= lower else ""}')
@@ -0,0 +1,87 @@
+import os
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]  # repository root
+sys.path.append(str(ROOT))
+from common.instances import instance_name
+
+
+# ENGINES
+# Entry point shared by the tools that run the engines of the four paradigms in worker processes
+# (portfolio, benchmark): the scripts use paths relative to their paradigm folder, hence the worker
+# moves there before importing and running the engine.
+
+ENGINES = ['chuffed', 'gecode', 'smt', 'mip', 'bb']
+PARADIGMS = {'chuffed': 'CP', 'gecode': 'CP', 'smt': 'SMT', 'mip': 'MIP', 'bb': 'BB'}
+
+
+# make the scripts of the paradigm importable (once, since a worker may run many instances)
+def add_source(paradigm):
+    source = str(ROOT / paradigm / 'src')
+    if source not in sys.path:
+        sys.path.append(source)
+
+
+# import the engine and create its solver handles (the MiniZinc solver, the Gurobi environment), so that a
+# long-running worker pays for them once, before its first instance
+def load_engine(engine):
+    paradigm = PARADIGMS[engine]
+    add_source(paradigm)
+    if paradigm == 'CP':
+        from cp_exec import lookup_solver
+        lookup_solver(engine)
+    elif paradigm == 'SMT':
+        import SMT
+    elif paradigm == 'MIP':
+        from exec_MIP import gurobi_env
+        gurobi_env()
+    else:
+        import bb_exec
+
+
+# out file where the engine writes the layout of the instance, relative to the repository root
+def solution_path(engine, instance, sym_break=False, rotation=False):
+    name = 'out-' + instance_name(instance) + f"{'_rotation' if rotation else ''}.txt"
+    paradigm = PARADIGMS[engine]
+    if paradigm == 'CP':
+        return Path('CP/out') / engine / ('w_sym_break' if sym_break else 'wout_sym_break') / name
+    elif paradigm == 'SMT':
+        return Path('SMT/out') / ('w_sym_break' if sym_break else 'wout_sym_break') / name
+    elif paradigm == 'MIP':
+        return Path('MIP/out') / ('rotation' if rotation else 'no_rotation') / name
+    else:
+        return Path('BB/out') / name
+
+
+# publish the height of a new layout to the other engines of the portfolio: shared_h holds the best height
+# found so far by any of them, hence it only decreases
+def share_height(shared_h, h):
+    if shared_h is None:
+        return
+    with shared_h.get_lock():
+        shared_h.value = min(shared_h.value, int(h))
+
+
+# solve the instance with the engine, returning its result dictionary
+# (the layout start, as (h, x_coord, y_coord, widths, lengths), is the initial incumbent of MIP; the other engines
+# only use its height as upper bound, given by h_ub; symmetry is the Symmetry parameter of Gurobi)
+def run_engine(engine, instance, sym_break=False, rotation=False, plot=False, h_ub=None, shared_h=None, threads=1, start=None, symmetry=-1):
+    paradigm = PARADIGMS[engine]
+    if not isinstance(instance, int):
+        instance = Path(instance).resolve()    # instance file given by a path relative to the caller's folder
+    os.chdir(ROOT / paradigm)
+    add_source(paradigm)
+
+    if paradigm == 'CP':
+        from cp_exec import cp_solve
+        return cp_solve(instance, engine, sym_break, rotation, plot, h_ub=h_ub, shared_h=shared_h, threads=threads)
+    elif paradigm == 'SMT':
+        from SMT import smt_solve
+        return smt_solve(instance, sym_break, rotation, plot, mode='incremental', h_ub=h_ub, shared_h=shared_h, threads=threads)
+    elif paradigm == 'MIP':
+        from exec_MIP import mip_solve
+        return mip_solve(instance, rotation, plot, h_ub=h_ub, shared_h=shared_h, threads=threads, sym_break=sym_break, start=start, symmetry=symmetry)
+    else:
+        from bb_exec import bb_solve
+        return bb_solve(instance, rotation, plot, h_ub=h_ub, shared_h=shared_h, threads=threads)
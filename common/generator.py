@@ -0,0 +1,87 @@
+import argparse
+import math
+from pathlib import Path
+import numpy as np
+
+
+# INSTANCE GENERATOR
+# A w X h plate is cut recursively with guillotine cuts until there are n pieces, which become the
+# circuits of the instance. The pieces fill the whole plate, hence the optimal height is h by construction
+# (it meets the area lower bound and the cuts give a feasible layout).
+
+
+# w, h:       dimensions of the plate
+# n:          number of circuits
+# seed:       seed of the random generator
+# split_long: probability of cutting a piece across its longest side (1 gives squarish circuits,
+#             0.5 chooses the direction at random and produces more elongated ones)
+#
+# returns an int32 array of shape (n, 2) with the dimensions of the circuits
+def guillotine_instance(w, h, n, seed=0, split_long=0.8):
+    if n > w * h:
+        raise ValueError(f'A {w} X {h} plate cannot be cut in {n} circuits')
+    rng = np.random.default_rng(seed)
+    pieces = [(w, h)]
+
+    while len(pieces) < n:
+        # choose a piece that can still be cut, the larger ones being more likely
+        cuttable = [k for k, (pw, ph) in enumerate(pieces) if pw * ph > 1]
+        areas = np.array([pieces[k][0] * pieces[k][1] for k in cuttable], dtype=np.float64)
+        pw, ph = pieces.pop(cuttable[rng.choice(len(cuttable), p=areas / areas.sum())])
+
+        # vertical cut (along the width) or horizontal cut (along the height)
+        if pw == 1:
+            cut_width = False
+        elif ph == 1:
+            cut_width = True
+        else:
+            cut_width = (pw >= ph) == (rng.random() < split_long)
+
+        if cut_width:
+            cut = int(rng.integers(1, pw))
+            pieces += [(cut, ph), (pw - cut, ph)]
+        else:
+            cut = int(rng.integers(1, ph))
+            pieces += [(pw, cut), (pw, ph - cut)]
+
+    dims = np.array(pieces, dtype=np.int32)
+    return dims[rng.permutation(n)]
+
+
+def write_instance(path, w, dims):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(f'{w}\n{len(dims)}\n')
+        f.writelines(f'{dx} {dy}\n' for dx, dy in dims)
+
+
+# height of the plate used for n circuits of about area_per_circuit cells each
+def plate_height(w, n, area_per_circuit=20):
+    return max(1, math.ceil(n * area_per_circuit / w))
+
+
+# generate the instance and write it in out_dir, returning its path and its optimal height
+def generate(out_dir, w, n, seed=0, h=None, split_long=0.8):
+    h = h if h is not None else plate_height(w, n)
+    dims = guillotine_instance(w, h, n, seed, split_long)
+    path = Path(out_dir) / f'ins-gen-w{w}-n{n}-s{seed}.txt'
+    write_instance(path, w, dims)
+
+    return path, h
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--circuits', help='Numbers of circuits of the instances', type=int, nargs='+', required=True)
+    parser.add_argument('-w', '--width', help='Width of the plate', type=int, default=40)
+    parser.add_argument('-H', '--height', help='Height of the plate (default: about 20 cells per circuit)', type=int, default=None)
+    parser.add_argument('-s', '--seeds', help='Seeds of the instances', type=int, nargs='+', default=[0])
+    parser.add_argument('-sl', '--split_long', help='Probability of cutting a piece across its longest side', type=float, default=0.8)
+    parser.add_argument('-o', '--out_dir', help='Folder of the generated instances', type=str, default='instances/generated')
+    args = parser.parse_args()
+
+    for n in args.circuits:
+        for seed in args.seeds:
+            path, h = generate(args.out_dir, args.width, n, seed, args.height, args.split_long)
+            print(f'{path}\toptimal height: {h}')
@@ -0,0 +1,76 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+# SKYLINE PACKING HEURISTIC
+# The plate is described by its skyline, i.e. the height reached in each column. Circuits are placed one
+# at a time on top of the skyline, in the position (and orientation, if rotation is allowed) where the top
+# of the circuit is the lowest, preferring the leftmost one. The space below the skyline is never filled
+# again, hence the layout is always feasible but not necessarily optimal. Several orderings of the circuits
+# are tried and the lowest layout is returned.
+
+
+# orderings of the circuits tried by the heuristic, each one a sorting key on (width, height)
+ORDERINGS = {
+    'height': lambda x, y: -y,
+    'area': lambda x, y: -(x * y),
+    'width': lambda x, y: -x,
+    'max_side': lambda x, y: -np.maximum(x, y),
+}
+
+
+# place the circuits in the given order on top of the skyline
+def _pack(w, x, y, order, rotation):
+    n = len(x)
+    skyline = np.zeros(w, dtype=np.int64)   # height reached by each column of the plate
+    x_coord = np.zeros(n, dtype=np.int64)
+    y_coord = np.zeros(n, dtype=np.int64)
+    widths = x.copy()
+    heights = y.copy()
+
+    for i in order:
+        orientations = [(x[i], y[i])]
+        if rotation and x[i] != y[i]:
+            orientations.append((y[i], x[i]))
+
+        best = None     # (top, bottom, column, width, height)
+        for width, height in orientations:
+            if width > w:
+                continue
+            # bottom of the circuit for each leftmost column it can start from
+            bottoms = sliding_window_view(skyline, width).max(axis=1)
+            column = int(np.argmin(bottoms))    # lowest position, the leftmost one among the ties
+            candidate = (bottoms[column] + height, bottoms[column], column, width, height)
+            if best is None or candidate < best:
+                best = candidate
+
+        top, bottom, column, width, height = best
+        skyline[column:column + width] = top
+        x_coord[i], y_coord[i] = column, bottom
+        widths[i], heights[i] = width, height
+
+    return int(skyline.max()), x_coord, y_coord, widths, heights
+
+
+# w:        width of the plate
+# x, y:     horizontal and vertical dimensions of the circuits
+# rotation: allow the circuits to be rotated by 90 degrees
+#
+# returns the height of the best layout found, the coordinates of the circuits and their actual
+# dimensions (swapped for the rotated circuits), all as lists of python ints
+def skyline_packing(w, x, y, rotation=False):
+    x = np.asarray(x, dtype=np.int64)
+    y = np.asarray(y, dtype=np.int64)
+
+    # the greedy choice of the orientation is not always the best one, hence with rotation
+    # the layouts without rotated circuits are tried as well
+    best = None
+    for key in ORDERINGS.values():
+        order = np.argsort(key(x, y), kind='stable')
+        for rotate in ([False, True] if rotation else [False]):
+            layout = _pack(w, x, y, order, rotate)
+            if best is None or layout[0] < best[0]:
+                best = layout
+
+    h, x_coord, y_coord, widths, heights = best
+    return h, x_coord.tolist(), y_coord.tolist(), widths.tolist(), heights.tolist()
@@ -0,0 +1,100 @@
+import argparse
+from functools import lru_cache
+from pathlib import Path
+import numpy as np
+
+
+# INSTANCE LOADER
+# Every instance is parsed once into (w, n, dims), where dims is a read-only int32 array of shape (n, 2)
+# holding the horizontal and vertical dimension of each circuit. The parsed instances are memoized, and
+# can be collected in a single .npz store so that sweeps over many configurations do not parse the text
+# files again.
+
+ROOT = Path(__file__).resolve().parents[1]  # repository root
+INSTANCES_DIR = ROOT / 'instances'
+
+_store = {}     # instances loaded from an .npz store, by key (see store_key)
+
+
+# an instance is either the number of one of the instances of the repository or the path of an instance file
+def instance_path(instance):
+    if isinstance(instance, (int, np.integer)):
+        return INSTANCES_DIR / f'ins-{instance}.txt'
+    return Path(instance)
+
+
+# name used for the instance in the output files: the number, or the file name without the ins- prefix
+def instance_name(instance):
+    if isinstance(instance, (int, np.integer)):
+        return str(instance)
+    name = Path(instance).stem
+    return name[4:] if name.startswith('ins-') else name
+
+
+# key of the instance in the store: the path of its file, relative to the repository when inside it (so that the
+# store can be moved with the repository), since instances of different folders can have the same name
+def store_key(instance):
+    path = instance_path(instance).resolve()
+    return path.relative_to(ROOT).as_posix() if path.is_relative_to(ROOT) else str(path)
+
+
+# the instance file holds the width of the plate, the number of circuits and then their dimensions
+def parse_instance(path):
+    values = np.array(Path(path).read_text().split(), dtype=np.int32)   # a single conversion, without per-line parsing
+    w, n = int(values[0]), int(values[1])
+    dims = values[2:2 + 2*n].reshape(n, 2)
+    dims.setflags(write=False)
+
+    return w, n, dims
+
+
+@lru_cache(maxsize=None)
+def _load(instance):
+    key = store_key(instance) if _store else None
+    if key in _store:
+        return _store[key]
+    return parse_instance(instance_path(instance))
+
+
+# returns (w, n, dims), dims being shared by all the callers: copy it before modifying it
+def load_instance(instance):
+    return _load(instance)
+
+
+# STORE
+
+# collect the given instances in a single .npz file
+def build_store(store_path, instances):
+    keys, widths, counts, dims = [], [], [], []
+    for instance in instances:
+        w, n, d = parse_instance(instance_path(instance))
+        keys.append(store_key(instance))
+        widths.append(w)
+        counts.append(n)
+        dims.append(d)
+
+    np.savez(store_path, keys=np.array(keys), w=np.array(widths, dtype=np.int32), n=np.array(counts, dtype=np.int32),
+             dims=np.concatenate(dims) if dims else np.zeros((0, 2), dtype=np.int32))
+
+
+# make load_instance read the instances of the store instead of their text files
+def open_store(store_path):
+    data = np.load(store_path)
+    offsets = np.concatenate([[0], np.cumsum(data['n'])])
+    all_dims = data['dims']
+    all_dims.setflags(write=False)
+
+    for k, key in enumerate(data['keys']):
+        _store[str(key)] = (int(data['w'][k]), int(data['n'][k]), all_dims[offsets[k]:offsets[k+1]])
+    _load.cache_clear()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('store', help='Path of the .npz store to build', type=str)
+    parser.add_argument('files', help='Instance files (default: all the instances of the repository)', nargs='*')
+    args = parser.parse_args()
+
+    files = args.files or sorted(INSTANCES_DIR.glob('ins-*.txt'))
+    build_store(args.store, files)
+    print(f'Store {args.store}: {len(files)} instances')
@@ -0,0 +1,97 @@
+import sys
+import csv
+import json
+import argparse
+import datetime
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:     # not available on Windows
+    resource = None
+
+
+# RUN METRICS
+# Every engine appends one JSON record per instance to the metrics.jsonl file of its out folder, with the
+# time spent building the model separately from the time spent solving it, the bounds on the height, the
+# search counters, the statistics reported by the solver itself and the anytime trace of the improving solutions.
+
+FIELDS = ['timestamp', 'engine', 'instance', 'config', 'h', 'lower', 'gap', 'optimal', 'build_time', 'solve_time',
+          'nodes', 'conflicts', 'failures', 'peak_rss_mb', 'stats', 'trace']
+
+
+# peak resident memory (in MB) of the process and of the solver processes it has spawned
+def peak_rss_mb():
+    if resource is None:
+        return None
+    scale = 1 / 2**20 if sys.platform == 'darwin' else 1 / 2**10     # bytes on macOS, kilobytes on Linux
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * scale
+
+
+# solver statistics may contain timedeltas or solver-specific objects
+def jsonable(value):
+    if isinstance(value, dict):
+        return {str(k): jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [jsonable(v) for v in value]
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds()
+    if isinstance(value, (bool, int, float, str)) or value is None:
+        return value
+    try:
+        return float(value)     # numpy scalars
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def log_run(log_path, engine, instance, config, h, lower, optimal, build_time, solve_time,
+            nodes=None, conflicts=None, failures=None, stats=None, trace=None):
+    record = {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'engine': engine,
+        'instance': str(instance),
+        'config': config,
+        'h': h,
+        'lower': lower,
+        'gap': (h - lower) / h if h is not None and lower is not None else None,
+        'optimal': optimal,
+        'build_time': build_time,
+        'solve_time': solve_time,
+        'nodes': nodes,
+        'conflicts': conflicts,
+        'failures': failures,
+        'peak_rss_mb': peak_rss_mb(),
+        'stats': stats or {},
+        'trace': trace or [],   # (time, height) of each improving solution
+    }
+
+    log_path = Path(log_path)
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(log_path, 'a') as f:    # a single write per record, so that parallel workers do not interleave
+        f.write(json.dumps(jsonable(record)) + '\n')
+
+    return record
+
+
+def read_runs(log_path):
+    with open(log_path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# flatten the records into a CSV file (config, solver statistics and trace as JSON strings)
+def to_csv(log_path, csv_path):
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        for record in read_runs(log_path):
+            writer.writerow({k: (json.dumps(v) if isinstance(v, (dict, list)) else v) for k, v in record.items()})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('log', help='metrics.jsonl file written by an engine', type=str)
+    parser.add_argument('csv', help='CSV file to write', type=str)
+    args = parser.parse_args()
+
+    to_csv(args.log, args.csv)
@@ -0,0 +1,78 @@
+import argparse
+import multiprocessing as mp
+from pathlib import Path
+from random import randint
+import numpy as np
+import matplotlib
+import matplotlib.pyplot as plt
+from matplotlib import colors
+
+
+# PLOT FUNCTIONS
+
+def build_cmap(n):
+    colors_list = ['#%06X' % randint(0, 0xFFFFF0) for i in range(n)]
+    colors_list.append('#FFFFFF')   # background of the plate
+
+    return colors.ListedColormap(colors_list)
+
+
+# board of the plate where each cell holds the index of the circuit covering it (n if empty)
+def build_board(w, h, n, x, y, x_coord, y_coord):
+    board = np.full((h, w), n)      # h rows and w columns
+
+    for i in range(n):
+        # fill the rectangle of the circuit with a single slice assignment
+        board[y_coord[i]:y_coord[i] + y[i], x_coord[i]:x_coord[i] + x[i]] = i
+
+    return board
+
+
+# draw the plate and save it in image_path, releasing the figure afterwards
+def render_solution(w, h, n, x, y, x_coord, y_coord, image_path):
+    board = build_board(w, h, n, x, y, x_coord, y_coord)
+
+    fig, ax = plt.subplots()
+    ax.imshow(board, interpolation='None', cmap=build_cmap(n), vmin=0, vmax=n)
+    ax.invert_yaxis()
+
+    image_path = Path(image_path)
+    image_path.parent.mkdir(parents=True, exist_ok=True)
+    fig.savefig(image_path)
+    plt.close(fig)
+
+
+# read a solution written by the engines: "w h", "n" and a line "x y x_coord y_coord" for each circuit
+def read_solution(out_path):
+    values = np.array(Path(out_path).read_text().split(), dtype=np.int64)
+    w, h, n = values[:3]
+    circuits = values[3:3 + 4*n].reshape(n, 4)
+
+    return int(w), int(h), int(n), circuits[:, 0], circuits[:, 1], circuits[:, 2], circuits[:, 3]
+
+
+def plot_out_file(out_path, image_path):
+    render_solution(*read_solution(out_path), image_path)
+    return image_path
+
+
+# BATCH MODE
+# render every out-*.txt file of out_dir (and of its subfolders) into the same relative path of plot_dir
+def batch_plot(out_dir, plot_dir, jobs=None):
+    out_dir, plot_dir = Path(out_dir), Path(plot_dir)
+    tasks = [(out_path, plot_dir / out_path.relative_to(out_dir).with_suffix('.png')) for out_path in sorted(out_dir.rglob('out-*.txt'))]
+
+    with mp.Pool(jobs) as pool:
+        for image_path in pool.starmap(plot_out_file, tasks):
+            print(f'Plot: {image_path}')
+
+
+if __name__ == '__main__':
+    matplotlib.use('Agg')   # no window is opened in batch mode
+    parser = argparse.ArgumentParser()
+    parser.add_argument('out_dir', help='Folder of the solutions (e.g. CP/out/chuffed)', type=str)
+    parser.add_argument('plot_dir', help='Folder of the plots (e.g. CP/out_plots/chuffed)', type=str)
+    parser.add_argument('-j', '--jobs', help='Number of plots rendered in parallel (default: all the cores)', type=int, default=None)
+    args = parser.parse_args()
+
+    batch_plot(args.out_dir, args.plot_dir, args.jobs)
@@ -0,0 +1,98 @@
+import sys
+import argparse
+import multiprocessing as mp
+from pathlib import Path
+from timeit import default_timer as timer
+
+ROOT = Path(__file__).resolve().parents[1]  # repository root
+sys.path.append(str(ROOT))
+from common.runner import run_instances
+from common.heuristic import skyline_packing
+from common.bounds import lower_bound
+from common.instances import load_instance
+from common.engines import ENGINES, run_engine, solution_path, share_height
+
+
+# PORTFOLIO
+# The same instance is given to several engines running in parallel processes. Every engine starts with
+# the height of the skyline heuristic as upper bound and publishes the height of each layout it finds. The
+# best height found so far is used by the engines that can while searching (the SMT height search, the
+# Gurobi callback and the bottom-up search of bb) to skip the heights that cannot improve it. As soon as an
+# engine proves the optimality of a height, the other ones are killed. When the height of the heuristic
+# already meets the lower bound of common/bounds.py, no engine is started at all.
+
+
+# write the layout of the heuristic in the out files of the engines, where they would have written theirs
+def write_heuristic(instance, engines, sym_break, rotation, w, n, layout):
+    h, x_coord, y_coord, widths, lengths = layout
+    for engine in engines:
+        out_path = ROOT / solution_path(engine, instance, sym_break, rotation)
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(out_path, 'w') as f:
+            f.writelines(f'{w} {h}\n')
+            f.writelines(f'{n}\n')
+            for i in range(n):
+                f.writelines(f'{widths[i]} {lengths[i]} {x_coord[i]} {y_coord[i]}\n')
+
+
+# returns the best height found, whether it is optimal and the engine that found it
+def portfolio(instance, engines=ENGINES, sym_break=False, rotation=False, plot=False, cores=None, timeout=330):
+    w, n, dims = load_instance(instance)
+    layout = skyline_packing(w, dims[:, 0], dims[:, 1], rotation)
+    h_ub = int(layout[0])
+    lower = lower_bound(w, dims[:, 0], dims[:, 1], rotation)
+
+    # the heuristic meets the lower bound: its height is optimal and no engine is started
+    if h_ub <= lower:
+        write_heuristic(instance, engines, sym_break, rotation, w, n, layout)
+        print(f'Instance: {instance}\tBest objective value: {h_ub}\tWinner: heuristic')
+        return h_ub, True, 'heuristic'
+
+    # best height found by an engine, initially just above the one of the heuristic
+    shared_h = mp.Value('i', h_ub + 1)
+    best_h, optimal, winner = None, False, None
+    proven = lower  # best lower bound proven by the engines
+
+    start_time = timer()
+    kwargs = {'instance': instance, 'sym_break': sym_break, 'rotation': rotation, 'plot': plot, 'h_ub': h_ub, 'shared_h': shared_h}
+    for engine, result, error in run_instances(run_engine, engines, kwargs, jobs=len(engines), cores=cores, timeout=timeout):
+        if error is not None:
+            print(f'Instance: {instance}\tEngine: {engine}\t{error}')
+            continue
+
+        if result['h'] is not None and (best_h is None or result['h'] < best_h):
+            best_h, winner = result['h'], engine
+            share_height(shared_h, best_h)
+
+        # optimal either when the engine proved it, or when its lower bound meets the best height of another engine
+        # (or the one of the heuristic, while no engine found a layout)
+        proven = max(proven, result['lower'] or 0)
+        if result['optimal'] or proven >= (h_ub if best_h is None else best_h):
+            optimal = True
+            break   # closing the runner kills the other engines
+
+    end_time = timer() - start_time
+    if best_h is None:
+        # no engine found a layout: the one of the heuristic is the best in hand
+        best_h, optimal, winner = h_ub, h_ub <= proven, 'heuristic'
+        write_heuristic(instance, engines, sym_break, rotation, w, n, layout)
+        print(f'Instance: {instance}\tExecution time: {(end_time):.03f}s\tBest objective value: {best_h}{"" if optimal else " (not optimal)"}\tWinner: heuristic')
+    else:
+        print(f'Instance: {instance}\tExecution time: {(end_time):.03f}s\tBest objective value: {best_h}{"" if optimal else " (not optimal)"}\tWinner: {winner}')
+
+    return best_h, optimal, winner
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-f', '--first', help='Number of first instance', type=int, default=1)
+    parser.add_argument('-l', '--last', help='Number of last instance', type=int, default=40)
+    parser.add_argument('-e', '--engines', help='Engines raced on each instance', nargs='+', default=ENGINES, choices=ENGINES)
+    parser.add_argument('-sb', '--sym_break', help='Allow symmetry breaking constraints', action='store_true')
+    parser.add_argument('-r', '--rotation', help='Allow rotation', action='store_true')
+    parser.add_argument('-p', '--plot', help='Plot solution', action='store_true')
+    parser.add_argument('-c', '--cores', help='Number of cores shared by the engines', type=int, default=None)
+    args = parser.parse_args()
+
+    for instance in range(args.first, args.last+1):
+        portfolio(instance, args.engines, args.sym_break, args.rotation, args.plot, args.cores)
@@ -0,0 +1,115 @@
+import sys
+import argparse
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # repository root
+from common.instances import load_instance
+
+
+# PREPROCESSING
+# Reductions of an instance computed once and translated by every engine into its own constraints.
+# Some of them are implied by the model and only prune the search (stacked pairs, fixed orientations,
+# coordinate domains), the others remove symmetric layouts and are used with symmetry breaking:
+# - the circuits of a group of identical circuits are interchangeable, hence their coordinates are
+#   ordered lexicographically following the order of their indexes
+# - a circuit that cannot sit beside any other one can be moved horizontally, hence it is placed at x = 0
+# The biggest circuit is the first one of its group, so that placing it in the bottom-left quarter of
+# the plate (the symmetry breaking of the models) agrees with the order of the group.
+
+
+# w:        width of the plate
+# x, y:     horizontal and vertical dimensions of the circuits
+# rotation: whether the circuits can be rotated
+# h_max:    upper bound of the height (default: all the circuits stacked)
+#
+# returns a dictionary with
+# groups:      lists of the indexes of identical circuits (with rotation, identical up to a rotation)
+# stacked:     pairs (i, j) that can never sit side by side, hence one is above the other
+# full_width:  circuits that cannot sit beside any other circuit
+# orientation: fixed rotations {i: rotated}
+# w_min:       smallest width each circuit can take
+# l_min:       smallest height each circuit can take
+# x_max:       largest x coordinate of each circuit
+# y_max:       largest y coordinate of each circuit
+# biggest:     indexes of the two circuits of largest area
+def preprocess(w, x, y, rotation=False, h_max=None):
+    n = len(x)
+    x = [int(v) for v in x]
+    y = [int(v) for v in y]
+    if h_max is None:
+        h_max = sum([max(x[i], y[i]) if rotation else y[i] for i in range(n)])
+
+    # the orientation is fixed for the squares and for the circuits that fit the plate in a single orientation
+    orientation = {}
+    if rotation:
+        for i in range(n):
+            if x[i] == y[i] or y[i] > w or x[i] > h_max:
+                orientation[i] = False
+            elif x[i] > w or y[i] > h_max:
+                orientation[i] = True
+    can_rotate = [rotation and i not in orientation for i in range(n)]
+    w_min = [min(x[i], y[i]) if can_rotate[i] else (y[i] if orientation.get(i) else x[i]) for i in range(n)]
+    l_min = [min(x[i], y[i]) if can_rotate[i] else (x[i] if orientation.get(i) else y[i]) for i in range(n)]
+
+    # identical circuits, in the order of their indexes
+    groups = {}
+    for i in range(n):
+        key = tuple(sorted((x[i], y[i]))) if can_rotate[i] else (w_min[i], l_min[i])
+        groups.setdefault(key, []).append(i)
+    groups = [group for group in groups.values() if len(group) > 1]
+
+    stacked = [(i, j) for i in range(n) for j in range(i+1, n) if w_min[i] + w_min[j] > w]
+    beside = [0] * n    # number of circuits that can sit beside each circuit
+    for i in range(n):
+        for j in range(i+1, n):
+            if w_min[i] + w_min[j] <= w:
+                beside[i] += 1
+                beside[j] += 1
+    full_width = [i for i in range(n) if beside[i] == 0]
+
+    # largest area first, lowest index first among equal areas (the first circuit of its group)
+    order = sorted(range(n), key=lambda i: (-x[i] * y[i], i))
+
+    return {
+        'groups': groups,
+        'stacked': stacked,
+        'full_width': full_width,
+        'orientation': orientation,
+        'w_min': w_min,
+        'l_min': l_min,
+        'x_max': [w - w_min[i] for i in range(n)],
+        'y_max': [h_max - l_min[i] for i in range(n)],
+        'biggest': order[:2],
+    }
+
+
+# consecutive circuits of the groups, whose coordinates are ordered lexicographically
+def group_pairs(groups):
+    return [(group[k], group[k+1]) for group in groups for k in range(len(group) - 1)]
+
+
+# move a layout into the symmetry class kept by the reductions (a start solution has to satisfy them):
+# the circuits that cannot sit beside any other one at x = 0, then the positions of identical circuits sorted
+def canonical_layout(pre, x_coord, y_coord, widths, lengths):
+    x_coord, y_coord, widths, lengths = list(x_coord), list(y_coord), list(widths), list(lengths)
+    for i in pre['full_width']:
+        x_coord[i] = 0
+    for group in pre['groups']:
+        places = sorted((x_coord[i], y_coord[i], widths[i], lengths[i]) for i in group)
+        for i, place in zip(group, places):
+            x_coord[i], y_coord[i], widths[i], lengths[i] = place
+    return x_coord, y_coord, widths, lengths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-f', '--first', help='Number of first instance', type=int, default=1)
+    parser.add_argument('-l', '--last', help='Number of last instance', type=int, default=40)
+    parser.add_argument('-r', '--rotation', help='Allow rotation', action='store_true')
+    args = parser.parse_args()
+
+    for instance in range(args.first, args.last+1):
+        w, n, dims = load_instance(instance)
+        pre = preprocess(w, dims[:, 0], dims[:, 1], args.rotation)
+        print(f"Instance: {instance}\tn: {n}\tidentical: {sum(len(g) for g in pre['groups'])} in {len(pre['groups'])} groups"
+              f"\tstacked pairs: {len(pre['stacked'])}\tfull width: {len(pre['full_width'])}\tfixed orientations: {len(pre['orientation'])}")
@@ -0,0 +1,186 @@
+import sys
+import json
+import sqlite3
+import hashlib
+import argparse
+import datetime
+import functools
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]  # repository root
+sys.path.append(str(ROOT))
+from common.runner import run_instances
+from common.instances import load_instance, instance_name
+from common.engines import ENGINES, PARADIGMS, run_engine, solution_path
+
+
+# RESULTS STORE
+# The runs of the engines are kept in a SQLite database, under a key made of the content of the instance,
+# the engine (which is also the solver), the configuration, the time limit and the version of the code run
+# by the engine: a hash of the sources of its paradigm and of the shared modules. A sweep skips the runs
+# already solved to optimality under the same key, hence an interrupted sweep resumes where it stopped and
+# a change to one model only runs its engine again. The layout of each run is stored with it, so that the
+# out files can be written again from the store.
+
+RESULTS_DB = ROOT / 'results.db'
+TIME_LIMIT = 300    # time limit of the engines, in seconds
+SOURCES = ['*.py', '*.mzn']     # files of a paradigm that make up its version
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    key TEXT PRIMARY KEY,
+    instance TEXT, instance_hash TEXT, engine TEXT, sym_break INTEGER, rotation INTEGER, time_limit INTEGER, version TEXT,
+    status TEXT,            -- running, done or error
+    h INTEGER, lower INTEGER, optimal INTEGER, time REAL, error TEXT,
+    out_file TEXT,          -- out file of the engine, relative to the repository root
+    solution TEXT,          -- content of the out file
+    started TEXT, finished TEXT
+)'''
+
+
+def connect(db_path=RESULTS_DB):
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.execute(SCHEMA)
+    return conn
+
+
+# hash of the plate and of the circuits, the same for the same instance under another name or path
+def instance_hash(instance):
+    w, n, dims = load_instance(instance)
+    return hashlib.sha256(f'{w} {n} '.encode() + dims.astype('<i4').tobytes()).hexdigest()
+
+
+# hash of the sources run by the engine
+@functools.lru_cache(maxsize=None)
+def code_version(engine):
+    digest = hashlib.sha256()
+    folders = [ROOT / 'common', ROOT / PARADIGMS[engine] / 'src']
+    for path in sorted(path for folder in folders for pattern in SOURCES for path in folder.glob(pattern)):
+        digest.update(path.relative_to(ROOT).as_posix().encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+# the fields identifying a run, and the key they are stored under (the upper bound of the height given by a
+# sweep is part of the key: a bounded run is not the same as an unbounded one, and so is the Gurobi symmetry)
+def run_fields(instance, engine, sym_break, rotation, h_ub=None, symmetry=None):
+    fields = {'instance_hash': instance_hash(instance), 'engine': engine, 'sym_break': int(sym_break), 'rotation': int(rotation),
+              'time_limit': TIME_LIMIT, 'version': code_version(engine)}
+    if h_ub is not None:
+        fields['h_ub'] = int(h_ub)
+    if symmetry is not None:
+        fields['symmetry'] = int(symmetry)
+    return fields
+
+
+def run_key(fields):
+    return hashlib.sha256(json.dumps(fields, sort_keys=True).encode()).hexdigest()
+
+
+def lookup(conn, key):
+    return conn.execute('SELECT * FROM runs WHERE key = ?', (key,)).fetchone()
+
+
+# a run is skipped when it is solved to optimality, or when it reached the time limit with a layout unless
+# retry is given; the runs without a layout and those still marked as running (interrupted) are run again
+def solved(row, retry=False):
+    return row is not None and row['status'] == 'done' and (row['optimal'] or (row['h'] is not None and not retry))
+
+
+def now():
+    return datetime.datetime.now().isoformat(timespec='seconds')
+
+
+def start_run(conn, key, instance, fields):
+    conn.execute('INSERT OR REPLACE INTO runs (key, instance, instance_hash, engine, sym_break, rotation, time_limit, version, status, started) '
+                 'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                 (key, str(instance), fields['instance_hash'], fields['engine'], fields['sym_break'], fields['rotation'],
+                  fields['time_limit'], fields['version'], 'running', now()))
+    conn.commit()
+
+
+def finish_run(conn, key, result, error, out_file):
+    if result is None:
+        conn.execute('UPDATE runs SET status = ?, error = ?, finished = ? WHERE key = ?', ('error', error, now(), key))
+    else:
+        # the engine wrote the layout in its out file before returning
+        solution = (ROOT / out_file).read_text() if result['h'] is not None else None
+        conn.execute('UPDATE runs SET status = ?, h = ?, lower = ?, optimal = ?, time = ?, error = NULL, out_file = ?, solution = ?, finished = ? '
+                     'WHERE key = ?', ('done', result['h'], result.get('lower'), int(result['optimal']), result['time'],
+                                       out_file.as_posix(), solution, now(), key))
+    conn.commit()
+
+
+def sweep_task(job, threads=1, sym_break=False, rotation=False, h_ub=None, start=None, symmetry=-1):
+    engine, instance = job
+    return run_engine(engine, instance, sym_break, rotation, h_ub=h_ub, threads=threads, start=start, symmetry=symmetry)
+
+
+# run the engines on the instances, skipping the runs already in the store
+def sweep(instances, engines, sym_break=False, rotation=False, db_path=RESULTS_DB, jobs=1, cores=None, retry=False):
+    conn = connect(db_path)
+    instances = [instance if isinstance(instance, int) else Path(instance).resolve() for instance in instances]
+
+    keys, jobs_list = {}, []
+    for instance in instances:
+        for engine in engines:
+            fields = run_fields(instance, engine, sym_break, rotation)
+            key = run_key(fields)
+            row = lookup(conn, key)
+            if solved(row, retry):
+                print(f"Engine: {engine}\tInstance: {instance_name(instance)}\theight: {row['h']}{'' if row['optimal'] else ' (not optimal)'}\t(stored)")
+                continue
+            keys[(engine, instance)] = (key, fields)
+            jobs_list.append((engine, instance))
+
+    # the runs are marked when they start, so that those of an interrupted sweep are found again
+    for engine, instance in jobs_list:
+        key, fields = keys[(engine, instance)]
+        start_run(conn, key, instance, fields)
+
+    kwargs = {'sym_break': sym_break, 'rotation': rotation}
+    for (engine, instance), result, error in run_instances(sweep_task, jobs_list, kwargs, jobs=jobs, cores=cores, timeout=TIME_LIMIT + 30):
+        finish_run(conn, keys[(engine, instance)][0], result, error, solution_path(engine, instance, sym_break, rotation))
+        if error is not None:
+            print(f'Engine: {engine}\tInstance: {instance_name(instance)}\t{error}')
+        else:
+            print(f"Engine: {engine}\tInstance: {instance_name(instance)}\theight: {result['h']}{'' if result['optimal'] else ' (not optimal)'}\ttime: {result['time']:.03f}s")
+    conn.close()
+
+
+# write the out files of the stored runs (the latest run of each file) under out_dir, with the same paths
+# as the engines
+def export_out(db_path=RESULTS_DB, out_dir=ROOT):
+    conn = connect(db_path)
+    rows = conn.execute("SELECT out_file, solution FROM runs WHERE status = 'done' AND solution IS NOT NULL ORDER BY finished").fetchall()
+    latest = {row['out_file']: row['solution'] for row in rows}
+    for out_file, solution in latest.items():
+        path = Path(out_dir) / out_file
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(solution)
+    conn.close()
+    return len(latest)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-f', '--first', help='Number of first instance', type=int, default=1)
+    parser.add_argument('-l', '--last', help='Number of last instance', type=int, default=40)
+    parser.add_argument('-i', '--instances', help='Instance files (instead of the numbered instances)', nargs='+', default=None)
+    parser.add_argument('-e', '--engines', help='Engines to run', nargs='+', default=ENGINES, choices=ENGINES)
+    parser.add_argument('-sb', '--sym_break', help='Allow symmetry breaking constraints', action='store_true')
+    parser.add_argument('-r', '--rotation', help='Allow rotation', action='store_true')
+    parser.add_argument('-j', '--jobs', help='Number of runs in parallel', type=int, default=1)
+    parser.add_argument('-c', '--cores', help='Number of cores shared by the parallel runs', type=int, default=None)
+    parser.add_argument('-db', '--database', help='SQLite file of the results', type=str, default=str(RESULTS_DB))
+    parser.add_argument('-rt', '--retry', help='Run again the stored runs that reached the time limit', action='store_true')
+    parser.add_argument('-x', '--export', help='Write the out files of the stored runs under the given folder (default: the repository) instead of running',
+                        nargs='?', const=str(ROOT), default=None)
+    args = parser.parse_args()
+
+    if args.export is not None:
+        print(f'{export_out(args.database, args.export)} out files written in {args.export}')
+    else:
+        instances = args.instances or range(args.first, args.last+1)
+        sweep(instances, args.engines, args.sym_break, args.rotation, args.database, args.jobs, args.cores, args.retry)
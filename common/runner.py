@@ -0,0 +1,110 @@
+import os
+import signal
+import multiprocessing as mp
+from multiprocessing.connection import wait
+from timeit import default_timer as timer
+
+
+# PROCESS POOL RUNNER
+# Every instance is solved in its own worker process, so that a worker that exceeds the time limit
+# can be killed without affecting the others. At most `jobs` workers run at the same time and the
+# results are collected (and yielded) as soon as each instance finishes.
+
+
+# number of threads each solver may use so that jobs * threads does not exceed the core budget
+def threads_per_job(jobs, cores=None):
+    cores = cores if cores is not None else os.cpu_count()
+    return max(1, cores // jobs)
+
+
+# body of the worker process: solve one instance and send back the result (or the raised error)
+def _worker(conn, task, instance, kwargs):
+    if hasattr(os, 'setpgrp'):
+        os.setpgrp()    # own process group, so that the solver processes it spawns (e.g. minizinc) are killed with it
+    try:
+        result = task(instance, **kwargs)
+        conn.send((instance, result, None))
+    except Exception as e:
+        conn.send((instance, None, repr(e)))
+    finally:
+        conn.close()
+
+
+# send a signal to a worker together with the processes it spawned
+def _signal(process, sig):
+    if hasattr(os, 'killpg'):
+        try:
+            os.killpg(process.pid, sig)
+            return
+        except ProcessLookupError:  # the worker has not created its process group yet
+            pass
+    if sig == signal.SIGTERM:
+        process.terminate()
+    else:
+        process.kill()
+
+
+# stop a worker (and the processes it spawned), killing it when it does not terminate
+def kill_worker(process):
+    _signal(process, signal.SIGTERM)
+    process.join(1)
+    if process.is_alive():
+        _signal(process, getattr(signal, 'SIGKILL', signal.SIGTERM))
+        process.join()
+
+
+# task:      function called as task(instance, threads=..., **kwargs) inside the worker
+# instances: iterable of instances to solve
+# jobs:      maximum number of workers running at the same time
+# cores:     core budget shared by the workers (default: all the cores of the machine)
+# timeout:   wall time after which a worker is killed (None = never)
+#
+# yields a tuple (instance, result, error) for each instance, in completion order; the workers still
+# running are killed when the generator is closed
+def run_instances(task, instances, kwargs=None, jobs=1, cores=None, timeout=None):
+    kwargs = dict(kwargs or {})
+    kwargs['threads'] = threads_per_job(jobs, cores)
+
+    pending = list(instances)
+    running = {}    # connection -> (process, instance, deadline)
+
+    try:
+        while pending or running:
+            # fill the free slots of the pool
+            while pending and len(running) < jobs:
+                instance = pending.pop(0)
+                recv_conn, send_conn = mp.Pipe(duplex=False)
+                process = mp.Process(target=_worker, args=(send_conn, task, instance, kwargs), daemon=True)
+                process.start()
+                send_conn.close()   # the parent only reads
+                deadline = timer() + timeout if timeout is not None else None
+                running[recv_conn] = (process, instance, deadline)
+
+            # wait until a worker sends its result, dies or the nearest deadline expires
+            deadlines = [d for (_, _, d) in running.values() if d is not None]
+            wait_time = max(0, min(deadlines) - timer()) if deadlines else None
+            ready = wait(list(running.keys()), timeout=wait_time)
+
+            for conn in ready:
+                process, instance, _ = running.pop(conn)
+                try:
+                    _, result, error = conn.recv()
+                except EOFError:    # the worker died before sending anything
+                    result, error = None, f'worker exited with code {process.exitcode}'
+                conn.close()
+                process.join()
+                yield instance, result, error
+
+            # kill the workers that exceeded the time limit
+            now = timer()
+            for conn, (process, instance, deadline) in list(running.items()):
+                if deadline is not None and now >= deadline:
+                    kill_worker(process)
+                    conn.close()
+                    del running[conn]
+                    yield instance, None, 'killed: time limit exceeded'
+    finally:
+        # the caller stopped early (e.g. the portfolio found the optimum): kill the workers still running
+        for conn, (process, _, _) in running.items():
+            kill_worker(process)
+            conn.close()
@@ -0,0 +1,220 @@
+import os
+import sys
+import signal
+import argparse
+import threading
+import multiprocessing as mp
+from multiprocessing.connection import Listener, Client, wait
+from pathlib import Path
+from timeit import default_timer as timer
+
+ROOT = Path(__file__).resolve().parents[1]  # repository root
+sys.path.append(str(ROOT))
+from common.runner import threads_per_job, kill_worker
+from common.engines import ENGINES, load_engine, run_engine
+
+
+# SOLVE SERVICE
+# A script run per batch of instances starts an interpreter, imports numpy, matplotlib and the solver
+# packages and checks out a Gurobi license before its first instance, which dominates the time of the easy
+# instances. The service is a long-running process with a pool of warm workers: each one imports the
+# engines and creates their solver handles (a single Gurobi environment, the MiniZinc solvers) when it
+# starts, and then solves the jobs taken from a shared queue. The clients send their jobs over a local
+# socket and receive the result of each one as soon as it is solved. A worker that exceeds the time limit
+# (or dies) is replaced by a fresh one, and its job is answered with the error. Each worker reports on its
+# own pipe, written synchronously, so that the messages sent by a worker before dying are never lost.
+
+ADDRESS = ('localhost', 6060)
+AUTHKEY = b'vlsi'   # the service only accepts local clients that know the key
+TIME_LIMIT = 330    # wall time of a job, above the time limit of the engines
+
+
+# body of the worker process: load the engines, then solve the jobs until the service stops
+def _worker(worker_id, engines, threads, tasks, results):     # results: sending end of the pipe of the worker
+    if hasattr(os, 'setpgrp'):
+        os.setpgrp()    # own process group, so that the solver processes it spawns are killed with it
+    for engine in engines:
+        try:
+            load_engine(engine)
+        except Exception:   # solver not installed: its jobs are answered with the error
+            pass
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        key, job = task
+        results.send(('start', worker_id, key, None, None))
+        try:
+            result = run_engine(threads=threads, **job)
+            results.send(('done', worker_id, key, result, None))
+        except Exception as e:
+            results.send(('done', worker_id, key, None, repr(e)))
+
+
+class SolveService:
+    def __init__(self, engines=ENGINES, workers=None, cores=None, time_limit=TIME_LIMIT):
+        self.engines = list(engines)
+        self.n_workers = workers or os.cpu_count()
+        self.threads = threads_per_job(self.n_workers, cores)
+        self.time_limit = time_limit
+        self.tasks = mp.Queue()
+        self.workers = {}       # worker id -> process
+        self.pipes = {}         # worker id -> receiving end of the pipe of the worker
+        self.running = {}       # worker id -> (job key, deadline)
+        self.clients = {}       # client id -> [connection, lock, jobs not answered yet]
+        self.lock = threading.Lock()
+        self.next_worker = 0
+        for _ in range(self.n_workers):
+            self.spawn()
+
+    def spawn(self):
+        worker_id, self.next_worker = self.next_worker, self.next_worker + 1
+        reader, writer = mp.Pipe(duplex=False)
+        process = mp.Process(target=_worker, args=(worker_id, self.engines, self.threads, self.tasks, writer), daemon=True)
+        process.start()
+        writer.close()      # only the worker writes, hence the reader gets EOF when it exits
+        self.workers[worker_id] = process
+        self.pipes[worker_id] = reader
+
+    # send the answer of a job to its client, closing the connection after the last one
+    def answer(self, key, result, error):
+        client_id, index = key
+        with self.lock:
+            client = self.clients.get(client_id)
+        if client is None:      # the client went away
+            return
+        conn, lock, _ = client
+        with lock:
+            try:
+                conn.send((index, result, error))
+            except OSError:
+                pass
+            client[2] -= 1
+            if client[2] == 0:
+                conn.close()
+                with self.lock:
+                    del self.clients[client_id]
+
+    # replace a worker that exceeded the time limit or died, answering its job with the error
+    def replace(self, worker_id, error):
+        process = self.workers.pop(worker_id, None)
+        if process is not None:
+            kill_worker(process)
+            self.pipes.pop(worker_id).close()
+            self.spawn()
+        key, _ = self.running.pop(worker_id, (None, None))
+        if key is not None:
+            self.answer(key, None, error)
+
+    # route the results of the workers to the clients and watch the time limit of the jobs
+    def collect(self):
+        while True:
+            pipes = {conn: worker_id for worker_id, conn in self.pipes.items()}
+            sentinels = {process.sentinel: worker_id for worker_id, process in self.workers.items()}
+            ready = wait(list(pipes) + list(sentinels), timeout=1)
+            dead = [sentinels[sentinel] for sentinel in ready if sentinel in sentinels]
+
+            # every message in the pipe of a worker is read before replacing it, so that the job it started
+            # before dying is known
+            for conn in set(conn for conn in ready if conn in pipes) | set(self.pipes[worker_id] for worker_id in dead):
+                try:
+                    while conn.poll():
+                        kind, worker_id, key, result, error = conn.recv()
+                        if kind == 'start':
+                            self.running[worker_id] = (key, timer() + self.time_limit)
+                        elif kind == 'done':
+                            self.running.pop(worker_id, None)
+                            self.answer(key, result, error)
+                except EOFError:    # the worker exited: its sentinel is ready too
+                    pass
+
+            now = timer()
+            for worker_id, (key, deadline) in list(self.running.items()):
+                if now >= deadline:
+                    self.replace(worker_id, 'killed: time limit exceeded')
+            for worker_id in dead:
+                if worker_id in self.workers:   # not replaced by the time limit already
+                    self.workers[worker_id].join(1)     # reaped, for its exit code
+                    self.replace(worker_id, f'worker exited with code {self.workers[worker_id].exitcode}')
+
+    # a client sends a list of jobs, each one a dictionary of arguments of run_engine (engine, instance,
+    # sym_break, rotation, plot, h_ub), and receives (index of the job, result, error) for each of them
+    def serve_client(self, client_id, conn):
+        try:
+            jobs = conn.recv()
+        except (EOFError, OSError):
+            conn.close()
+            return
+        if not jobs:
+            conn.close()
+            return
+        with self.lock:
+            self.clients[client_id] = [conn, threading.Lock(), len(jobs)]
+        for index, job in enumerate(jobs):
+            self.tasks.put(((client_id, index), job))
+
+    def serve(self, address=ADDRESS):
+        threading.Thread(target=self.collect, daemon=True).start()
+        with Listener(address, authkey=AUTHKEY) as listener:
+            print(f'Service: {self.n_workers} workers ({", ".join(self.engines)}) listening on {listener.address}')
+            client_id = 0
+            while True:
+                conn = listener.accept()
+                threading.Thread(target=self.serve_client, args=(client_id, conn), daemon=True).start()
+                client_id += 1
+
+
+# send the jobs to the service and yield (job, result, error) as soon as each one is solved
+def submit(jobs, address=ADDRESS):
+    jobs = [dict(job) for job in jobs]
+    for job in jobs:
+        if not isinstance(job['instance'], int):
+            job['instance'] = str(Path(job['instance']).resolve())     # the workers run in the paradigm folders
+    if not jobs:
+        return
+
+    with Client(address, authkey=AUTHKEY) as conn:
+        conn.send(jobs)
+        for _ in jobs:
+            index, result, error = conn.recv()
+            yield jobs[index], result, error
+
+
+def parse_address(address):
+    if ':' in address:
+        host, port = address.rsplit(':', 1)
+        return host, int(port)
+    return address  # path of a Unix socket
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--submit', help='Submit the instances to a running service instead of starting it', action='store_true')
+    parser.add_argument('-a', '--address', help='host:port (or path of a Unix socket) of the service', type=str, default=f'{ADDRESS[0]}:{ADDRESS[1]}')
+    parser.add_argument('-e', '--engines', help='Engines loaded by the workers, or run on each submitted instance', nargs='+', default=ENGINES, choices=ENGINES)
+    parser.add_argument('-w', '--workers', help='Number of workers (default: all the cores)', type=int, default=None)
+    parser.add_argument('-c', '--cores', help='Number of cores shared by the workers', type=int, default=None)
+    parser.add_argument('-f', '--first', help='Number of first instance', type=int, default=1)
+    parser.add_argument('-l', '--last', help='Number of last instance', type=int, default=40)
+    parser.add_argument('-i', '--instances', help='Instance files (instead of the numbered instances)', nargs='+', default=None)
+    parser.add_argument('-sb', '--sym_break', help='Allow symmetry breaking constraints', action='store_true')
+    parser.add_argument('-r', '--rotation', help='Allow rotation', action='store_true')
+    parser.add_argument('-p', '--plot', help='Plot solution', action='store_true')
+    args = parser.parse_args()
+    address = parse_address(args.address)
+
+    if args.submit:
+        instances = args.instances or range(args.first, args.last+1)
+        jobs = [{'engine': engine, 'instance': instance, 'sym_break': args.sym_break, 'rotation': args.rotation, 'plot': args.plot}
+                for instance in instances for engine in args.engines]
+        start_time = timer()
+        for job, result, error in submit(jobs, address):
+            if error is not None:
+                print(f"Engine: {job['engine']}\tInstance: {job['instance']}\t{error}")
+            else:
+                print(f"Engine: {job['engine']}\tInstance: {job['instance']}\theight: {result['h']}{'' if result['optimal'] else ' (not optimal)'}\ttime: {result['time']:.03f}s")
+        print(f'{len(jobs)} jobs in {timer() - start_time:.03f}s')
+    else:
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        SolveService(args.engines, args.workers, args.cores).serve(address)
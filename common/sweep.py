@@ -0,0 +1,116 @@
+import sys
+import argparse
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]  # repository root
+sys.path.append(str(ROOT))
+from common.runner import run_instances
+from common.instances import instance_name
+from common.engines import ENGINES, solution_path
+from common.results import RESULTS_DB, TIME_LIMIT, connect, run_fields, run_key, lookup, solved, start_run, finish_run, sweep_task
+
+
+# SWEEP ORCHESTRATOR
+# The configurations of an instance (engine, symmetry breaking, rotation) share the same optimal height,
+# and the layouts without rotation are valid layouts with rotation. Instead of solving every configuration
+# from scratch, the configurations of an instance are run one after the other and each one starts from the
+# best layout found so far: its height bounds the height of the plate of every engine and the layout is
+# the initial incumbent of MIP. The configurations without rotation are run first, so that their best
+# layout bounds the ones with rotation. As soon as a configuration proves the optimality of a height (or
+# its lower bound meets the best height of another one), the other configurations with the same rotation
+# are skipped, or only confirm the optimal height with -cf. The runs are kept in the results store
+# (common/results.py), hence the configurations already solved are not run again.
+# bb has no symmetry breaking and MIP writes the same out file with or without it, hence they run once per
+# rotation; MIP is run instead with each setting of the symmetry detection of Gurobi.
+
+MIP_SYMMETRY = [-1, 0, 2]   # Symmetry parameter of Gurobi: auto, off, aggressive
+
+
+# layout of an out file as (h, x_coord, y_coord, widths, lengths), the start taken by run_engine
+def parse_solution(text):
+    lines = text.split('\n')
+    h = int(lines[0].split()[1])
+    circuits = [[int(v) for v in line.split()] for line in lines[2:2 + int(lines[1])]]
+    widths, lengths, x_coord, y_coord = (list(values) for values in zip(*circuits))
+    return h, x_coord, y_coord, widths, lengths
+
+
+# (sym_break, Gurobi symmetry) of the configurations of the engine
+def engine_configs(engine, sym_breaks, symmetries):
+    if engine == 'mip':
+        return [(sorted(sym_breaks)[0], symmetry) for symmetry in symmetries]
+    elif engine == 'bb':
+        return [(sorted(sym_breaks)[0], None)]
+    return [(sym_break, None) for sym_break in sym_breaks]
+
+
+# run (or read from the store) every configuration of the instance
+#
+# returns, for each rotation, the best height found and whether it is optimal
+def sweep_instance(conn, instance, engines, sym_breaks=(False, True), rotations=(False, True), confirm=False, retry=False, cores=None, symmetries=MIP_SYMMETRY):
+    best = None     # best layout found, valid for the configurations with rotation too
+    summary = {}
+    for rotation in sorted(rotations):
+        lower, optimal = 0, False
+        for engine in engines:
+            for sym_break, symmetry in engine_configs(engine, sym_breaks, symmetries):
+                config = f"Engine: {engine}\tInstance: {instance_name(instance)}\tsym_break: {sym_break}\trotation: {rotation}"
+                if symmetry is not None:
+                    config += f'\tsymmetry: {symmetry}'
+                fields = run_fields(instance, engine, sym_break, rotation, best[0] if best else None, symmetry)
+                key = run_key(fields)
+                row = lookup(conn, key)
+
+                if solved(row, retry):
+                    result = dict(row)
+                    print(f"{config}\theight: {row['h']}{'' if row['optimal'] else ' (not optimal)'}\t(stored)")
+                elif optimal and not confirm:
+                    print(f'{config}\tskipped: height {best[0]} already optimal')
+                    continue
+                else:
+                    # the best layout so far bounds the height and starts the engine
+                    kwargs = {'sym_break': sym_break, 'rotation': rotation, 'h_ub': fields.get('h_ub'), 'start': best, 'symmetry': -1 if symmetry is None else symmetry}
+                    start_run(conn, key, instance, fields)
+                    (_, result, error), = run_instances(sweep_task, [(engine, instance)], kwargs, jobs=1, cores=cores, timeout=TIME_LIMIT + 30)
+                    finish_run(conn, key, result, error, solution_path(engine, instance, sym_break, rotation))
+                    if error is not None:
+                        print(f'{config}\t{error}')
+                        continue
+                    result['solution'] = lookup(conn, key)['solution']
+                    print(f"{config}\theight: {result['h']}{'' if result['optimal'] else ' (not optimal)'}\ttime: {result['time']:.03f}s"
+                          f"\tbound: {kwargs['h_ub']}")
+
+                if result['h'] is not None and (best is None or result['h'] < best[0]):
+                    best = parse_solution(result['solution'])
+                lower = max(lower, result['lower'] or 0)
+                # optimal either when the configuration proved it, or when its lower bound meets the best height
+                optimal = optimal or bool(result['optimal']) or (best is not None and lower >= best[0])
+        summary[rotation] = (best[0] if best else None, optimal)
+        print(f"Instance: {instance_name(instance)}\trotation: {rotation}\tBest objective value: {best[0] if best else None}{'' if optimal else ' (not optimal)'}")
+    return summary
+
+
+def sweep(instances, engines, sym_breaks=(False, True), rotations=(False, True), db_path=RESULTS_DB, confirm=False, retry=False, cores=None, symmetries=MIP_SYMMETRY):
+    conn = connect(db_path)
+    for instance in instances:
+        sweep_instance(conn, instance if isinstance(instance, int) else Path(instance).resolve(), engines, sym_breaks, rotations, confirm, retry, cores, symmetries)
+    conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-f', '--first', help='Number of first instance', type=int, default=1)
+    parser.add_argument('-l', '--last', help='Number of last instance', type=int, default=40)
+    parser.add_argument('-i', '--instances', help='Instance files (instead of the numbered instances)', nargs='+', default=None)
+    parser.add_argument('-e', '--engines', help='Engines to run, in this order', nargs='+', default=ENGINES, choices=ENGINES)
+    parser.add_argument('-sb', '--sym_break', help='Symmetry breaking settings to run', nargs='+', type=int, default=[0, 1], choices=[0, 1])
+    parser.add_argument('-r', '--rotation', help='Rotation settings to run', nargs='+', type=int, default=[0, 1], choices=[0, 1])
+    parser.add_argument('-sy', '--symmetry', help='Symmetry settings of Gurobi run by MIP', nargs='+', type=int, default=MIP_SYMMETRY, choices=[-1, 0, 1, 2])
+    parser.add_argument('-cf', '--confirm', help='Run the remaining configurations once the optimal height is known', action='store_true')
+    parser.add_argument('-rt', '--retry', help='Run again the stored runs that reached the time limit', action='store_true')
+    parser.add_argument('-c', '--cores', help='Number of cores given to each run', type=int, default=None)
+    parser.add_argument('-db', '--database', help='SQLite file of the results', type=str, default=str(RESULTS_DB))
+    args = parser.parse_args()
+
+    instances = args.instances or range(args.first, args.last+1)
+    sweep(instances, args.engines, [bool(v) for v in args.sym_break], [bool(v) for v in args.rotation], args.database, args.confirm, args.retry, args.cores, args.symmetry)
@@ -0,0 +1,162 @@
+import sys
+import json
+import argparse
+import multiprocessing as mp
+from pathlib import Path
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]  # repository root
+sys.path.append(str(ROOT))
+from common.instances import INSTANCES_DIR, load_instance
+from common.plot import read_solution
+
+
+# SOLUTION VALIDATOR
+# The plots only paint the circuits on a board, where overlapping circuits silently cover each other. The
+# validator reads each out file together with its instance and checks the width of the plate and the number
+# of circuits, the dimensions of each circuit (swapped only with rotation), that every circuit lies inside
+# the plate of the given height, that the height is the top of the layout, and that no two circuits overlap.
+# The overlaps are found by NumPy broadcasting over blocks of circuits, without a loop over the pairs. In
+# batch mode the out files are validated in parallel and their heights can be compared with a baseline.
+
+BASELINE = ROOT / 'common' / 'baseline.json'    # heights of the out files of the repository
+OUT_DIRS = [ROOT / 'CP' / 'out', ROOT / 'SMT' / 'out', ROOT / 'MIP' / 'out', ROOT / 'BB' / 'out']
+BLOCK = 1024        # circuits compared with all the other ones at once
+MAX_REPORTED = 5    # overlapping pairs reported for each file
+
+
+# pairs i < j of overlapping circuits, at most limit of them
+def overlapping_pairs(x, y, x_coord, y_coord, limit=MAX_REPORTED):
+    n = len(x)
+    x_end, y_end = x_coord + x, y_coord + y
+    pairs = []
+    for a in range(0, n, BLOCK):
+        b = min(a + BLOCK, n)
+        overlap = ((x_coord[a:b, None] < x_end[None, :]) & (x_coord[None, :] < x_end[a:b, None]) &
+                   (y_coord[a:b, None] < y_end[None, :]) & (y_coord[None, :] < y_end[a:b, None]))
+        overlap &= np.arange(a, b)[:, None] < np.arange(n)[None, :]
+        i, j = np.nonzero(overlap)
+        pairs += list(zip((i + a).tolist(), j.tolist()))
+        if len(pairs) >= limit:
+            break
+    return pairs[:limit]
+
+
+# plate_w, dims: the instance; w, h, n, x, y, x_coord, y_coord: the solution (see common/plot.py)
+#
+# returns the list of the errors found, empty when the layout is valid
+def check_layout(plate_w, dims, rotation, w, h, n, x, y, x_coord, y_coord):
+    if w != plate_w:
+        return [f'plate width {w}, expected {plate_w}']
+    if n != len(dims):
+        return [f'{n} circuits, expected {len(dims)}']
+
+    errors = []
+    # each circuit keeps its dimensions, or swaps them when rotated
+    straight = (x == dims[:, 0]) & (y == dims[:, 1])
+    swapped = (x == dims[:, 1]) & (y == dims[:, 0])
+    for i in np.flatnonzero(~(straight | (swapped if rotation else False))).tolist():
+        errors.append(f'circuit {i} is {x[i]}x{y[i]}, expected {dims[i, 0]}x{dims[i, 1]}{" or rotated" if rotation else ""}')
+
+    outside = (x_coord < 0) | (y_coord < 0) | (x_coord + x > w) | (y_coord + y > h)
+    for i in np.flatnonzero(outside).tolist():
+        errors.append(f'circuit {i} at ({x_coord[i]}, {y_coord[i]}) is outside the plate {w}x{h}')
+
+    top = int((y_coord + y).max()) if n else 0
+    if top != h:
+        errors.append(f'height {h}, but the layout reaches {top}')
+
+    for i, j in overlapping_pairs(x, y, x_coord, y_coord):
+        errors.append(f'circuits {i} and {j} overlap')
+    return errors
+
+
+# instance of an out file: out-<name>[_rotation].txt solves the instance <name> of the repository, or the
+# instance file ins-<name>.txt of one of the given folders
+def find_instance(out_path, instance_dirs=()):
+    name = Path(out_path).stem[len('out-'):]
+    rotation = name.endswith('_rotation')
+    name = name[:-len('_rotation')] if rotation else name
+    for folder in [INSTANCES_DIR, *map(Path, instance_dirs)]:
+        if (folder / f'ins-{name}.txt').exists():
+            return int(name) if folder == INSTANCES_DIR and name.isdigit() else folder / f'ins-{name}.txt', rotation
+    return None, rotation
+
+
+# returns the height of the solution and the errors found in the out file
+def validate(out_path, instance_dirs=()):
+    instance, rotation = find_instance(out_path, instance_dirs)
+    if instance is None:
+        return None, ['instance not found']
+    try:
+        w, h, n, x, y, x_coord, y_coord = read_solution(out_path)
+    except ValueError as e:     # truncated or malformed file
+        return None, [f'unreadable: {e}']
+    plate_w, _, dims = load_instance(instance)
+    return h, check_layout(plate_w, dims, rotation, w, h, n, x, y, x_coord, y_coord)
+
+
+def validate_task(out_path, instance_dirs):
+    return (str(out_path), *validate(out_path, instance_dirs))
+
+
+# BATCH MODE
+# validate every out-*.txt file of the folders (and of their subfolders)
+#
+# returns {out file: (height, errors)}
+def batch_validate(out_dirs=OUT_DIRS, instance_dirs=(), jobs=None):
+    tasks = [(out_path, tuple(instance_dirs)) for out_dir in map(Path, out_dirs) for out_path in sorted(out_dir.rglob('out-*.txt'))]
+    with mp.Pool(jobs) as pool:
+        return {out_path: (h, errors) for out_path, h, errors in pool.starmap(validate_task, tasks, chunksize=16)}
+
+
+# the out files are named relative to the repository in the baseline, so that it can be moved
+def baseline_name(out_path):
+    out_path = Path(out_path).resolve()
+    return out_path.relative_to(ROOT).as_posix() if out_path.is_relative_to(ROOT) else str(out_path)
+
+
+def save_baseline(results, baseline_path):
+    with open(baseline_path, 'w') as f:
+        json.dump({baseline_name(out_path): h for out_path, (h, errors) in results.items() if not errors}, f, indent=1, sort_keys=True)
+
+
+# a file is a regression when its height got worse than in the baseline, when it is no longer valid, or when it
+# is missing (height None); only the files of the baseline under the folders validated are expected
+def regressions(results, baseline_path, out_dirs=OUT_DIRS):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    found = []
+    for out_path, (h, errors) in results.items():
+        old = baseline.pop(baseline_name(out_path), None)
+        if old is not None and (errors or h > old):
+            found.append((out_path, h, old))
+    folders = [baseline_name(out_dir) + '/' for out_dir in out_dirs]
+    found += [(name, None, old) for name, old in sorted(baseline.items()) if any(name.startswith(folder) for folder in folders)]
+    return found
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('out_dirs', help='Folders of the solutions (default: the out folders of every paradigm)', nargs='*', default=OUT_DIRS)
+    parser.add_argument('-i', '--instances', help='Folders of instance files other than the instances of the repository', nargs='+', default=[])
+    parser.add_argument('-j', '--jobs', help='Number of files validated in parallel (default: all the cores)', type=int, default=None)
+    parser.add_argument('-b', '--baseline', help=f'Baseline of the heights to compare with (the one of the repository: {BASELINE.relative_to(ROOT)})', type=str, default=None)
+    parser.add_argument('-s', '--save', help='Write the heights of the valid files as a new baseline', type=str, default=None)
+    args = parser.parse_args()
+
+    results = batch_validate(args.out_dirs, args.instances, args.jobs)
+    invalid = {out_path: errors for out_path, (h, errors) in results.items() if errors}
+    for out_path, errors in invalid.items():
+        print(f'INVALID\t{out_path}\t' + '; '.join(errors))
+    print(f'{len(results)} files, {len(invalid)} invalid')
+
+    found = regressions(results, args.baseline, args.out_dirs) if args.baseline is not None else []
+    for out_path, h, old in found:
+        print(f'REGRESSION\t{out_path}\t' + (f'height: {h} (was {old})' if h is not None else f'missing (height was {old})'))
+
+    if args.save is not None:
+        save_baseline(results, args.save)
+
+    sys.exit(1 if invalid or found else 0)     # usable as a gate